@@ -0,0 +1,350 @@
+import csv
+import logging
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the tabular knowledge base files
+ANALYTICS_DATA_DIR = os.environ.get('ANALYTICS_DATA_DIR', 'knowledgebase')
+# Upper bound on the rows or groups a single query may return
+ANALYTICS_MAX_ROWS = int(os.environ.get('ANALYTICS_MAX_ROWS', '50'))
+
+# Tables exposed to the query API: name -> (file below ANALYTICS_DATA_DIR, description)
+ANALYTICS_TABLES = {
+    "orders": ("archive-4/b2b_orders.csv",
+               "B2B orders with order totals, customers, city, province and order source"),
+    "customers": ("archive-3/b2b_ict_customer_dataset.csv",
+                  "ICT customers with industry, company size, total spend, satisfaction and churn risk"),
+    "stock": ("archive-2/Sale Report.csv",
+              "Stock level per SKU with category, size and colour"),
+    "international_sales": ("archive-2/International sale Report.csv",
+                            "International sales per customer, style and SKU with pieces, rate and gross amount"),
+    "product_prices": ("archive-2/May-2022.csv",
+                       "Product catalogue with transfer price and MRP per marketplace"),
+}
+
+# A column is numeric when at least this share of its non-empty values parse as numbers
+NUMERIC_THRESHOLD = 0.9
+
+FILTER_OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "in", "contains")
+AGGREGATES = ("count", "sum", "avg", "min", "max", "median", "count_distinct")
+
+
+class QueryError(ValueError):
+    """The query refers to unknown tables or columns or is otherwise invalid."""
+
+
+def _to_number(value: str) -> float:
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return math.nan
+
+
+class Column:
+    """A numeric (float64, NaN for missing) or dictionary-encoded text column."""
+
+    def __init__(self, name: str, values: Sequence[str]):
+        self.name = name
+        present = [v for v in values if v != ""]
+        # Cheap check on a sample first, so text columns are not parsed in full
+        sample = [_to_number(v) for v in present[:100]]
+        self.numeric = bool(present) and sum(not math.isnan(x) for x in sample) >= NUMERIC_THRESHOLD * len(sample)
+        if self.numeric:
+            numbers = np.array([_to_number(v) for v in values], dtype=np.float64)
+            parsed = int(np.count_nonzero(~np.isnan(numbers)))
+            self.numeric = parsed >= NUMERIC_THRESHOLD * len(present)
+        if self.numeric:
+            self.values = numbers
+            self.categories: List[str] = []
+            self.codes = None
+        else:
+            categories, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+            self.categories = [str(c) for c in categories]
+            self.codes = codes.astype(np.int32)
+            self.values = None
+            self._lookup = {category.lower(): i for i, category in enumerate(self.categories)}
+
+    @property
+    def kind(self) -> str:
+        return "number" if self.numeric else "text"
+
+    def code_of(self, value: Any) -> int:
+        """Code of a text value (case-insensitive), or -1 when it never occurs."""
+        return self._lookup.get(str(value).strip().lower(), -1)
+
+    def value_at(self, index: int) -> Any:
+        if self.numeric:
+            value = float(self.values[index])
+            return None if math.isnan(value) else value
+        return self.categories[self.codes[index]]
+
+    def describe(self, max_values: int = 8) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"name": self.name, "type": self.kind}
+        if not self.numeric and len(self.categories) <= max_values:
+            info["values"] = [c for c in self.categories if c]
+        return info
+
+
+class Table:
+    def __init__(self, name: str, description: str, columns: List[Column]):
+        self.name = name
+        self.description = description
+        self.columns = {column.name: column for column in columns}
+        self._by_lower = {column.name.lower(): column for column in columns}
+        self.rows = len(columns[0].codes if not columns[0].numeric else columns[0].values) if columns else 0
+
+    def column(self, name: str) -> Column:
+        column = self.columns.get(name) or self._by_lower.get(str(name).strip().lower())
+        if column is None:
+            raise QueryError(f"Unknown column {name!r} in table {self.name}")
+        return column
+
+    def describe(self) -> Dict[str, Any]:
+        return {"table": self.name, "description": self.description, "rows": self.rows,
+                "columns": [column.describe() for column in self.columns.values()]}
+
+
+def load_csv_table(name: str, path: str, description: str = "") -> Table:
+    """Read a CSV file into a columnar table."""
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = [row for row in reader if any(cell.strip() for cell in row)]
+    columns = []
+    for i, column_name in enumerate(header):
+        values = [row[i].strip() if i < len(row) else "" for row in rows]
+        columns.append(Column(column_name.strip() or f"column_{i + 1}", values))
+    return Table(name, description, columns)
+
+
+def _query_list(query: Dict[str, Any], key: str, item_type: type) -> List[Any]:
+    """The list under `key`, checking that every element has the expected type."""
+    items = query.get(key) or []
+    if not isinstance(items, list):
+        raise QueryError(f"'{key}' must be a list")
+    for item in items:
+        if not isinstance(item, item_type):
+            expected = "an object" if item_type is dict else "a column name"
+            raise QueryError(f"Every element of '{key}' must be {expected}, got {item!r}")
+    return items
+
+
+def _query_limit(query: Dict[str, Any]) -> int:
+    limit = query.get("limit")
+    if limit is None:
+        return ANALYTICS_MAX_ROWS
+    if isinstance(limit, bool) or not isinstance(limit, int):
+        raise QueryError(f"'limit' must be an integer, got {limit!r}")
+    return max(1, min(limit, ANALYTICS_MAX_ROWS))
+
+
+def _filter_mask(table: Table, filters: Sequence[Dict[str, Any]]) -> np.ndarray:
+    mask = np.ones(table.rows, dtype=bool)
+    for condition in filters:
+        column = table.column(condition.get("column"))
+        op = condition.get("op", "eq")
+        value = condition.get("value")
+        if op not in FILTER_OPERATORS:
+            raise QueryError(f"Unknown filter operator {op!r}; use one of {', '.join(FILTER_OPERATORS)}")
+        # A string would otherwise be matched character by character
+        if op == "in" and not isinstance(value, (list, tuple)):
+            raise QueryError("'in' needs a list of values")
+
+        if column.numeric:
+            if op == "contains":
+                raise QueryError(f"'contains' needs a text column, {column.name} is numeric")
+            try:
+                targets = [float(v) for v in value] if op == "in" else float(value)
+            except (TypeError, ValueError):
+                raise QueryError(f"Column {column.name} is numeric; {value!r} is not a number")
+            data = column.values
+            if op == "in":
+                mask &= np.isin(data, targets)
+            else:
+                mask &= {"eq": data == targets, "ne": data != targets, "lt": data < targets,
+                         "le": data <= targets, "gt": data > targets, "ge": data >= targets}[op]
+            continue
+
+        if op == "contains":
+            needle = str(value).lower()
+            matching = [i for i, category in enumerate(column.categories) if needle in category.lower()]
+            mask &= np.isin(column.codes, matching)
+        elif op in ("eq", "ne", "in"):
+            values = value if op == "in" else [value]
+            codes = [column.code_of(v) for v in values]
+            selected = np.isin(column.codes, [c for c in codes if c >= 0])
+            mask &= ~selected if op == "ne" else selected
+        else:
+            # Ordering comparisons on text compare lexically (e.g. ISO dates)
+            categories = np.array(column.categories, dtype=object)
+            target = str(value)
+            ok = {"lt": categories < target, "le": categories <= target,
+                  "gt": categories > target, "ge": categories >= target}[op]
+            mask &= ok[column.codes]
+    return mask
+
+
+def _aggregate(function: str, column: Optional[Column], rows: np.ndarray,
+               groups: np.ndarray, group_count: int) -> List[Any]:
+    """Aggregate `column` over the selected `rows`, split by group index."""
+    if function == "count" and column is None:
+        return np.bincount(groups, minlength=group_count).tolist()
+    if column is None:
+        raise QueryError(f"Aggregate {function} needs a column")
+
+    if function == "count_distinct":
+        keys = column.values[rows] if column.numeric else column.codes[rows]
+        pairs = np.unique(np.stack([groups, np.nan_to_num(keys, nan=-1.0) if column.numeric else keys]), axis=1)
+        return np.bincount(pairs[0].astype(np.int64), minlength=group_count).tolist()
+    if function == "count":
+        if column.numeric:
+            valid = ~np.isnan(column.values[rows])
+        else:
+            valid = column.codes[rows] != column.code_of("")
+        return np.bincount(groups[valid], minlength=group_count).tolist()
+    if not column.numeric:
+        raise QueryError(f"Aggregate {function} needs a numeric column, {column.name} is text")
+
+    data = column.values[rows]
+    valid = ~np.isnan(data)
+    data, groups = data[valid], groups[valid]
+    counts = np.bincount(groups, minlength=group_count)
+    if function in ("sum", "avg"):
+        sums = np.bincount(groups, weights=data, minlength=group_count)
+        if function == "sum":
+            return sums.tolist()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return [None if n == 0 else float(v) for v, n in zip(sums / counts, counts)]
+    if function in ("min", "max"):
+        result = np.full(group_count, np.inf if function == "min" else -np.inf)
+        (np.minimum if function == "min" else np.maximum).at(result, groups, data)
+        return [None if n == 0 else float(v) for v, n in zip(result, counts)]
+    if function == "median":
+        order = np.lexsort((data, groups))
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        ordered = data[order]
+        return [None if counts[g] == 0 else float(np.median(ordered[bounds[g]:bounds[g + 1]]))
+                for g in range(group_count)]
+    raise QueryError(f"Unknown aggregate {function!r}; use one of {', '.join(AGGREGATES)}")
+
+
+class AnalyticsStore:
+    """In-memory columnar store with a small filter / group-by / aggregate query API.
+
+    Queries are plain dicts (no expressions are evaluated), so they can be
+    taken directly from an LLM tool call:
+
+        {"table": "orders",
+         "filters": [{"column": "Province", "op": "eq", "value": "WA"}],
+         "group_by": ["OrderSource"],
+         "aggregates": [{"function": "avg", "column": "OrderTotal"}],
+         "order_by": "avg_OrderTotal", "descending": true, "limit": 10}
+    """
+
+    def __init__(self, data_dir: str = ANALYTICS_DATA_DIR, tables: Dict[str, Tuple[str, str]] = ANALYTICS_TABLES):
+        self.data_dir = data_dir
+        self.table_files = tables
+        self._tables: Optional[Dict[str, Table]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tables(self) -> Dict[str, Table]:
+        return self.load()
+
+    def load(self) -> Dict[str, Table]:
+        """Load the tables on first use (or ahead of time, from a background thread)."""
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._tables = self._load()
+        return self._tables
+
+    def _load(self) -> Dict[str, Table]:
+        tables = {}
+        for name, (filename, description) in self.table_files.items():
+            path = os.path.join(self.data_dir, filename)
+            if not os.path.exists(path):
+                logger.warning(f"Analytics table {name} skipped: {path} not found")
+                continue
+            try:
+                tables[name] = load_csv_table(name, path, description)
+            except Exception as e:
+                logger.error(f"Error loading analytics table {name}: {str(e)}")
+        logger.info(f"Loaded {len(tables)} analytics tables from {self.data_dir}")
+        return tables
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [table.describe() for table in self.tables.values()]
+
+    def query(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a query and return its column names and result rows."""
+        if not isinstance(query, dict):
+            raise QueryError("The query must be an object")
+        table = self.tables.get(query.get("table"))
+        if table is None:
+            raise QueryError(f"Unknown table {query.get('table')!r}; available: {', '.join(self.tables)}")
+        limit = _query_limit(query)
+
+        rows = np.flatnonzero(_filter_mask(table, _query_list(query, "filters", dict)))
+        group_columns = [table.column(name) for name in _query_list(query, "group_by", str)]
+        aggregates = _query_list(query, "aggregates", dict)
+
+        if not aggregates:
+            # Plain row selection
+            columns = [table.column(name) for name in _query_list(query, "columns", str) or list(table.columns)[:10]]
+            result_rows = [[column.value_at(i) for column in columns] for i in rows[:limit]]
+            return {"columns": [c.name for c in columns], "rows": result_rows,
+                    "matched_rows": int(len(rows)), "truncated": len(rows) > limit}
+
+        if group_columns:
+            # Rows without a value in a numeric group column are left out
+            for column in group_columns:
+                if column.numeric:
+                    rows = rows[~np.isnan(column.values[rows])]
+            keys = np.stack([c.values[rows] if c.numeric else c.codes[rows].astype(np.float64)
+                             for c in group_columns], axis=1)
+            unique_keys, groups = np.unique(keys, axis=0, return_inverse=True)
+            groups = groups.reshape(-1)
+            _, first_index = np.unique(groups, return_index=True)
+            first_rows = list(rows[first_index])
+        else:
+            groups = np.zeros(len(rows), dtype=np.int64)
+            first_rows = [None]
+        group_count = len(first_rows)
+
+        names = [c.name for c in group_columns]
+        results = []
+        for aggregate in aggregates:
+            function = aggregate.get("function")
+            if function not in AGGREGATES:
+                raise QueryError(f"Unknown aggregate {function!r}; use one of {', '.join(AGGREGATES)}")
+            column = table.column(aggregate["column"]) if aggregate.get("column") else None
+            names.append(f"{function}_{column.name}" if column else function)
+            results.append(_aggregate(function, column, rows, groups, group_count))
+
+        result_rows = []
+        for g, first in enumerate(first_rows):
+            key = [column.value_at(first) for column in group_columns] if first is not None else []
+            result_rows.append(key + [values[g] for values in results])
+
+        order_by = query.get("order_by")
+        if order_by is not None:
+            if order_by not in names:
+                raise QueryError(f"Cannot order by {order_by!r}; result columns are {', '.join(names)}")
+            index = names.index(order_by)
+            present = [row for row in result_rows if row[index] is not None]
+            missing = [row for row in result_rows if row[index] is None]
+            present.sort(key=lambda row: row[index], reverse=bool(query.get("descending")))
+            result_rows = present + missing
+        return {"columns": names, "rows": result_rows[:limit], "matched_rows": int(len(rows)),
+                "truncated": len(result_rows) > limit}
+
+
+# Shared store over the knowledge base tables
+analytics_store = AnalyticsStore()
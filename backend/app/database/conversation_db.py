@@ -1,33 +1,239 @@
+import heapq
 import logging
-from typing import Dict, List, Optional, Any
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 import json
 from datetime import datetime
 
-from ..models.models import Conversation, ChatMessage
+from ..models.models import Conversation, ChatMessage, ConversationState
+from .group_commit import GroupCommitWriter
 
 logger = logging.getLogger(__name__)
 
+# SQLite file shared by all worker processes; empty keeps conversations in process memory
+CONVERSATION_DB_PATH = os.environ.get('CONVERSATION_DB_PATH', '')
+
+# Conversations read per query when iterating over the whole store
+CONVERSATION_SCAN_BATCH = int(os.environ.get('CONVERSATION_SCAN_BATCH', '200'))
+# Logged messages after which a conversation's snapshot is rewritten with them folded in
+CONVERSATION_LOG_COMPACT_RECORDS = int(os.environ.get('CONVERSATION_LOG_COMPACT_RECORDS', '50'))
+# How often the writer looks for conversations to compact
+CONVERSATION_LOG_COMPACT_INTERVAL_SECONDS = float(os.environ.get('CONVERSATION_LOG_COMPACT_INTERVAL_SECONDS', '30'))
+# Conversations compacted per pass, so a pass never holds up writes for long
+CONVERSATION_LOG_COMPACT_BATCH = int(os.environ.get('CONVERSATION_LOG_COMPACT_BATCH', '100'))
+
 # In-memory storage for development/demo
 # In a real application, this would use a persistent database
 conversations_db = {}
 
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+# Each conversation is stored as a snapshot (`data`) plus the messages appended since,
+# one row each in `conversation_log`. The columns of `conversations` hold the current
+# header fields; the ones inside the snapshot are only as recent as its last compaction.
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS conversations (
+           id TEXT PRIMARY KEY,
+           client_id TEXT,
+           updated_at TEXT NOT NULL,
+           data TEXT NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_client ON conversations (client_id, updated_at)",
+    """CREATE TABLE IF NOT EXISTS conversation_log (
+           seq INTEGER PRIMARY KEY,
+           conversation_id TEXT NOT NULL,
+           record TEXT NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_conversation_log_conversation ON conversation_log (conversation_id, seq)",
+)
+# Columns added to stores created before the message log
+_LOG_COLUMNS = {"state": "TEXT", "language": "TEXT", "log_records": "INTEGER NOT NULL DEFAULT 0"}
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    os.makedirs(os.path.dirname(CONVERSATION_DB_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(CONVERSATION_DB_PATH, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+                for name, definition in _LOG_COLUMNS.items():
+                    if name not in columns:
+                        try:
+                            conn.execute(f"ALTER TABLE conversations ADD COLUMN {name} {definition}")
+                        except sqlite3.OperationalError as e:
+                            # Another worker process added it first
+                            if "duplicate column" not in str(e):
+                                raise
+                conn.execute(
+                    "UPDATE conversations SET state = json_extract(data, '$.state'), "
+                    "language = json_extract(data, '$.language') WHERE language IS NULL"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_conversations_log_records ON conversations (log_records)"
+                )
+                conn.commit()
+                _schema_ready = True
+    return conn
+
+def _get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the shared conversation store, for reads."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+def _connect_writer() -> sqlite3.Connection:
+    conn = _connect()
+    # Commits are grouped, so each can afford to be flushed to disk
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+def _compact_due(conn: sqlite3.Connection) -> None:
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM conversations WHERE log_records >= ? LIMIT ?",
+        (CONVERSATION_LOG_COMPACT_RECORDS, CONVERSATION_LOG_COMPACT_BATCH)
+    )]
+    for conversation_id in ids:
+        conn.execute("BEGIN IMMEDIATE")
+        _compact(conn, conversation_id)
+        conn.execute("COMMIT")
+    if ids:
+        logger.info(f"Compacted the message log of {len(ids)} conversations")
+
+# Every write of this process goes through one connection, group-committed
+_writer = GroupCommitWriter("conversation_log", _connect_writer, maintenance=_compact_due,
+                            maintenance_interval=CONVERSATION_LOG_COMPACT_INTERVAL_SECONDS)
+
+def _message_record(message: ChatMessage) -> str:
+    return message.model_dump_json()
+
+def _header_params(conversation: Conversation) -> tuple:
+    return (conversation.updated_at.isoformat(),
+            conversation.state.value if conversation.state else None,
+            conversation.language)
+
+def _read_conversations(conn: sqlite3.Connection, where: str, params: List[Any]) -> List[Conversation]:
+    """Conversations matching `where`, with their logged messages replayed onto the snapshots."""
+    # One read transaction, so a compaction cannot move messages between the two queries
+    in_transaction = conn.in_transaction
+    if not in_transaction:
+        conn.execute("BEGIN")
+    try:
+        rows = conn.execute(
+            f"SELECT id, data, updated_at, state, language, log_records FROM conversations {where}", params
+        ).fetchall()
+        logged = [row[0] for row in rows if row[5]]
+        records: Dict[str, List[str]] = {}
+        for start in range(0, len(logged), 500):
+            chunk = logged[start:start + 500]
+            for conversation_id, record in conn.execute(
+                f"SELECT conversation_id, record FROM conversation_log "
+                f"WHERE conversation_id IN ({','.join('?' * len(chunk))}) ORDER BY seq", chunk
+            ):
+                records.setdefault(conversation_id, []).append(record)
+    finally:
+        if not in_transaction:
+            conn.execute("COMMIT")
+    conversations = []
+    for conversation_id, data, updated_at, state, language, _ in rows:
+        conversation = Conversation.model_validate_json(data)
+        conversation.updated_at = datetime.fromisoformat(updated_at)
+        if language is not None:
+            conversation.state = ConversationState(state) if state else None
+            conversation.language = language
+        conversation.messages.extend(ChatMessage.model_validate_json(record)
+                                     for record in records.get(conversation_id, ()))
+        conversations.append(conversation)
+    return conversations
+
+def _compact(conn: sqlite3.Connection, conversation_id: str) -> None:
+    """Fold a conversation's logged messages into its snapshot (inside a write transaction)."""
+    conversations = _read_conversations(conn, "WHERE id = ?", [conversation_id])
+    if not conversations:
+        conn.execute("DELETE FROM conversation_log WHERE conversation_id = ?", (conversation_id,))
+        return
+    _write_snapshot(conn, conversations[0])
+
+def _write_snapshot(conn: sqlite3.Connection, conversation: Conversation) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO conversations "
+        "(id, client_id, updated_at, state, language, log_records, data) VALUES (?, ?, ?, ?, ?, 0, ?)",
+        (conversation.id, conversation.client_id, *_header_params(conversation),
+         conversation.model_dump_json())
+    )
+    conn.execute("DELETE FROM conversation_log WHERE conversation_id = ?", (conversation.id,))
+
+def _append(conn: sqlite3.Connection, conversation: Conversation, messages: List[ChatMessage]) -> None:
+    # New conversations start with an empty snapshot; their messages go to the log like any others
+    header = conversation.model_copy(update={"messages": []})
+    conn.execute(
+        "INSERT INTO conversations (id, client_id, updated_at, state, language, log_records, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET client_id = excluded.client_id, updated_at = excluded.updated_at, "
+        "state = excluded.state, language = excluded.language, "
+        "log_records = conversations.log_records + excluded.log_records",
+        (conversation.id, conversation.client_id, *_header_params(conversation), len(messages),
+         header.model_dump_json())
+    )
+    conn.executemany(
+        "INSERT INTO conversation_log (conversation_id, record) VALUES (?, ?)",
+        [(conversation.id, _message_record(message)) for message in messages]
+    )
+
 def save_conversation(conversation: Conversation) -> None:
-    """Save a conversation to the database."""
+    """Save a whole conversation to the database, replacing what is stored.
+
+    Turns that only add messages should use `append_messages`, whose cost does
+    not grow with the length of the conversation.
+    """
     try:
-        # In a real application, this would interact with a database
-        # For demonstration, we'll use in-memory storage
-        conversations_db[conversation.id] = conversation
+        if CONVERSATION_DB_PATH:
+            _writer.submit(lambda conn: _write_snapshot(conn, conversation))
+        else:
+            # For demonstration, we'll use in-memory storage
+            conversations_db[conversation.id] = conversation
         logger.info(f"Saved conversation {conversation.id}")
     except Exception as e:
         logger.error(f"Error saving conversation: {str(e)}")
         raise
 
+def append_messages(conversation: Conversation, messages: List[ChatMessage]) -> None:
+    """Persist the messages just appended to `conversation`, and its header fields.
+
+    Each message is written as one record to the conversation's log, group
+    committed with the writes of concurrent turns; the log is folded into the
+    snapshot in the background every `CONVERSATION_LOG_COMPACT_RECORDS` messages.
+    """
+    try:
+        if CONVERSATION_DB_PATH:
+            _writer.submit(lambda conn: _append(conn, conversation, messages))
+        else:
+            # For demonstration, we'll use in-memory storage
+            conversations_db[conversation.id] = conversation
+        logger.info(f"Appended {len(messages)} messages to conversation {conversation.id}")
+    except Exception as e:
+        logger.error(f"Error appending to conversation: {str(e)}")
+        raise
+
 def get_conversation(conversation_id: str) -> Optional[Conversation]:
     """Get a conversation from the database by ID."""
     try:
-        # In a real application, this would interact with a database
-        # For demonstration, we'll use in-memory storage
-        conversation = conversations_db.get(conversation_id)
+        if CONVERSATION_DB_PATH:
+            found = _read_conversations(_get_connection(), "WHERE id = ?", [conversation_id])
+            conversation = found[0] if found else None
+        else:
+            # For demonstration, we'll use in-memory storage
+            conversation = conversations_db.get(conversation_id)
         if conversation:
             logger.info(f"Retrieved conversation {conversation_id}")
         else:
@@ -40,7 +246,16 @@ def get_conversation(conversation_id: str) -> Optional[Conversation]:
 def list_conversations(client_id: Optional[str] = None, limit: int = 100) -> List[Conversation]:
     """List conversations, optionally filtered by client ID."""
     try:
-        # In a real application, this would interact with a database
+        if CONVERSATION_DB_PATH:
+            query = ""
+            params: List[Any] = []
+            if client_id:
+                query += "WHERE client_id = ?"
+                params.append(client_id)
+            query += " ORDER BY updated_at DESC LIMIT ?"
+            params.append(limit)
+            return _read_conversations(_get_connection(), query, params)
+        
         # For demonstration, we'll use in-memory storage
         if client_id:
             result = [conv for conv in conversations_db.values() if conv.client_id == client_id]
@@ -54,13 +269,80 @@ def list_conversations(client_id: Optional[str] = None, limit: int = 100) -> Lis
         logger.error(f"Error listing conversations: {str(e)}")
         return []
 
+def _conversation_batch(
+    client_id: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    state: Optional[ConversationState],
+    after: Optional[Tuple[str, str]],
+    batch_size: int
+) -> List[Conversation]:
+    """Next matching conversations after the `(updated_at, id)` position."""
+    if CONVERSATION_DB_PATH:
+        query = "WHERE 1 = 1"
+        params: List[Any] = []
+        if client_id:
+            query += " AND client_id = ?"
+            params.append(client_id)
+        if since:
+            query += " AND updated_at >= ?"
+            params.append(since.isoformat())
+        if until:
+            query += " AND updated_at < ?"
+            params.append(until.isoformat())
+        if state:
+            query += " AND state = ?"
+            params.append(state.value)
+        if after:
+            query += " AND (updated_at > ? OR (updated_at = ? AND id > ?))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY updated_at, id LIMIT ?"
+        params.append(batch_size)
+        return _read_conversations(_get_connection(), query, params)
+
+    # For demonstration, we'll use in-memory storage
+    def matches(conv: Conversation) -> bool:
+        return ((not client_id or conv.client_id == client_id)
+                and (not since or conv.updated_at >= since)
+                and (not until or conv.updated_at < until)
+                and (not state or conv.state == state)
+                and (not after or (conv.updated_at.isoformat(), conv.id) > after))
+
+    return heapq.nsmallest(batch_size, filter(matches, list(conversations_db.values())),
+                           key=lambda conv: (conv.updated_at.isoformat(), conv.id))
+
+def iter_conversations(
+    client_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    state: Optional[ConversationState] = None,
+    after: Optional[Tuple[str, str]] = None,
+    batch_size: int = CONVERSATION_SCAN_BATCH
+) -> Iterator[Conversation]:
+    """Yield matching conversations in (updated_at, id) order.
+
+    Conversations are read in keyset-paginated batches, so memory use does not
+    grow with the size of the store and `after` can resume an earlier scan.
+    """
+    while True:
+        batch = _conversation_batch(client_id, since, until, state, after, batch_size)
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after = (batch[-1].updated_at.isoformat(), batch[-1].id)
+
 def delete_conversation(conversation_id: str) -> bool:
     """Delete a conversation from the database."""
     try:
-        # In a real application, this would interact with a database
-        # For demonstration, we'll use in-memory storage
-        if conversation_id in conversations_db:
-            del conversations_db[conversation_id]
+        if CONVERSATION_DB_PATH:
+            def delete(conn: sqlite3.Connection) -> bool:
+                conn.execute("DELETE FROM conversation_log WHERE conversation_id = ?", (conversation_id,))
+                return conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+            deleted = _writer.submit(delete)
+        else:
+            # For demonstration, we'll use in-memory storage
+            deleted = conversations_db.pop(conversation_id, None) is not None
+        if deleted:
             logger.info(f"Deleted conversation {conversation_id}")
             return True
         logger.info(f"Conversation {conversation_id} not found for deletion")
@@ -72,16 +354,29 @@ def delete_conversation(conversation_id: str) -> bool:
 def add_message_to_conversation(conversation_id: str, message: ChatMessage) -> bool:
     """Add a message to an existing conversation."""
     try:
-        conversation = get_conversation(conversation_id)
-        if not conversation:
+        if CONVERSATION_DB_PATH:
+            def append(conn: sqlite3.Connection) -> bool:
+                # Only the header row and one log record are written, not the conversation
+                if conn.execute(
+                    "UPDATE conversations SET updated_at = ?, log_records = log_records + 1 WHERE id = ?",
+                    (datetime.now().isoformat(), conversation_id)
+                ).rowcount == 0:
+                    return False
+                conn.execute("INSERT INTO conversation_log (conversation_id, record) VALUES (?, ?)",
+                             (conversation_id, _message_record(message)))
+                return True
+            added = _writer.submit(append)
+        else:
+            conversation = conversations_db.get(conversation_id)
+            added = conversation is not None
+            if added:
+                conversation.messages.append(message)
+                conversation.updated_at = datetime.now()
+        if not added:
             logger.error(f"Conversation {conversation_id} not found")
             return False
-        
-        conversation.messages.append(message)
-        conversation.updated_at = datetime.now()
-        save_conversation(conversation)
         logger.info(f"Added message to conversation {conversation_id}")
         return True
     except Exception as e:
         logger.error(f"Error adding message to conversation: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CRM_OUTBOX_DB = os.environ.get('CRM_OUTBOX_DB', 'data/crm_outbox.db')
+# Entries claimed longer ago than this are assumed abandoned (e.g. the worker died) and retried
+CRM_DELIVERY_LEASE_SECONDS = float(os.environ.get('CRM_DELIVERY_LEASE_SECONDS', '300'))
+
+# Delivery states of an outbox entry
+STATUS_PENDING = "pending"
+STATUS_DELIVERING = "delivering"
+STATUS_DELIVERED = "delivered"
+STATUS_FAILED = "failed"
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Open the outbox database on first use."""
+    global _conn
+    if _conn is None:
+        if CRM_OUTBOX_DB != ':memory:':
+            os.makedirs(os.path.dirname(CRM_OUTBOX_DB) or '.', exist_ok=True)
+        conn = sqlite3.connect(CRM_OUTBOX_DB, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS crm_outbox (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   idempotency_key TEXT NOT NULL UNIQUE,
+                   order_id TEXT NOT NULL UNIQUE,
+                   payload TEXT NOT NULL,
+                   status TEXT NOT NULL,
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   next_attempt_at REAL NOT NULL,
+                   last_error TEXT,
+                   crm_order_id TEXT,
+                   created_at REAL NOT NULL,
+                   updated_at REAL NOT NULL
+               )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_crm_outbox_due "
+            "ON crm_outbox (status, next_attempt_at)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    entry = dict(row)
+    entry["payload"] = json.loads(entry["payload"])
+    return entry
+
+
+class IdempotencyConflictError(ValueError):
+    """An idempotency key was reused for a different order."""
+
+
+def _order_content(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Metadata holds per-request values such as timestamps, not the order itself
+    return {key: value for key, value in payload.items() if key != "metadata"}
+
+
+def enqueue_order(idempotency_key: str, order_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Durably store an order for delivery.
+
+    If an order with the same idempotency key already exists, that entry is
+    returned instead of creating a new one. Raises `IdempotencyConflictError`
+    if the existing order has a different client or content.
+    """
+    with _lock:
+        conn = _get_connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR IGNORE INTO crm_outbox "
+            "(idempotency_key, order_id, payload, status, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (idempotency_key, order_id, json.dumps(payload), STATUS_PENDING, now, now, now)
+        )
+        conn.commit()
+        row = conn.execute(
+            "SELECT * FROM crm_outbox WHERE idempotency_key = ?", (idempotency_key,)
+        ).fetchone()
+    entry = _row_to_dict(row)
+    if entry["order_id"] != order_id:
+        stored = entry["payload"]
+        if stored.get("client_id") != payload.get("client_id") or _order_content(stored) != _order_content(payload):
+            raise IdempotencyConflictError(
+                f"Idempotency key {idempotency_key} was already used for a different order")
+    return entry
+
+
+def claim_due_orders(limit: int) -> List[Dict[str, Any]]:
+    """Mark up to `limit` due entries as delivering and return them."""
+    with _lock:
+        conn = _get_connection()
+        # Take the write lock up front so dispatchers in other worker processes
+        # cannot claim the same entries
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            rows = conn.execute(
+                "SELECT * FROM crm_outbox WHERE (status = ? AND next_attempt_at <= ?) "
+                "OR (status = ? AND updated_at <= ?) "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (STATUS_PENDING, now, STATUS_DELIVERING, now - CRM_DELIVERY_LEASE_SECONDS, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE crm_outbox SET status = ?, updated_at = ? WHERE id = ?",
+                    [(STATUS_DELIVERING, now, row["id"]) for row in rows]
+                )
+            conn.commit()
+        except BaseException:
+            # Never leave the shared connection inside a transaction holding the write lock
+            conn.rollback()
+            raise
+    return [_row_to_dict(row) for row in rows]
+
+
+def mark_delivered(entry_id: int, crm_order_id: str) -> None:
+    """Record a successful delivery."""
+    with _lock:
+        conn = _get_connection()
+        conn.execute(
+            "UPDATE crm_outbox SET status = ?, crm_order_id = ?, last_error = NULL, "
+            "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (STATUS_DELIVERED, crm_order_id, time.time(), entry_id)
+        )
+        conn.commit()
+
+
+def mark_attempt_failed(entry_id: int, error: str, next_attempt_at: Optional[float]) -> None:
+    """Record a failed delivery; entries without a next attempt are given up on."""
+    with _lock:
+        conn = _get_connection()
+        status = STATUS_PENDING if next_attempt_at is not None else STATUS_FAILED
+        conn.execute(
+            "UPDATE crm_outbox SET status = ?, last_error = ?, attempts = attempts + 1, "
+            "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (status, error, next_attempt_at or time.time(), time.time(), entry_id)
+        )
+        conn.commit()
+
+
+def get_outbox_entry(order_id: str) -> Optional[Dict[str, Any]]:
+    """Get an outbox entry by order ID or idempotency key."""
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT * FROM crm_outbox WHERE order_id = ? OR idempotency_key = ?",
+            (order_id, order_id)
+        ).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def count_by_status() -> Dict[str, int]:
+    """Number of outbox entries in each delivery state."""
+    with _lock:
+        rows = _get_connection().execute(
+            "SELECT status, COUNT(*) FROM crm_outbox GROUP BY status"
+        ).fetchall()
+    return {status: count for status, count in rows}
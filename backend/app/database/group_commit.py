@@ -0,0 +1,145 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, List, Optional, Tuple
+
+from ..services.telemetry import GROUP_COMMIT_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Most writes applied in one transaction
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', '256'))
+# Longest a caller waits for its write to be committed before giving up
+GROUP_COMMIT_TIMEOUT_SECONDS = float(os.environ.get('GROUP_COMMIT_TIMEOUT_SECONDS', '30'))
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+class GroupCommitWriter:
+    """Applies the writes of all threads through one connection, in shared transactions.
+
+    Callers block until their write is committed. While one transaction is
+    being committed, the writes that arrive meanwhile queue up and are
+    committed together in the next one, so under load many writes share one
+    commit (and one fsync). A write that fails is retried alone, so it does
+    not fail the others in its batch. `maintenance` is called with the
+    connection every `maintenance_interval` seconds, between batches.
+
+    If the writer thread dies (e.g. the database cannot be opened), every
+    pending write fails with the error and the next write starts a new
+    thread. A caller whose write is not committed within `timeout` seconds
+    gets a TimeoutError; the write is dropped if it had not started yet.
+    """
+
+    def __init__(self, name: str, connect: Callable[[], sqlite3.Connection],
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH,
+                 maintenance: Optional[WriteOp] = None,
+                 maintenance_interval: float = 30.0,
+                 timeout: float = GROUP_COMMIT_TIMEOUT_SECONDS):
+        self.name = name
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self._connect = connect
+        self._maintenance = maintenance
+        self._maintenance_interval = maintenance_interval
+        self._queue: "queue.Queue[Tuple[WriteOp, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, op: WriteOp) -> Any:
+        """Run `op(connection)` in the next transaction and return its result once committed."""
+        future: Future = Future()
+        # Queued before the writer is checked, so a dying writer either fails it or is replaced
+        self._queue.put((op, future))
+        self._ensure_started()
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise TimeoutError(f"{self.name} write not started within {self.timeout:g}s") from None
+            raise TimeoutError(f"{self.name} write not committed within {self.timeout:g}s; "
+                               f"it may still be committed") from None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        batch: List[Tuple[WriteOp, Future]] = []
+        conn = None
+        try:
+            conn = self._connect()
+            # Transactions are managed explicitly, one per batch
+            conn.isolation_level = None
+            self._serve(conn, batch)
+        except BaseException as e:
+            logger.error(f"{self.name} writer failed: {str(e)}")
+            with self._lock:
+                # Later writes start a new writer; the ones already queued fail with this error
+                self._thread = None
+                pending = list(batch)
+                while True:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _serve(self, conn: sqlite3.Connection, batch: List[Tuple[WriteOp, Future]]) -> None:
+        # `batch` is filled in place, so a fatal error can fail the writes it was committing
+        next_maintenance = time.monotonic() + self._maintenance_interval
+        while True:
+            batch.clear()
+            timeout = max(0.0, next_maintenance - time.monotonic()) if self._maintenance else None
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            while batch and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Writes whose caller gave up before they started are dropped
+            batch[:] = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(conn, batch)
+            if self._maintenance and time.monotonic() >= next_maintenance:
+                try:
+                    self._maintenance(conn)
+                except Exception as e:
+                    logger.error(f"{self.name} maintenance failed: {str(e)}")
+                    if conn.in_transaction:
+                        conn.rollback()
+                next_maintenance = time.monotonic() + self._maintenance_interval
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[WriteOp, Future]]) -> None:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [op(conn) for op, _ in batch]
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if len(batch) > 1:
+                for item in batch:
+                    self._commit(conn, [item])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        GROUP_COMMIT_BATCH.labels(writer=self.name).observe(len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,191 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MEMORY_DB = os.environ.get('TRANSLATION_MEMORY_DB', 'data/translation_memory.db')
+# Entries kept in the in-process LRU in front of SQLite
+TRANSLATION_MEMORY_CACHE_SIZE = int(os.environ.get('TRANSLATION_MEMORY_CACHE_SIZE', '10000'))
+# Rows kept on disk before the least recently used ones are evicted
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get('TRANSLATION_MEMORY_MAX_ENTRIES', '200000'))
+# Reads record when a segment was last used in memory; the times are written in batches
+# of this many, or with the next write, or after TRANSLATION_MEMORY_TOUCH_FLUSH_SECONDS
+TRANSLATION_MEMORY_TOUCH_BATCH = int(os.environ.get('TRANSLATION_MEMORY_TOUCH_BATCH', '500'))
+TRANSLATION_MEMORY_TOUCH_FLUSH_SECONDS = float(os.environ.get('TRANSLATION_MEMORY_TOUCH_FLUSH_SECONDS', '60'))
+
+
+class TranslationMemory:
+    """Segment-level translation cache: an in-memory LRU backed by SQLite."""
+
+    def __init__(self, db_path: str = TRANSLATION_MEMORY_DB,
+                 cache_size: int = TRANSLATION_MEMORY_CACHE_SIZE,
+                 max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._touched: Dict[tuple, float] = {}
+        self._last_touch_flush = time.monotonic()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._opened = False
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Open the database on first use (caller holds the lock)."""
+        if self._opened:
+            return self._conn
+        self._opened = True
+        try:
+            if self.db_path != ':memory:':
+                os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS translation_memory (
+                       source_language TEXT NOT NULL,
+                       target_language TEXT NOT NULL,
+                       segment TEXT NOT NULL,
+                       translation TEXT NOT NULL,
+                       last_used REAL NOT NULL,
+                       PRIMARY KEY (source_language, target_language, segment)
+                   )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_translation_memory_last_used "
+                "ON translation_memory (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+        except sqlite3.Error as e:
+            # Keep working with the in-memory LRU only
+            logger.error(f"Translation memory database unavailable: {str(e)}")
+        return self._conn
+
+    def _flush_touched(self) -> None:
+        # Caller holds the lock and commits
+        self._last_touch_flush = time.monotonic()
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            "UPDATE translation_memory SET last_used = ? "
+            "WHERE source_language = ? AND target_language = ? AND segment = ?",
+            [(when, *key) for key, when in touched.items()]
+        )
+
+    def _remember(self, key: tuple, translation: str) -> None:
+        self._cache[key] = translation
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_many(self, source_language: str, target_language: str,
+                 segments: List[str]) -> Dict[str, str]:
+        """Return the cached translations for the given segments."""
+        found = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            for segment in set(segments):
+                key = (source_language, target_language, segment)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[segment] = self._cache[key]
+                    if conn is not None:
+                        self._touched[key] = now
+                else:
+                    missing.append(segment)
+
+            if missing and conn is not None:
+                try:
+                    rows = []
+                    # Stay below SQLite's bound-parameter limit
+                    for i in range(0, len(missing), 500):
+                        chunk = missing[i:i + 500]
+                        placeholders = ",".join("?" * len(chunk))
+                        rows.extend(conn.execute(
+                            "SELECT segment, translation FROM translation_memory "
+                            "WHERE source_language = ? AND target_language = ? "
+                            f"AND segment IN ({placeholders})",
+                            [source_language, target_language, *chunk]
+                        ).fetchall())
+                    for segment, translation in rows:
+                        found[segment] = translation
+                        key = (source_language, target_language, segment)
+                        self._remember(key, translation)
+                        self._touched[key] = now
+                except sqlite3.Error as e:
+                    logger.error(f"Error reading translation memory: {str(e)}")
+
+            if conn is not None and (
+                    len(self._touched) >= TRANSLATION_MEMORY_TOUCH_BATCH
+                    or time.monotonic() - self._last_touch_flush >= TRANSLATION_MEMORY_TOUCH_FLUSH_SECONDS):
+                try:
+                    self._flush_touched()
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Error updating translation memory: {str(e)}")
+        return found
+
+    def put_many(self, source_language: str, target_language: str,
+                 translations: Dict[str, str]) -> None:
+        """Store translated segments."""
+        if not translations:
+            return
+        with self._lock:
+            for segment, translation in translations.items():
+                self._remember((source_language, target_language, segment), translation)
+
+            if self._connection() is None:
+                return
+            try:
+                now = time.time()
+                # Pending read times are written with this transaction
+                self._flush_touched()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO translation_memory "
+                    "(source_language, target_language, segment, translation, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(source_language, target_language, segment, translation, now)
+                     for segment, translation in translations.items()]
+                )
+                self._writes_since_evict += len(translations)
+                if self._writes_since_evict >= 1000:
+                    self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing translation memory: {str(e)}")
+
+    def _evict(self) -> None:
+        """Drop the least recently used rows once the table is over capacity."""
+        self._writes_since_evict = 0
+        count = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM translation_memory WHERE rowid IN ("
+                "SELECT rowid FROM translation_memory ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            logger.info(f"Evicted {excess} entries from translation memory")
+
+    def clear(self) -> None:
+        """Remove all cached translations."""
+        with self._lock:
+            self._cache.clear()
+            self._touched.clear()
+            if self._connection() is not None:
+                self._conn.execute("DELETE FROM translation_memory")
+                self._conn.commit()
+
+
+# Shared translation memory
+translation_memory = TranslationMemory()
@@ -0,0 +1,151 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory of the shared, read-only index snapshot; empty keeps the index in process memory
+VECTOR_SNAPSHOT_DIR = os.environ.get('VECTOR_SNAPSHOT_DIR', '')
+# The snapshot ships with the deployment artifact on a read-only filesystem: load it, never build it
+VECTOR_SNAPSHOT_READ_ONLY = os.environ.get('VECTOR_SNAPSHOT_READ_ONLY', 'false').lower() == 'true'
+
+_MANIFEST = "manifest.json"
+_VECTORS = "vectors.npy"
+_DOCUMENTS = "documents.bin"
+_OFFSETS = "offsets.npy"
+
+
+class MmapDocumentStore(Sequence):
+    """Read-only list of documents backed by a memory-mapped file.
+
+    Every worker maps the same file, so the operating system keeps a single
+    copy of the documents in the page cache.
+    """
+
+    def __init__(self, documents_path: str, offsets_path: str):
+        self._offsets = np.load(offsets_path, mmap_mode="r")
+        self._file = open(documents_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._data[start:end].decode("utf-8")
+
+
+class MmapFlatIndex:
+    """Exact L2 index over memory-mapped vectors, searched with faiss.
+
+    Exposes the parts of the faiss index interface used for retrieval
+    (`ntotal`, `d`, `search`) without copying the vectors into each process.
+    """
+
+    def __init__(self, vectors_path: str):
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.ntotal == 0:
+            return (np.full((len(queries), k), np.inf, dtype="float32"),
+                    np.full((len(queries), k), -1, dtype="int64"))
+        # Imported on first search so processes that never retrieve do not load faiss
+        import faiss
+        distances, indices = faiss.knn(np.ascontiguousarray(queries, dtype="float32"),
+                                       self.vectors, min(k, self.ntotal))
+        if k > self.ntotal:
+            # Pad like faiss does when fewer than k vectors exist
+            pad = k - self.ntotal
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+            indices = np.pad(indices, ((0, 0), (0, pad)), constant_values=-1)
+        return distances, indices
+
+
+def save_snapshot(directory: str, vectors: np.ndarray, documents: List[str]) -> None:
+    """Atomically write vectors and documents as a snapshot directory."""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    np.save(os.path.join(staging, _VECTORS), np.ascontiguousarray(vectors, dtype="float32"))
+    offsets = [0]
+    with open(os.path.join(staging, _DOCUMENTS), "wb") as f:
+        for document in documents:
+            encoded = document.encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(staging, _OFFSETS), np.array(offsets, dtype="int64"))
+    with open(os.path.join(staging, _MANIFEST), "w") as f:
+        json.dump({"documents": len(documents), "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+                   "built_at": time.time()}, f)
+
+    # Swap the new snapshot in; readers keep their mappings of the old files
+    previous = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.rename(directory, previous)
+    os.rename(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+    logger.info(f"Saved index snapshot with {len(documents)} documents to {directory}")
+
+
+def snapshot_exists(directory: str) -> bool:
+    return os.path.isfile(os.path.join(directory, _MANIFEST))
+
+
+def load_snapshot(directory: str) -> Tuple[MmapFlatIndex, MmapDocumentStore]:
+    """Memory-map a snapshot written by `save_snapshot`."""
+    index = MmapFlatIndex(os.path.join(directory, _VECTORS))
+    documents = MmapDocumentStore(os.path.join(directory, _DOCUMENTS), os.path.join(directory, _OFFSETS))
+    logger.info(f"Loaded index snapshot with {len(documents)} documents from {directory}")
+    return index, documents
+
+
+@contextmanager
+def _snapshot_lock(directory: str) -> Iterator[None]:
+    os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+    with open(f"{directory}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_or_build_snapshot(
+    directory: str,
+    build: Callable[[], Tuple[np.ndarray, List[str]]]
+) -> Tuple[MmapFlatIndex, MmapDocumentStore]:
+    """Load the shared snapshot, building it first if no worker has done so yet.
+
+    A file lock ensures only one process runs `build`; the others wait and
+    then map the result.
+    """
+    with _snapshot_lock(directory):
+        if not snapshot_exists(directory):
+            vectors, documents = build()
+            save_snapshot(directory, vectors, documents)
+    return load_snapshot(directory)
+
+
+def remove_snapshot(directory: str) -> None:
+    """Delete a snapshot so the next worker to start rebuilds it."""
+    with _snapshot_lock(directory):
+        shutil.rmtree(directory, ignore_errors=True)
@@ -1,20 +1,42 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Optional, List
+from typing import Any, Callable, Dict, Optional, List
+import asyncio
+import hmac
 import json
 import logging
-from langdetect import detect
+import threading
+import time
 from datetime import datetime
 
-from .services.language_service import translate_to_english, translate_to_target, detect_language
-from .services.ai_service import process_query, generate_pricing
-from .services.crm_service import create_order_inquiry
-from .models.models import ChatMessage, ClientRequirement, PricingRequest, PricingResponse
+from .services.language_service import (
+    translate_to_english, translate_to_target, detect_language, load_language_profiles
+)
+from .services.ai_service import process_query, generate_pricing, initialize_index
+from .services.crm_service import create_order_inquiry, get_order_status, crm_dispatcher, IdempotencyConflictError
+from .services.http_client import outbound_client
+from .services.bedrock_limiter import bedrock_limiter
+from .services.telemetry import (
+    install_log_trace_ids, new_trace_id, trace_id_from_header, trace_id_var, timed_stage, render_metrics, REQUEST_LATENCY
+)
+from .services.profiler import request_profiler, PROFILING_ENABLED, PROFILE_HEADER
+from .services.token_usage import token_ledger, USAGE_TOKEN, TOKEN_BUDGET_CONSUMER_HEADER
+from .services.export_service import EXPORT_TOKEN, export_conversations, decode_cursor, gzip_stream
+from .services.chat_session import (
+    ChatSession, reply_frames, send_frame, WS_IDLE_TIMEOUT_SECONDS, WS_MAX_PENDING_TURNS
+)
+from .database.conversation_db import get_conversation
+from .database.analytics_store import analytics_store
+from .models.models import ChatMessage, ClientRequirement, Conversation, ConversationState, PricingRequest, PricingResponse
 
-# Configure logging
+# Configure logging (every record carries the trace ID of the current request)
+install_log_trace_ids()
 logging.basicConfig(level=logging.INFO,
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+                   format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s')
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="B2B Sales Support Chatbot API")
@@ -28,6 +50,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def profile_requests(request: Request, call_next):
+    # Profile a sampled fraction of requests, or those carrying the debug header
+    if not request_profiler.should_profile(request.headers.get(PROFILE_HEADER)):
+        return await call_next(request)
+    sampler = request_profiler.begin()
+    if sampler is None:
+        return await call_next(request)
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        await run_in_threadpool(request_profiler.finish, sampler, request.method,
+                                request.url.path, time.perf_counter() - start)
+
+# Registered before the tracing middleware so profiles are named after the trace ID;
+# only installed when enabled, so disabled profiling adds no per-request work
+if PROFILING_ENABLED:
+    app.add_middleware(BaseHTTPMiddleware, dispatch=profile_requests)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Reuse the caller's request ID (e.g. from Kong) as trace ID when it is well formed
+    trace_id = trace_id_from_header(request.headers.get("X-Request-ID"))
+    token = trace_id_var.set(trace_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-ID"] = trace_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=str(status)
+        ).observe(time.perf_counter() - start)
+        trace_id_var.reset(token)
+
+def require_token(name: str, expected: Callable[[], str]):
+    """Dependency checking the X-<Name>-Token header; the endpoint is hidden while no token is configured."""
+    def check(token: Optional[str] = Header(None, alias=f"X-{name.title()}-Token")):
+        configured = expected()
+        if not configured:
+            raise HTTPException(status_code=404, detail="Not Found")
+        # Constant-time comparison so the token cannot be guessed from response timing
+        if token is None or not hmac.compare_digest(token.encode("utf-8"), configured.encode("utf-8")):
+            raise HTTPException(status_code=403, detail=f"Invalid {name} token")
+    return check
+
+require_profile_token = require_token("profile", lambda: request_profiler.token)
+require_export_token = require_token("export", lambda: EXPORT_TOKEN)
+require_usage_token = require_token("usage", lambda: USAGE_TOKEN)
+
 class ConversationRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
@@ -38,47 +115,163 @@ class OrderRequest(BaseModel):
     client_id: str
     requirements: List[ClientRequirement]
     price: float
+    idempotency_key: Optional[str] = None
+    
+@app.on_event("startup")
+async def start_background_workers():
+    crm_dispatcher.start()
+    # Load the analytics tables and language profiles ahead of the first requests that need them
+    threading.Thread(target=analytics_store.load, name="analytics-load", daemon=True).start()
+    threading.Thread(target=load_language_profiles, name="langdetect-load", daemon=True).start()
+    # The retrieval index is ready before the first request is served
+    await run_in_threadpool(initialize_index)
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    crm_dispatcher.stop()
     
 @app.get("/")
 async def root():
     return {"message": "B2B Sales Support Chatbot API"}
 
+async def run_chat_turn(
+    message: str,
+    conversation_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    conversation: Optional[Conversation] = None,
+    consumer: Optional[str] = None
+) -> Dict[str, Any]:
+    """One chat turn: detect the language, translate, answer and translate back."""
+    # Log incoming message
+    logger.info(f"Received message: {message[:50]}...")
+    
+    # 1. Detect language, keeping the language the conversation already uses. The
+    # conversation is loaded once here and handed on to process_query.
+    if conversation is None and conversation_id:
+        conversation = await run_in_threadpool(get_conversation, conversation_id)
+        if conversation is None:
+            # Unknown conversation IDs start a new conversation
+            conversation_id = None
+    # A conversation's language is only known once it has messages
+    current_language = conversation.language if conversation and conversation.messages else None
+    with timed_stage("language_detection"):
+        source_language = await run_in_threadpool(detect_language, message, current_language)
+    logger.info(f"Detected language: {source_language}")
+    
+    # 2. Translate to English if not already
+    if source_language != 'en':
+        with timed_stage("translate_in"):
+            english_message = await run_in_threadpool(translate_to_english, message, source_language)
+        logger.info(f"Translated to English: {english_message[:50]}...")
+    else:
+        english_message = message
+        
+    # 3. Process the query with AI (off the event loop, so concurrent turns overlap
+    # and identical Bedrock calls can be coalesced)
+    with timed_stage("process_query"):
+        response_data = await run_in_threadpool(process_query, english_message, 
+                                                conversation_id=conversation_id,
+                                                client_id=client_id,
+                                                language=source_language,
+                                                conversation=conversation,
+                                                consumer=consumer)
+    
+    # Store the detected language in the response
+    response_data["detected_language"] = source_language
+    
+    # 4. Translate response back if needed
+    if source_language != 'en':
+        with timed_stage("translate_out"):
+            response_data["message"] = await run_in_threadpool(
+                translate_to_target, response_data["message"], source_language)
+    
+    return response_data
+
 @app.post("/chat")
-async def chat(request: ConversationRequest):
+async def chat(request: ConversationRequest,
+               consumer: Optional[str] = Header(None, alias=TOKEN_BUDGET_CONSUMER_HEADER)):
     try:
-        # Log incoming message
-        logger.info(f"Received message: {request.message[:50]}...")
-        
-        # 1. Detect language
-        source_language = detect_language(request.message)
-        logger.info(f"Detected language: {source_language}")
-        
-        # 2. Translate to English if not already
-        if source_language != 'en':
-            english_message = translate_to_english(request.message, source_language)
-            logger.info(f"Translated to English: {english_message[:50]}...")
-        else:
-            english_message = request.message
-            
-        # 3. Process the query with AI
-        response_data = process_query(english_message, 
-                                      conversation_id=request.conversation_id,
-                                      client_id=request.client_id)
-        
-        # Store the detected language in the response
-        response_data["detected_language"] = source_language
-        
-        # 4. Translate response back if needed
-        if source_language != 'en':
-            response_data["message"] = translate_to_target(
-                response_data["message"], source_language)
-        
-        return response_data
+        # Token usage is charged to the consumer the gateway authenticated
+        return await run_chat_turn(request.message, request.conversation_id, request.client_id,
+                                   consumer=consumer)
     
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def receive_turns(websocket: WebSocket, pending: asyncio.Queue):
+    # Queue the client's messages; a client that runs too far ahead is told to wait
+    while True:
+        raw = await asyncio.wait_for(websocket.receive_text(), WS_IDLE_TIMEOUT_SECONDS)
+        try:
+            message = json.loads(raw).get("message")
+        except (ValueError, AttributeError):
+            message = None
+        if not isinstance(message, str) or not message.strip():
+            await send_frame(websocket, {"type": "error", "detail": "Expected {\"message\": \"...\"}"})
+            continue
+        try:
+            pending.put_nowait(message)
+        except asyncio.QueueFull:
+            await send_frame(websocket, {"type": "error", "detail": "Too many pending messages, "
+                                                                   "wait for the current reply"})
+
+async def answer_turns(websocket: WebSocket, session: ChatSession, pending: asyncio.Queue):
+    # Answer queued messages one at a time, streaming each reply as frames
+    while True:
+        message = await pending.get()
+        session.turns += 1
+        token = trace_id_var.set(new_trace_id())
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            await send_frame(websocket, {"type": "start", "turn": session.turns})
+            try:
+                response_data = await run_chat_turn(message, session.conversation_id,
+                                                    session.client_id, session.conversation,
+                                                    consumer=session.consumer)
+            except Exception as e:
+                logger.error(f"Error processing chat message: {str(e)}")
+                status = "error"
+                await send_frame(websocket, {"type": "error", "turn": session.turns, "detail": str(e)})
+                continue
+            for chunk in reply_frames(response_data.pop("message")):
+                await send_frame(websocket, {"type": "delta", "turn": session.turns, "text": chunk})
+            await send_frame(websocket, {"type": "done", "turn": session.turns, **response_data})
+        finally:
+            REQUEST_LATENCY.labels(method="WS", route="/ws/chat", status=status).observe(
+                time.perf_counter() - start)
+            trace_id_var.reset(token)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, conversation_id: Optional[str] = None,
+                      client_id: Optional[str] = None):
+    # Persistent chat session: the conversation stays loaded between turns
+    await websocket.accept()
+    session = await run_in_threadpool(ChatSession, client_id, conversation_id,
+                                      websocket.headers.get(TOKEN_BUDGET_CONSUMER_HEADER))
+    await send_frame(websocket, {"type": "session", "conversation_id": session.conversation_id})
+    pending = asyncio.Queue(maxsize=WS_MAX_PENDING_TURNS)
+    tasks = [asyncio.create_task(receive_turns(websocket, pending)),
+             asyncio.create_task(answer_turns(websocket, session, pending))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    error = next((r for r in results if isinstance(r, Exception)), None)
+    if isinstance(error, asyncio.TimeoutError):
+        # Idle session or a client that stopped reading
+        logger.info(f"Closing chat session {session.conversation_id} after a timeout")
+        try:
+            await websocket.close(code=1001)
+        except Exception:
+            pass
+    elif error is not None and not isinstance(error, WebSocketDisconnect):
+        logger.error(f"Chat session {session.conversation_id} failed: {str(error)}")
+    logger.info(f"Chat session {session.conversation_id} ended after {session.turns} turns")
+
 @app.post("/pricing")
 async def calculate_pricing(request: PricingRequest):
     try:
@@ -91,23 +284,88 @@ async def calculate_pricing(request: PricingRequest):
         logger.error(f"Error calculating pricing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/create-order")
-async def create_order(request: OrderRequest):
+@app.post("/create-order", status_code=202)
+async def create_order(request: OrderRequest, idempotency_key: Optional[str] = Header(None)):
     try:
-        # Create an order inquiry in the CRM system
-        order_id = create_order_inquiry(
+        # Queue an order inquiry for the CRM system; delivery happens in the background
+        order = await run_in_threadpool(
+            create_order_inquiry,
             conversation_id=request.conversation_id,
             client_id=request.client_id,
             requirements=request.requirements,
-            price=request.price
+            price=request.price,
+            idempotency_key=request.idempotency_key or idempotency_key
         )
         
-        return {"order_id": order_id, "status": "created"}
+        return order
     
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error creating order: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/orders/{order_id}")
+async def order_status(order_id: str):
+    status = await run_in_threadpool(get_order_status, order_id)
+    if not status:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    return status
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/outbound/metrics")
+async def outbound_metrics():
+    # Connection pool, circuit breaker and Bedrock limiter metrics for outbound integrations
+    metrics = outbound_client.get_metrics()
+    metrics["bedrock"] = bedrock_limiter.get_metrics()
+    return metrics
+
+@app.get("/usage", dependencies=[Depends(require_usage_token)])
+async def token_usage(client_id: Optional[str] = None, top_conversations: int = 10):
+    # Bedrock token usage per client in the current window, with budget status (this worker only)
+    return token_ledger.get_usage(client_id, top_conversations)
+
+@app.get("/conversations/export", dependencies=[Depends(require_export_token)])
+async def export_conversation_log(
+    request: Request,
+    client_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    state: Optional[ConversationState] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+):
+    # Stream conversations as NDJSON, gzip-compressed when the client accepts it
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    body = export_conversations(client_id=client_id, since=since, until=until, state=state,
+                                cursor=cursor, limit=limit)
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    return {"profiles": request_profiler.list_profiles()}
+
+@app.get("/debug/profiles/{name}", dependencies=[Depends(require_profile_token)],
+         response_class=PlainTextResponse)
+async def get_profile(name: str):
+    profile = request_profiler.read_profile(name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found")
+    return profile
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=80, reload=True) 
\ No newline at end of file
@@ -8,6 +8,15 @@ class MessageRole(str, Enum):
     USER = "user"
     ASSISTANT = "assistant"
 
+class ConversationState(str, Enum):
+    GREETING = "greeting"
+    PRODUCT_QA = "product_qa"
+    REQUIREMENTS = "requirements"
+    PRICING = "pricing"
+    CONFIRMATION = "confirmation"
+    HANDOFF = "handoff"
+    COMPLETED = "completed"
+
 class ChatMessage(BaseModel):
     role: MessageRole
     content: str
@@ -20,6 +29,7 @@ class Conversation(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     language: str = "en"
+    state: Optional[ConversationState] = None
     
 class ClientRequirement(BaseModel):
     feature_id: str
@@ -52,15 +62,6 @@ class OrderInquiry(BaseModel):
     status: str = "pending"
     created_at: datetime = Field(default_factory=datetime.now)
     
-class ConversationState(str, Enum):
-    GREETING = "greeting"
-    PRODUCT_QA = "product_qa"
-    REQUIREMENTS = "requirements"
-    PRICING = "pricing"
-    CONFIRMATION = "confirmation"
-    HANDOFF = "handoff"
-    COMPLETED = "completed"
-
 class ConversationContext(BaseModel):
     state: ConversationState = ConversationState.GREETING
     collected_requirements: List[ClientRequirement] = []
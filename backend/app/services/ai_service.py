@@ -2,11 +2,14 @@ import logging
 import json
 import uuid
 from typing import Dict, List, Optional, Any, Tuple
-import boto3
 import random
 import os
+import time
 from datetime import datetime
-import faiss
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from dataclasses import replace
 import numpy as np
 
 
@@ -20,126 +23,219 @@ from ..models.models import (
     PricingResponse,
     MessageRole
 )
-from ..database.conversation_db import save_conversation, get_conversation
+from ..database.conversation_db import append_messages, get_conversation
 from ..database.product_db import get_product_features
 from ..database.pricing_db import get_historical_pricing
+from ..database.vector_store import (
+    VECTOR_SNAPSHOT_DIR, VECTOR_SNAPSHOT_READ_ONLY, load_or_build_snapshot, load_snapshot, snapshot_exists
+)
+from .telemetry import timed_stage, record_tokens, record_cache, INDEX_SIZE
+from .single_flight import SingleFlight, fingerprint
+from .kb_ingestion import parse_document
+from .analytics_service import tools_for_message, run_tool, ANALYTICS_MAX_TOOL_CALLS
+from .model_router import ModelRoute, ROUTES, choose_route, record_route_call, record_route_outcome
+from .prefetch_service import speculative_prefetcher, requirements_key
+from .stage_graph import StageGraph
+from .bedrock_limiter import (
+    bedrock_limiter, bedrock_priority, current_priority, BedrockOverloadedError, PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE
+)
+from .aws_clients import bedrock_runtime_client, s3_client
+from .token_usage import token_ledger, usage_scope, current_owner, UsageOwner, BUDGET_DEGRADE, BUDGET_QUEUE, SYSTEM_CLIENT
+
+# Reply sent instead of a generated answer when Bedrock load is being shed
+OVERLOADED_REPLY = ("We're handling an unusually high number of conversations right now. "
+                    "Please send your message again in a moment.")
+
+# Requirements after which a requirements conversation moves on to pricing
+PRICING_MIN_REQUIREMENTS = 3
+
+# Parallel S3 downloads when building the index at startup
+KB_DOWNLOAD_WORKERS = int(os.environ.get('KB_DOWNLOAD_WORKERS', '8'))
+# Build (or load) the retrieval index when the service starts
+INDEX_ON_STARTUP = os.environ.get('INDEX_ON_STARTUP', 'true').lower() == 'true'
+# Query and intent-example embeddings kept in memory (about 6 KB each)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '2048'))
+
+# Concurrent identical Bedrock calls and retrievals share one in-flight result
+embedding_flight = SingleFlight("embedding")
+generation_flight = SingleFlight("generation")
+retrieval_flight = SingleFlight("retrieval")
+
+
+def _bedrock_flight_scope() -> Tuple[str, Optional[str]]:
+    # Bedrock calls only coalesce within one priority class and consumer: a
+    # follower must not inherit a call shed at another priority, and the
+    # tokens of a shared call are charged to the leader's consumer.
+    return current_priority(), current_owner().client_id
+
 
 # Initialize FAISS index and document store
 document_store = []
 dimension = 1536  # Dimension of embeddings
-faiss_index = faiss.IndexFlatL2(dimension)  # Using L2 distance for similarity
+faiss_index = None  # Created when documents are first indexed in process
+
+def embed_documents(documents: List[Tuple[str, str]]) -> Tuple[np.ndarray, List[str]]:
+    """Embed (doc_id, content) pairs into a float32 matrix and the list of contents."""
+    # Bulk embedding yields Bedrock capacity to live chats
+    with bedrock_priority(PRIORITY_BACKGROUND):
+        vectors = [embed_text(content, cache=False) for _, content in documents]
+    contents = [content for _, content in documents]
+    return np.array(vectors, dtype='float32').reshape(len(vectors), dimension), contents
 
 def index_documents_to_faiss(documents: List[Tuple[str, str]]):
     global document_store
     global faiss_index
-    vectors = []
-    new_docs = []
-    for doc_id, content in documents:
-        vector = embed_text(content)
-        vectors.append(vector)
-        new_docs.append(content)
+    vectors_np, new_docs = embed_documents(documents)
     
-    if vectors:
-        vectors_np = np.array(vectors).astype('float32')
-        if faiss_index.ntotal == 0:
-            faiss_index.add(vectors_np)
-        else:
+    if len(new_docs):
+        if faiss_index is None:
+            # faiss is only loaded by processes that build an index themselves
+            import faiss
+            faiss_index = faiss.IndexFlatL2(dimension)  # Using L2 distance for similarity
+        elif faiss_index.ntotal:
             # If index already has vectors, we need to rebuild it
             faiss_index.reset()
-            faiss_index.add(vectors_np)
+        faiss_index.add(vectors_np)
         
         document_store.extend(new_docs)
+        INDEX_SIZE.set(faiss_index.ntotal)
         logger.info(f"Indexed {len(new_docs)} documents. Total in index: {faiss_index.ntotal}")
 
 def get_documents_from_s3(prefix: str = '') -> List[Tuple[str, str]]:
     """
-    Download and return documents from S3.
-    Returns list of (doc_id, content).
+    Download and parse documents from S3.
+    Returns list of (doc_id, content), one entry per chunk of each object.
     """
-    docs = []
-    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-    for obj in response.get('Contents', []):
-        key = obj['Key']
-        file_obj = s3.get_object(Bucket=bucket_name, Key=key)
-        content = file_obj['Body'].read().decode('utf-8')
-        docs.append((key, content))
+    keys = []
+    s3 = s3_client()
+    request = {"Bucket": bucket_name, "Prefix": prefix}
+    while True:
+        response = s3.list_objects_v2(**request)
+        keys.extend(obj['Key'] for obj in response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            break
+        request["ContinuationToken"] = response['NextContinuationToken']
+
+    def load(key: str) -> List[Tuple[str, str]]:
+        data = s3.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+        return [(f"{key}#{i}", chunk) for i, chunk in enumerate(parse_document(key, data))]
 
+    docs = []
+    with ThreadPoolExecutor(max_workers=KB_DOWNLOAD_WORKERS) as pool:
+        for chunks in pool.map(load, keys):
+            docs.extend(chunks)
     return docs
 
 
-def embed_text(text: str) -> List[float]:
-    """Generate an embedding using Titan Embeddings via Bedrock."""
-    if DEV_MODE or bedrock_runtime is None:
-        # Return mock embedding in dev mode
-        random.seed(hash(text))  # Ensures consistency across calls
-        return [random.random() for _ in range(1536)]  # Typical embedding length
-
-    response = bedrock_runtime.invoke_model(
-        modelId="amazon.titan-embed-text-v2",
-        body=json.dumps({
-            "inputText": text
-        }),
-        contentType="application/json"
-    )
-
-    response_body = json.loads(response["body"].read())
-    return response_body["embedding"]
+# Character n-gram sizes hashed by the development-mode embedder
+HASH_NGRAM_SIZES = (3, 4, 5)  # contiguous range
+_FNV_PRIME = np.uint64(1099511628211)
+_MIX_MULTIPLIER = np.uint64(0xff51afd7ed558ccd)
 
+def hashed_embedding(text: str, dim: int = dimension) -> np.ndarray:
+    """Deterministic feature-hashing embedding used instead of Bedrock in dev mode.
 
-def get_conversation_context(conversation_id: Optional[str] = None) -> Tuple[str, ConversationContext]:
-    """Get or create a conversation and its context."""
-    if conversation_id:
-        conversation = get_conversation(conversation_id)
-        if not conversation:
-            conversation_id = str(uuid.uuid4())
-            conversation = Conversation(id=conversation_id)
-            context = ConversationContext()
-        else:
-            # Extract context from conversation if available
-            last_message = None
-            if conversation.messages:
-                last_message = conversation.messages[-1]
-            
-            # Simple logic to determine state based on conversation history
-            # In a real system, this would be more sophisticated
-            context = ConversationContext(
-                state=determine_conversation_state(conversation),
-                language=conversation.language
-            )
+    Character n-grams are hashed (vectorized, FNV-style with a final mix) into
+    `dim` signed buckets and the vector is L2-normalized, so texts sharing
+    n-grams get a high cosine similarity. Stable across processes, and it does
+    not touch the global `random` state.
+    """
+    data = np.frombuffer(f" {text.lower()} ".encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    min_n, max_n = HASH_NGRAM_SIZES[0], HASH_NGRAM_SIZES[-1]
+    if len(data) < min_n:
+        return np.zeros(dim, dtype=np.float32)
+    # Hash every n-gram of the smallest size, then extend those hashes one byte at a time
+    count = len(data) - min_n + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(min_n):
+        hashes = (hashes * _FNV_PRIME) ^ data[offset:offset + count]
+    all_hashes = [hashes]
+    for n in range(min_n + 1, min(max_n, len(data)) + 1):
+        hashes = (hashes[:-1] * _FNV_PRIME) ^ data[n - 1:]
+        all_hashes.append(hashes)
+    hashes = np.concatenate(all_hashes)
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= _MIX_MULTIPLIER
+    hashes ^= hashes >> np.uint64(33)
+    buckets = (hashes % np.uint64(dim)).astype(np.intp)
+    signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+    vector = np.bincount(buckets, weights=signs, minlength=dim)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.astype(np.float32)
+
+def embed_text(text: str, cache: bool = True) -> List[float]:
+    """Generate an embedding using Titan Embeddings via Bedrock.
+
+    Bulk indexing passes `cache=False` so documents do not evict query embeddings.
+    """
+    if not cache:
+        return _compute_embedding(text)
+    hits_before = _cached_embedding.cache_info().hits
+    embedding = _cached_embedding(text)
+    if _cached_embedding.cache_info().hits > hits_before:
+        record_cache("embedding", hits=1)
     else:
-        conversation_id = str(uuid.uuid4())
-        conversation = Conversation(id=conversation_id)
-        context = ConversationContext()
-    
-    return conversation_id, context
-
-def determine_conversation_state(conversation: Conversation) -> ConversationState:
-    """Determine the current state of the conversation using semantic intent detection."""
-    if not conversation.messages:
-        return ConversationState.GREETING
+        record_cache("embedding", misses=1)
+    return embedding.tolist()
 
-    # Find last user message
-    user_messages = [m for m in conversation.messages if m.role == MessageRole.USER]
-    if not user_messages:
-        return ConversationState.GREETING
+@lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+def _cached_embedding(text: str) -> np.ndarray:
+    embedding = np.array(_compute_embedding(text), dtype='float32')
+    embedding.setflags(write=False)
+    return embedding
 
-    latest_message = user_messages[-1].content
-    message_embedding = embed_text(latest_message)
-
-    best_match = ConversationState.GREETING
-    best_score = -1.0
+def _compute_embedding(text: str) -> List[float]:
+    if DEV_MODE:
+        # Return mock embedding in dev mode
+        return hashed_embedding(text).tolist()
+
+    return embedding_flight.do((_bedrock_flight_scope(), text), _embed_with_bedrock, text)
+
+def _embed_with_bedrock(text: str) -> List[float]:
+    with bedrock_limiter.slot("embedding"), timed_stage("bedrock_embedding"):
+        response = bedrock_runtime_client().invoke_model(
+            modelId="amazon.titan-embed-text-v2",
+            body=json.dumps({
+                "inputText": text
+            }),
+            contentType="application/json"
+        )
 
-    for state, examples in INTENT_EXAMPLES.items():
-        for example in examples:
-            example_embedding = embed_text(example)
-            score = cosine_similarity(message_embedding, example_embedding)
+        response_body = json.loads(response["body"].read())
+    record_tokens("amazon.titan-embed-text-v2", response_body.get("inputTextTokenCount"))
+    token_ledger.record("amazon.titan-embed-text-v2", response_body.get("inputTextTokenCount"))
+    return response_body["embedding"]
 
-            if score > best_score:
-                best_score = score
-                best_match = state
 
-    return best_match
+_intent_examples = None
+_intent_examples_lock = threading.Lock()
+
+def intent_examples_matrix() -> Tuple[List[ConversationState], np.ndarray]:
+    """The intent examples' states and their normalised embeddings, computed once."""
+    global _intent_examples
+    if _intent_examples is None:
+        with _intent_examples_lock:
+            if _intent_examples is None:
+                states = [state for state, examples in INTENT_EXAMPLES.items() for _ in examples]
+                # Shared by every conversation, so not charged to the client that happens to need it first
+                with usage_scope(SYSTEM_CLIENT):
+                    vectors = np.array([embed_text(example) for examples in INTENT_EXAMPLES.values()
+                                        for example in examples], dtype='float32')
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                _intent_examples = (states, vectors)
+    return _intent_examples
+
+def classify_intent(message_embedding: List[float],
+                    intent_examples: Optional[Tuple[List[ConversationState], np.ndarray]] = None
+                    ) -> ConversationState:
+    """State of the closest intent example by cosine similarity (semantic intent detection)."""
+    states, examples = intent_examples or intent_examples_matrix()
+    vector = np.asarray(message_embedding, dtype='float32')
+    scores = examples @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+    return states[int(np.argmax(scores))]
 
 def analyze_requirements(message: str) -> List[ClientRequirement]:
     """Extract requirements from user message."""
@@ -163,65 +259,218 @@ def analyze_requirements(message: str) -> List[ClientRequirement]:
     
     return requirements
 
+def collect_requirements(messages: List[str]) -> List[ClientRequirement]:
+    """Requirements mentioned in any of the client's messages, first mention wins."""
+    requirements = {}
+    for message in messages:
+        for requirement in analyze_requirements(message):
+            requirements.setdefault(requirement.feature_id, requirement)
+    return list(requirements.values())
+
+def pricing_query(requirements: List[ClientRequirement]) -> str:
+    """Retrieval query for the knowledge base context of a quote."""
+    return "Pricing for " + ", ".join(r.feature_name for r in requirements)
+
+def prefetch_pricing(client_id: Optional[str],
+                     requirements: List[ClientRequirement]) -> Tuple[PricingResponse, List[str]]:
+    """Provisional quote and its knowledge base context, computed ahead of the pricing turn."""
+    # Speculative work yields Bedrock capacity to live turns
+    with bedrock_priority(PRIORITY_BACKGROUND):
+        quote = generate_pricing(PricingRequest(client_id=client_id, requirements=requirements))
+        kb_context = retrieve_documents_faiss(pricing_query(requirements))
+    return quote, kb_context
+
+def format_quote(quote: PricingResponse) -> str:
+    lines = [f"- {name}: {price:,.2f} {quote.currency}" for name, price in (quote.breakdown or {}).items()]
+    lines.append(f"Base price: {quote.base_price:,.2f} {quote.currency}")
+    lines.append(f"Quoted price: {quote.final_price:,.2f} {quote.currency}")
+    return "\n".join(lines)
+
 def generate_ai_response(
-    messages: List[Dict[str, str]], 
+    messages: List[Dict[str, Any]], 
     system_prompt: str,
-    kb_context: Optional[List[str]] = None
+    kb_context: Optional[List[str]] = None,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    route: Optional[ModelRoute] = None
 ) -> str:
-    """Generate AI response using AWS Bedrock with Claude 3.7 Sonnet."""
-    try:
-        if DEV_MODE:
-            last_message = messages[-1]["content"] if messages else ""
+    """Generate AI response using AWS Bedrock with the routed Claude model.
 
-        # Prepend KB context if provided
+    When `tools` are given, tool calls requested by the model are executed
+    and their results sent back until it produces a final answer. If the
+    route's model fails, the route's fallback model is tried.
+    """
+    route = route or ROUTES["large"]
+    attempted = route
+    try:
+        # Add KB context to the system prompt if provided (the Messages API has no system role)
         if kb_context:
             combined_context = "\n\n".join(kb_context)
-            context_block = {
-                "role": "system",
-                "content": (
-                    "Use the following context from the knowledge base to help answer the user's question:\n\n"
-                    f"{combined_context}"
-                )
-            }
-            messages.insert(0, context_block)
+            system_prompt = (
+                f"{system_prompt}\n\n"
+                "Use the following context from the knowledge base to help answer the user's question:\n\n"
+                f"{combined_context}"
+            )
+        try:
+            text = _generate_with_route(attempted, list(messages), system_prompt, tools)
+        except BedrockOverloadedError:
+            raise
+        except Exception as e:
+            if not route.fallback:
+                raise
+            logger.warning(f"Model route {route.name} failed, falling back to {route.fallback}: {str(e)}")
+            record_route_outcome(route, "fallback")
+            attempted = ROUTES[route.fallback]
+            text = _generate_with_route(attempted, list(messages), system_prompt, tools)
+        record_route_outcome(attempted, "ok")
+        return text or "I'm sorry, I couldn't generate a response."
+    
+    except BedrockOverloadedError:
+        return OVERLOADED_REPLY
+    except Exception as e:
+        # Each route tried is counted once: a failed fallback is its own route's error
+        record_route_outcome(attempted, "error")
+        logger.error(f"Error generating AI response: {str(e)}")
+        return "I apologize, but I'm experiencing technical difficulties. Please try again later."
+
+def _generate_with_route(
+    route: ModelRoute,
+    messages: List[Dict[str, Any]],
+    system_prompt: str,
+    tools: Optional[List[Dict[str, Any]]]
+) -> str:
+    for _ in range(ANALYTICS_MAX_TOOL_CALLS + 1):
         # Format the full payload
-        body = json.dumps({
+        payload = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1024,
+            "max_tokens": route.max_tokens,
             "temperature": 0.7,
             "system": system_prompt,
             "messages": messages
-        })
+        }
+        if tools:
+            payload["tools"] = tools
+        body = json.dumps(payload)
+
+        # Identical concurrent prompts (e.g. the same opening message) share one call
+        response_body = generation_flight.do(fingerprint(_bedrock_flight_scope(), route.model_id, body),
+                                             _invoke_generation_model, route, body)
+        content = response_body.get('content') or []
+        tool_uses = [block for block in content if block.get('type') == 'tool_use']
+        if response_body.get('stop_reason') != 'tool_use' or not tool_uses:
+            break
+        messages.append({"role": "assistant", "content": content})
+        messages.append({"role": "user", "content": [run_tool(tool_use) for tool_use in tool_uses]})
+    else:
+        logger.warning(f"Stopped after {ANALYTICS_MAX_TOOL_CALLS} tool calls without a final answer")
 
-        model_id = os.environ.get('BEDROCK_MODEL_ID', 'eu.anthropic.claude-3-7-sonnet-20250219-v1:0')
+    return "".join(block.get('text', '') for block in content if block.get('type') == 'text')
 
-        response = bedrock_runtime.invoke_model(
-            modelId=model_id,
+def _invoke_generation_model(route: ModelRoute, body: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with bedrock_limiter.slot(f"generation_{route.name}") as call, timed_stage("bedrock_generation"):
+        response = bedrock_runtime_client().invoke_model(
+            modelId=route.model_id,
             body=body
         )
 
         response_body = json.loads(response.get('body').read())
-        return response_body.get('content')[0].get('text', "I'm sorry, I couldn't generate a response.")
-    
-    except Exception as e:
-        logger.error(f"Error generating AI response: {str(e)}")
-        return "I apologize, but I'm experiencing technical difficulties. Please try again later."
+        usage = response_body.get('usage', {})
+        # Generation latency grows with the reply, so the limiter compares it per output token
+        call.output_tokens = usage.get('output_tokens')
+    record_tokens(route.model_id, usage.get('input_tokens'), usage.get('output_tokens'))
+    token_ledger.record(route.model_id, usage.get('input_tokens'), usage.get('output_tokens'))
+    record_route_call(route, time.perf_counter() - start,
+                      usage.get('input_tokens'), usage.get('output_tokens'))
+    return response_body
 
 def process_query(
     message: str, 
     conversation_id: Optional[str] = None,
-    client_id: Optional[str] = None
+    client_id: Optional[str] = None,
+    language: Optional[str] = None,
+    conversation: Optional[Conversation] = None,
+    consumer: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Process a user query and generate a response using RAG."""
-    
-    # Get or create conversation and context
-    conversation_id, context = get_conversation_context(conversation_id)
+    """Process a user query and generate a response using RAG.
+
+    `conversation` is updated in place when given, instead of being reloaded.
+    The turn's Bedrock tokens are charged to the conversation and to the
+    authenticated `consumer` (anonymous without one), not to `client_id`,
+    which the caller chooses freely.
+    """
+    with usage_scope(consumer, conversation_id) as usage_owner:
+        return _answer_query(message, conversation_id, client_id, language, conversation, usage_owner)
+
+def _answer_query(
+    message: str,
+    conversation_id: Optional[str],
+    client_id: Optional[str],
+    language: Optional[str],
+    conversation: Optional[Conversation],
+    usage_owner: UsageOwner
+) -> Dict[str, Any]:
+    def load_conversation() -> Optional[Conversation]:
+        if conversation is not None:
+            return conversation
+        return get_conversation(conversation_id) if conversation_id else None
+
+    def detect_intent(existing: Optional[Conversation], intent_examples, query_embedding) -> ConversationState:
+        # A new conversation always starts with a greeting
+        if existing is None or not existing.messages:
+            return ConversationState.GREETING
+        return classify_intent(query_embedding, intent_examples)
+
+    def extract_requirements(existing: Optional[Conversation]) -> List[ClientRequirement]:
+        history = [m.content for m in existing.messages if m.role == MessageRole.USER] if existing else []
+        return collect_requirements(history + [message])
+
+    def start_pricing(existing: Optional[Conversation], requirements: List[ClientRequirement]) -> None:
+        # The turn that brings the requirements to three switches to pricing. Its quote
+        # depends on this message, so start it as soon as the requirements are known,
+        # alongside intent classification and retrieval; the pricing step below takes it
+        if existing is None or len(requirements) < PRICING_MIN_REQUIREMENTS:
+            return
+        if existing.state in (ConversationState.REQUIREMENTS, ConversationState.PRICING):
+            speculative_prefetcher.schedule(existing.id, requirements_key(client_id, requirements),
+                                            prefetch_pricing, client_id, list(requirements))
+
+    # 🔀 Independent stages run concurrently; the query embedding is computed once
+    # and shared by intent detection and retrieval
+    graph = StageGraph()
+    graph.add("conversation_load", load_conversation)
+    graph.add("query_embedding", lambda: embed_text(message))
+    graph.add("intent_examples", intent_examples_matrix)
+    graph.add("intent_classification", detect_intent, "conversation_load", "intent_examples", "query_embedding")
+    graph.add("retrieval", search_documents, "query_embedding")
+    graph.add("requirement_extraction", extract_requirements, "conversation_load")
+    graph.add("pricing_start", start_pricing, "conversation_load", "requirement_extraction")
+    # 📊 Quantitative questions may query the tabular knowledge base as a tool
+    graph.add("tool_selection", lambda: tools_for_message(message))
+    try:
+        stages = graph.run()
+    except BedrockOverloadedError:
+        # Answer at once rather than queueing behind a saturated Bedrock
+        return {
+            "conversation_id": conversation_id or str(uuid.uuid4()),
+            "message": OVERLOADED_REPLY,
+            "state": None
+        }
     
-    # Retrieve the conversation or start a new one
-    conversation = get_conversation(conversation_id) or Conversation(
-        id=conversation_id,
+    # Unknown conversation IDs start a new conversation
+    conversation = stages["conversation_load"] or Conversation(
+        id=str(uuid.uuid4()),
         client_id=client_id
     )
+    conversation_id = conversation.id
+    usage_owner.conversation_id = conversation_id
+    context = ConversationContext(
+        state=stages["intent_classification"],
+        language=conversation.language
+    )
+    
+    # Remember the conversation language so later turns can skip re-detection
+    if language:
+        conversation.language = language
     
     # Add the user's new message
     user_message = ChatMessage(
@@ -230,10 +479,28 @@ def process_query(
     )
     conversation.messages.append(user_message)
     
-    # Extract requirements if applicable
-    if context.state == ConversationState.REQUIREMENTS:
-        new_requirements = analyze_requirements(message)
-        context.collected_requirements.extend(new_requirements)
+    # Extract requirements if applicable; they accumulate over the conversation
+    if context.state in (ConversationState.REQUIREMENTS, ConversationState.PRICING):
+        context.collected_requirements = stages["requirement_extraction"]
+    
+    # Move to PRICING once enough requirements are gathered
+    if (context.state == ConversationState.REQUIREMENTS
+            and len(context.collected_requirements) >= PRICING_MIN_REQUIREMENTS):
+        context.state = ConversationState.PRICING
+    
+    # 💰 The quote and its context were usually prefetched during the requirements turns
+    pricing_context: List[str] = []
+    if context.state == ConversationState.PRICING and context.collected_requirements:
+        key = requirements_key(client_id, context.collected_requirements)
+        prefetched = speculative_prefetcher.take(conversation_id, key)
+        if prefetched is not None:
+            context.pricing_info, pricing_context = prefetched
+        else:
+            with timed_stage("pricing"):
+                context.pricing_info = generate_pricing(PricingRequest(
+                    client_id=client_id,
+                    requirements=context.collected_requirements
+                ))
     
     # Format messages (last 5 messages)
     formatted_messages = [
@@ -243,12 +510,26 @@ def process_query(
     
     # Get system prompt based on current state
     system_prompt = SYSTEM_PROMPTS.get(context.state, GREETING_PROMPT)
+    if context.pricing_info:
+        system_prompt += "\n\nQuote for the client's requirements:\n" + format_quote(context.pricing_info)
 
-    # 🔍 RAG: Retrieve relevant documents from the knowledge base
-    kb_context = retrieve_documents_faiss(message)  # You need to implement this
+    # 🔍 RAG: Documents retrieved for the message, then the quote's prefetched context
+    kb_context = list(dict.fromkeys(stages["retrieval"] + pricing_context))
 
     # 🧠 Generate AI response using Claude with context
-    ai_response = generate_ai_response(formatted_messages, system_prompt, kb_context)
+    tools = stages["tool_selection"]
+    # 🔀 Simple turns go to the fast model, substantive ones to the large model
+    route = choose_route(context.state, message, tools)
+    # 🎫 Clients over their token budget get the cheaper model, and far over it
+    # also wait behind other clients' turns for Bedrock capacity
+    budget_action = token_ledger.budget_action(usage_owner.client_id)
+    if budget_action in (BUDGET_DEGRADE, BUDGET_QUEUE):
+        # Without falling back to the large model the budget steered away from
+        route = replace(ROUTES["fast"], fallback=None)
+    priority = PRIORITY_BACKGROUND if budget_action == BUDGET_QUEUE else PRIORITY_INTERACTIVE
+    with bedrock_priority(priority):
+        ai_response = generate_ai_response(formatted_messages, system_prompt, kb_context,
+                                           tools=tools, route=route)
     
     # Save AI response in the conversation
     assistant_message = ChatMessage(
@@ -260,38 +541,55 @@ def process_query(
     # Update timestamp
     conversation.updated_at = datetime.now()
     
-    # Transition to PRICING if enough requirements gathered
-    if context.state == ConversationState.REQUIREMENTS and len(context.collected_requirements) >= 3:
-        context.state = ConversationState.PRICING
+    conversation.state = context.state
 
-    # Save the updated conversation
-    save_conversation(conversation)
+    # Save the turn: only its two messages are written, not the whole conversation
+    with timed_stage("save_conversation"):
+        append_messages(conversation, [user_message, assistant_message])
     
-    # Generate pricing if entering PRICING state
-    if context.state == ConversationState.PRICING and not context.pricing_info:
-        if context.collected_requirements:
-            pricing_request = PricingRequest(
-                client_id=client_id,
-                requirements=context.collected_requirements
-            )
-            context.pricing_info = generate_pricing(pricing_request)
+    # 🔮 Prepare a quote for the requirements so far, in case the client asks for a price
+    # next, and keep a quote already given so follow-up pricing turns repeat it
+    if context.collected_requirements:
+        key = requirements_key(client_id, context.collected_requirements)
+        if context.state == ConversationState.REQUIREMENTS:
+            speculative_prefetcher.schedule(conversation_id, key, prefetch_pricing,
+                                            client_id, list(context.collected_requirements))
+        elif context.state == ConversationState.PRICING and context.pricing_info:
+            speculative_prefetcher.put(conversation_id, key, (context.pricing_info, pricing_context))
     
     # Return response
-    return {
+    response = {
         "conversation_id": conversation_id,
         "message": ai_response,
         "state": context.state
     }
+    if context.pricing_info:
+        response["pricing"] = context.pricing_info.model_dump()
+    return response
 
 
 def retrieve_documents_faiss(query: str, top_k: int = 5) -> List[str]:
-    global faiss_index
+    # Concurrent retrievals for the same query share one embedding and search
+    return list(retrieval_flight.do((query, top_k), _retrieve_documents, query, top_k))
+
+def _retrieve_documents(query: str, top_k: int) -> List[str]:
     if len(document_store) == 0:
         logger.warning("Document store is empty - returning empty list")
         return []
     
-    query_vector = np.array([embed_text(query)]).astype('float32')
-    D, I = faiss_index.search(query_vector, top_k)
+    with timed_stage("retrieval_embedding"):
+        query_embedding = embed_text(query)
+    return search_documents(query_embedding, top_k)
+
+def search_documents(query_embedding: List[float], top_k: int = 5) -> List[str]:
+    """Documents nearest to an already computed query embedding."""
+    if len(document_store) == 0:
+        logger.warning("Document store is empty - returning empty list")
+        return []
+    
+    query_vector = np.array([query_embedding]).astype('float32')
+    with timed_stage("faiss_search"):
+        D, I = faiss_index.search(query_vector, top_k)
     
     # Safely retrieve documents, checking indices
     results = []
@@ -349,10 +647,52 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
     b = np.array(b)
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-9)
 
+def embedding_model_id() -> str:
+    """Identifies the embeddings in use, so stored vectors are not mixed across models."""
+    if DEV_MODE:
+        return f"feature-hashing-{dimension}"
+    return "amazon.titan-embed-text-v2"
+
+def initialize_index():
+    """Build or load the retrieval index; called once when the service starts."""
+    if not INDEX_ON_STARTUP:
+        return
+    try:
+        if not (VECTOR_SNAPSHOT_DIR and snapshot_exists(VECTOR_SNAPSHOT_DIR)):
+            # S3 is only contacted when the index is built from it
+            try:
+                response = s3_client().list_objects_v2(Bucket=bucket_name, MaxKeys=1)
+                logger.info(f"S3 connection successful. Found {response.get('KeyCount', 0)} objects")
+            except Exception as e:
+                logger.error(f"S3 access failed: {str(e)}")
+        if VECTOR_SNAPSHOT_DIR:
+            load_shared_index()
+        else:
+            run_indexing_pipeline()
+        logger.info("FAISS index initialized successfully")
+    except Exception as e:
+        logger.error(f"Error initializing FAISS index: {str(e)}")
+
 def run_indexing_pipeline():
     documents = get_documents_from_s3()
     index_documents_to_faiss(documents)
 
+def load_shared_index(snapshot_dir: str = VECTOR_SNAPSHOT_DIR):
+    """Use the memory-mapped index snapshot shared by all workers, building it if needed."""
+    global document_store
+    global faiss_index
+    if VECTOR_SNAPSHOT_READ_ONLY:
+        # Bundled snapshot (e.g. in the Lambda artifact): map it as is, never build it
+        if not snapshot_exists(snapshot_dir):
+            logger.error(f"No index snapshot in {snapshot_dir}; retrieval is disabled")
+            return
+        faiss_index, document_store = load_snapshot(snapshot_dir)
+    else:
+        faiss_index, document_store = load_or_build_snapshot(
+            snapshot_dir, lambda: embed_documents(get_documents_from_s3())
+        )
+    INDEX_SIZE.set(faiss_index.ntotal)
+
 if __name__ != "__main__":
     # System prompts
     GREETING_PROMPT = """You are a friendly and helpful B2B sales support chatbot. 
@@ -409,49 +749,12 @@ if __name__ != "__main__":
         ]
     }
 
-    s3 = boto3.client('s3')
     bucket_name = 'techrunners'
     logger = logging.getLogger(__name__)
 
-    try:
-        response = s3.list_objects_v2(Bucket=bucket_name, MaxKeys=1)
-        logger.info(f"S3 connection successful. Found {response.get('KeyCount', 0)} objects")
-    except Exception as e:
-        logger.error(f"S3 access failed: {str(e)}")
-
-    try:
-        run_indexing_pipeline()
-        logger.info("FAISS index initialized successfully")
-    except Exception as e:
-        logger.error(f"Error initializing FAISS index: {str(e)}")
-
     # Check if we're in development mode
     DEV_MODE = os.environ.get('DEV_MODE', 'true').lower() == 'true'
 
-    # Initialize AWS Bedrock client
-    if not DEV_MODE:
-        # Try to get credentials from environment variables first
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        aws_region = os.environ.get('AWS_REGION', 'eu-north-1')
-        
-        if aws_access_key and aws_secret_key:
-            logger.info(f"Using AWS credentials from environment variables for region {aws_region}")
-            bedrock_runtime = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=aws_region,
-                aws_access_key_id=aws_access_key,
-                aws_secret_access_key=aws_secret_key
-            )
-        else:
-            # Fall back to credentials file or instance profile
-            logger.info(f"Using AWS credentials from credentials file or instance profile")
-            bedrock_runtime = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=aws_region
-            )
-    else:
-        bedrock_runtime = None
+    # AWS clients are created on first use (see aws_clients)
+    if DEV_MODE:
         logger.info("Using mock AI service in development mode")
-
-    
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from ..database.analytics_store import (
+    analytics_store, FILTER_OPERATORS, AGGREGATES, ANALYTICS_MAX_ROWS
+)
+from .telemetry import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# Let the model query the tabular knowledge base for exact figures
+ANALYTICS_TOOL_ENABLED = os.environ.get('ANALYTICS_TOOL_ENABLED', 'true').lower() == 'true'
+# Tool round trips allowed per reply
+ANALYTICS_MAX_TOOL_CALLS = int(os.environ.get('ANALYTICS_MAX_TOOL_CALLS', '3'))
+
+TOOL_NAME = "query_table"
+
+# Only questions that look quantitative are offered the tool, keeping other prompts small
+_QUANTITATIVE = re.compile(
+    r"\b(average|avg|mean|median|total|sum|how many|number of|count|"
+    r"maximum|minimum|max|min|highest|lowest|largest|smallest|top \d+|percent(age)?)\b",
+    re.IGNORECASE,
+)
+
+_tool_spec: Optional[Dict[str, Any]] = None
+
+
+def _catalogue() -> str:
+    lines = []
+    for table in analytics_store.describe():
+        columns = ", ".join(
+            f"{c['name']} ({c['type']}" + (f": {' / '.join(c['values'])}" if c.get("values") else "") + ")"
+            for c in table["columns"]
+        )
+        lines.append(f"- {table['table']} ({table['rows']} rows): {table['description']}. Columns: {columns}")
+    return "\n".join(lines)
+
+
+def tool_spec() -> Dict[str, Any]:
+    """Anthropic tool definition for querying the knowledge base tables."""
+    global _tool_spec
+    if _tool_spec is None:
+        _tool_spec = {
+            "name": TOOL_NAME,
+            "description": (
+                "Run an exact filter / group-by / aggregate query over the company's tabular data. "
+                "Use it for any figure (averages, totals, counts, rankings) instead of estimating. "
+                "Text comparisons are case-insensitive.\nTables:\n" + _catalogue()
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "table": {"type": "string", "enum": list(analytics_store.tables)},
+                    "filters": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "column": {"type": "string"},
+                                "op": {"type": "string", "enum": list(FILTER_OPERATORS)},
+                                "value": {"description": "A number, a text value, or a list for 'in'"},
+                            },
+                            "required": ["column", "op", "value"],
+                        },
+                    },
+                    "group_by": {"type": "array", "items": {"type": "string"}},
+                    "aggregates": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "function": {"type": "string", "enum": list(AGGREGATES)},
+                                "column": {"type": "string", "description": "Omit for a row count"},
+                            },
+                            "required": ["function"],
+                        },
+                    },
+                    "columns": {"type": "array", "items": {"type": "string"},
+                                "description": "Columns to list when no aggregates are given"},
+                    "order_by": {"type": "string", "description": "A result column, e.g. avg_OrderTotal"},
+                    "descending": {"type": "boolean"},
+                    "limit": {"type": "integer", "minimum": 1, "maximum": ANALYTICS_MAX_ROWS},
+                },
+                "required": ["table"],
+            },
+        }
+    return _tool_spec
+
+
+def tools_for_message(message: str) -> Optional[List[Dict[str, Any]]]:
+    """The tools to offer the model for this message, if any."""
+    if not ANALYTICS_TOOL_ENABLED or not _QUANTITATIVE.search(message):
+        return None
+    try:
+        if not analytics_store.tables:
+            return None
+        return [tool_spec()]
+    except Exception as e:
+        logger.error(f"Error preparing analytics tool: {str(e)}")
+        return None
+
+
+def run_tool(tool_use: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute a `tool_use` block and return the matching `tool_result` block."""
+    result_block = {"type": "tool_result", "tool_use_id": tool_use.get("id")}
+    if tool_use.get("name") != TOOL_NAME:
+        return {**result_block, "content": f"Unknown tool {tool_use.get('name')}", "is_error": True}
+    tool_input = tool_use.get("input") or {}
+    try:
+        with timed_stage("analytics_query"):
+            result = analytics_store.query(tool_input)
+        logger.info(f"Analytics query on {tool_input.get('table')} matched {result['matched_rows']} rows")
+        return {**result_block, "content": json.dumps(result, default=str)}
+    except (ValueError, TypeError, KeyError) as e:
+        # Report invalid queries back so the model can correct them
+        return {**result_block, "content": f"Invalid query: {str(e)}", "is_error": True}
@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# boto3 and botocore are imported with the first client, so importing the
+# app does not pay for them; each client is created once and shared by all
+# threads of the process. Clients are first requested concurrently (stage
+# graph and translation pool threads), and neither boto3's default session
+# nor client creation is thread-safe, so they are built one at a time, under
+# a lock, from a session owned by this module.
+
+_lock = threading.Lock()
+_session = None
+_clients: Dict[Tuple[Any, ...], Any] = {}
+
+
+def _get_session():
+    # Caller holds the lock
+    global _session
+    if _session is None:
+        import boto3.session
+        _session = boto3.session.Session()
+    return _session
+
+
+def _shared_client(key: Tuple[Any, ...], create: Callable[[Any], Any]) -> Any:
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = create(_get_session())
+        return client
+
+
+def _create_client(session, service_name: str, region: str, max_pool_connections: int):
+    from botocore.config import Config as BotoConfig
+
+    config = BotoConfig(max_pool_connections=max_pool_connections)
+    # Try to get credentials from environment variables first
+    aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+    aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+    if aws_access_key and aws_secret_key:
+        logger.info(f"Using AWS credentials from environment variables for {service_name} in {region}")
+        return session.client(
+            service_name,
+            region_name=region,
+            aws_access_key_id=aws_access_key,
+            aws_secret_access_key=aws_secret_key,
+            config=config
+        )
+    # Fall back to credentials file or instance profile
+    logger.info(f"Using AWS credentials from credentials file or instance profile for {service_name} in {region}")
+    return session.client(service_name, region_name=region, config=config)
+
+
+def bedrock_runtime_client():
+    from .bedrock_limiter import BEDROCK_MAX_CONCURRENCY
+    # Enough pooled connections for the limiter's maximum concurrency
+    return _shared_client(("bedrock-runtime",), lambda session: _create_client(
+        session, 'bedrock-runtime', os.environ.get('AWS_REGION', 'eu-north-1'), BEDROCK_MAX_CONCURRENCY))
+
+
+def translate_client(max_pool_connections: int = 10):
+    return _shared_client(("translate", max_pool_connections), lambda session: _create_client(
+        session, 'translate', os.environ.get('AWS_REGION', 'us-east-1'), max_pool_connections))
+
+
+def s3_client():
+    return _shared_client(("s3",), lambda session: session.client('s3'))
@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from .telemetry import (
+    BEDROCK_CONCURRENCY_LIMIT, BEDROCK_IN_FLIGHT, BEDROCK_QUEUE_DEPTH, BEDROCK_SHED, BEDROCK_THROTTLES
+)
+
+logger = logging.getLogger(__name__)
+
+# Adaptive concurrency settings for Bedrock calls (per worker process)
+BEDROCK_INITIAL_CONCURRENCY = int(os.environ.get('BEDROCK_INITIAL_CONCURRENCY', '8'))
+BEDROCK_MIN_CONCURRENCY = int(os.environ.get('BEDROCK_MIN_CONCURRENCY', '1'))
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '32'))
+# Multiplicative decrease applied on throttling or congestion
+BEDROCK_BACKOFF_RATIO = float(os.environ.get('BEDROCK_BACKOFF_RATIO', '0.7'))
+# A call slower than this multiple of the operation's baseline latency counts as congestion
+BEDROCK_LATENCY_TOLERANCE = float(os.environ.get('BEDROCK_LATENCY_TOLERANCE', '2.5'))
+# Generation latency is compared per output token; shorter replies are dominated by fixed
+# overhead and are not used as a congestion signal
+BEDROCK_LATENCY_MIN_OUTPUT_TOKENS = int(os.environ.get('BEDROCK_LATENCY_MIN_OUTPUT_TOKENS', '32'))
+# Minimum time between two decreases, so one burst of slow calls only backs off once
+BEDROCK_DECREASE_COOLDOWN_SECONDS = float(os.environ.get('BEDROCK_DECREASE_COOLDOWN_SECONDS', '1'))
+# Interactive callers are shed after waiting this long, or when this many are already queued
+BEDROCK_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('BEDROCK_QUEUE_TIMEOUT_SECONDS', '5'))
+BEDROCK_MAX_QUEUE = int(os.environ.get('BEDROCK_MAX_QUEUE', '64'))
+
+# Priority classes; interactive chat is always served before background work
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+_PRIORITY_RANK = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 1}
+
+# Bedrock error codes that signal the service wants us to slow down
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+# Priority of the Bedrock calls made by the current request or job
+_priority_var: ContextVar[str] = ContextVar("bedrock_priority", default=PRIORITY_INTERACTIVE)
+
+
+class BedrockOverloadedError(Exception):
+    """The call was shed because Bedrock is saturated."""
+
+
+@contextmanager
+def bedrock_priority(priority: str) -> Iterator[None]:
+    """Run the enclosed Bedrock calls with the given priority class."""
+    if priority not in _PRIORITY_RANK:
+        raise ValueError(f"Unknown priority {priority}")
+    token = _priority_var.set(priority)
+    try:
+        yield
+    finally:
+        _priority_var.reset(token)
+
+
+def current_priority() -> str:
+    """Priority class of the Bedrock calls made from the current context."""
+    return _priority_var.get()
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class CallStats:
+    """Filled in by the caller while it holds a slot; `output_tokens` normalizes its latency."""
+    __slots__ = ("output_tokens",)
+
+    def __init__(self):
+        self.output_tokens: Optional[int] = None
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "granted", "cancelled")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter with a priority queue and load shedding.
+
+    The concurrency limit grows by about one slot per round of successful
+    calls and shrinks by `backoff_ratio` when Bedrock throttles or latency
+    climbs well above the operation's baseline. For calls that report their
+    output tokens the baseline is per output token, since a long reply is
+    slow without Bedrock being congested. Callers over the limit
+    queue by priority; interactive callers are shed (BedrockOverloadedError)
+    rather than queued indefinitely, background callers wait as long as needed.
+    """
+
+    def __init__(self, initial_limit: int = BEDROCK_INITIAL_CONCURRENCY,
+                 min_limit: int = BEDROCK_MIN_CONCURRENCY,
+                 max_limit: int = BEDROCK_MAX_CONCURRENCY,
+                 backoff_ratio: float = BEDROCK_BACKOFF_RATIO,
+                 latency_tolerance: float = BEDROCK_LATENCY_TOLERANCE,
+                 latency_min_output_tokens: int = BEDROCK_LATENCY_MIN_OUTPUT_TOKENS,
+                 decrease_cooldown: float = BEDROCK_DECREASE_COOLDOWN_SECONDS,
+                 queue_timeout: float = BEDROCK_QUEUE_TIMEOUT_SECONDS,
+                 max_queue: int = BEDROCK_MAX_QUEUE):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.latency_min_output_tokens = max(1, latency_min_output_tokens)
+        self.decrease_cooldown = decrease_cooldown
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.throttles = 0
+        self.shed = {priority: 0 for priority in _PRIORITY_RANK}
+        self._queued = {priority: 0 for priority in _PRIORITY_RANK}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._baselines: Dict[str, float] = {}
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        BEDROCK_CONCURRENCY_LIMIT.set(self.limit)
+
+    def _shed(self, priority: str, reason: str) -> BedrockOverloadedError:
+        self.shed[priority] += 1
+        BEDROCK_SHED.labels(priority=priority).inc()
+        logger.warning(f"Shedding {priority} Bedrock call: {reason}")
+        return BedrockOverloadedError(f"Bedrock is overloaded ({reason})")
+
+    def acquire(self, priority: Optional[str] = None) -> None:
+        """Take a concurrency slot, waiting in priority order if none is free."""
+        priority = priority or current_priority()
+        with self._lock:
+            if self.in_flight < int(self.limit) and not any(self._queued.values()):
+                self.in_flight += 1
+                BEDROCK_IN_FLIGHT.inc()
+                return
+            if priority == PRIORITY_INTERACTIVE and self._queued[priority] >= self.max_queue:
+                raise self._shed(priority, f"{self._queued[priority]} calls already queued")
+            waiter = _Waiter(priority)
+            heapq.heappush(self._heap, (_PRIORITY_RANK[priority], next(self._seq), waiter))
+            self._queued[priority] += 1
+            BEDROCK_QUEUE_DEPTH.labels(priority=priority).inc()
+
+        timeout = self.queue_timeout if priority == PRIORITY_INTERACTIVE else None
+        if waiter.event.wait(timeout):
+            return
+        with self._lock:
+            if waiter.granted:
+                # Granted just as the wait timed out
+                return
+            waiter.cancelled = True
+            self._queued[priority] -= 1
+            BEDROCK_QUEUE_DEPTH.labels(priority=priority).dec()
+            raise self._shed(priority, f"no slot within {timeout:.1f}s")
+
+    def _grant_waiters(self) -> None:
+        # Caller holds the lock
+        while self._heap and self.in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self.in_flight += 1
+            self._queued[waiter.priority] -= 1
+            BEDROCK_IN_FLIGHT.inc()
+            BEDROCK_QUEUE_DEPTH.labels(priority=waiter.priority).dec()
+            waiter.event.set()
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+        logger.info(f"Bedrock concurrency limit {previous:.1f} -> {self.limit:.1f} ({reason})")
+
+    def release(self, operation: str, latency: Optional[float] = None, throttled: bool = False,
+                output_tokens: Optional[int] = None) -> None:
+        """Return a slot and adjust the limit from the call's outcome."""
+        with self._lock:
+            self.in_flight -= 1
+            BEDROCK_IN_FLIGHT.dec()
+            if throttled:
+                self.throttles += 1
+                BEDROCK_THROTTLES.inc()
+                self._decrease("throttled")
+            elif latency is not None:
+                unit = "ms"
+                if output_tokens is not None:
+                    unit = "ms per output token"
+                    latency = latency / output_tokens if output_tokens >= self.latency_min_output_tokens else None
+                baseline = self._baselines.get(operation)
+                if latency is not None and baseline is not None and latency > self.latency_tolerance * baseline:
+                    self._decrease(f"{operation} latency {latency * 1000:.1f} {unit}, "
+                                   f"baseline {baseline * 1000:.1f} {unit}")
+                elif self.in_flight + 1 >= int(self.limit):
+                    # Only grow when the current limit is actually in use
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                if latency is not None:
+                    # Slow moving average, so a sustained shift in latency becomes the new normal
+                    self._baselines[operation] = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+            BEDROCK_CONCURRENCY_LIMIT.set(self.limit)
+            self._grant_waiters()
+
+    @contextmanager
+    def slot(self, operation: str, priority: Optional[str] = None) -> Iterator[CallStats]:
+        """Hold a slot for one Bedrock call of the given operation (e.g. "embedding")."""
+        self.acquire(priority)
+        stats = CallStats()
+        start = time.perf_counter()
+        latency = None
+        throttled = False
+        try:
+            yield stats
+            latency = time.perf_counter() - start
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            raise
+        finally:
+            self.release(operation, latency, throttled, stats.output_tokens)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": dict(self._queued),
+                "shed": dict(self.shed),
+                "throttles": self.throttles,
+                "baseline_latency_ms": {op: round(value * 1000, 2) for op, value in self._baselines.items()},
+            }
+
+
+# Shared limiter for every Bedrock call made by this process
+bedrock_limiter = AdaptiveLimiter()
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from ..database.conversation_db import get_conversation
+from ..models.models import Conversation
+
+logger = logging.getLogger(__name__)
+
+# Messages a session may queue while a turn is being answered; further messages are rejected
+WS_MAX_PENDING_TURNS = int(os.environ.get('WS_MAX_PENDING_TURNS', '4'))
+# Largest reply chunk sent in one frame
+WS_FRAME_CHARS = int(os.environ.get('WS_FRAME_CHARS', '400'))
+# A client that does not read a frame within this time is disconnected
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get('WS_SEND_TIMEOUT_SECONDS', '10'))
+# Sessions without a message for this long are closed
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get('WS_IDLE_TIMEOUT_SECONDS', '900'))
+
+# Break after sentence ends, otherwise after any whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+
+
+class ChatSession:
+    """The conversation of one WebSocket client, kept in memory between turns."""
+
+    def __init__(self, client_id: Optional[str] = None, conversation_id: Optional[str] = None,
+                 consumer: Optional[str] = None):
+        self.client_id = client_id
+        # Authenticated consumer the session's token usage is charged to
+        self.consumer = consumer
+        conversation = get_conversation(conversation_id) if conversation_id else None
+        self.conversation = conversation or Conversation(id=str(uuid.uuid4()), client_id=client_id)
+        self.turns = 0
+
+    @property
+    def conversation_id(self) -> str:
+        return self.conversation.id
+
+    @property
+    def language(self) -> Optional[str]:
+        return self.conversation.language
+
+
+def reply_frames(text: str, size: int = WS_FRAME_CHARS) -> Iterator[str]:
+    """Split a reply into chunks of at most `size` characters, preferring sentence ends."""
+    while len(text) > size:
+        window = text[:size]
+        cut = max((m.end() for m in _SENTENCE_END.finditer(window)), default=0)
+        if not cut:
+            cut = window.rfind(" ") + 1 or size
+        yield text[:cut]
+        text = text[cut:]
+    if text:
+        yield text
+
+
+async def send_frame(websocket: WebSocket, frame: Dict[str, Any]) -> None:
+    """Send a JSON frame, waiting at most `WS_SEND_TIMEOUT_SECONDS` for the client to take it."""
+    await asyncio.wait_for(websocket.send_json(jsonable_encoder(frame)), WS_SEND_TIMEOUT_SECONDS)
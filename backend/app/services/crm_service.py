@@ -1,59 +1,228 @@
+import hashlib
 import logging
+import os
+import random
+import threading
+import time
 import uuid
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 import json
-import requests
 from datetime import datetime
 
 from ..models.models import ClientRequirement, OrderInquiry
+from .http_client import outbound_client, OutboundHTTPClient
+from ..database.crm_outbox_db import (
+    enqueue_order,
+    claim_due_orders,
+    mark_delivered,
+    mark_attempt_failed,
+    get_outbox_entry,
+    IdempotencyConflictError,
+)
 
 logger = logging.getLogger(__name__)
 
+# Check if we're in development mode
+DEV_MODE = os.environ.get('DEV_MODE', 'true').lower() == 'true'
+
+# CRM delivery settings
+CRM_API_URL = os.environ.get('CRM_API_URL', '')
+CRM_API_KEY = os.environ.get('CRM_API_KEY', '')
+CRM_TIMEOUT_SECONDS = float(os.environ.get('CRM_TIMEOUT_SECONDS', '10'))
+CRM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('CRM_CONNECT_TIMEOUT_SECONDS', '3'))
+CRM_BATCH_SIZE = int(os.environ.get('CRM_BATCH_SIZE', '20'))
+CRM_MAX_ATTEMPTS = int(os.environ.get('CRM_MAX_ATTEMPTS', '8'))
+CRM_RETRY_BASE_SECONDS = float(os.environ.get('CRM_RETRY_BASE_SECONDS', '1'))
+CRM_RETRY_MAX_SECONDS = float(os.environ.get('CRM_RETRY_MAX_SECONDS', '300'))
+CRM_POLL_INTERVAL_SECONDS = float(os.environ.get('CRM_POLL_INTERVAL_SECONDS', '5'))
+# Statuses with which the CRM rejects the order payload itself; any other error is retried
+CRM_PAYLOAD_REJECTED_STATUSES = (400, 422)
+
 class CRMService:
-    def __init__(self, api_url: str = None, api_key: str = None):
+    def __init__(self, api_url: str = None, api_key: str = None,
+                 http_client: OutboundHTTPClient = None):
         """Initialize CRM service with API credentials."""
-        self.api_url = api_url or "https://api.example-crm.com/v1"  # Replace with actual CRM API
-        self.api_key = api_key
+        self.api_url = (api_url or CRM_API_URL or "https://api.example-crm.com/v1").rstrip("/")  # Replace with actual CRM API
+        self.api_key = api_key or CRM_API_KEY
+        # Without a configured CRM endpoint, development mode simulates the CRM
+        self.simulate = DEV_MODE and not (api_url or CRM_API_URL)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}" if self.api_key else ""
         }
+        # Shared keep-alive client with pooling, circuit breaker and per-host caps
+        self.http = http_client or outbound_client
+        self.timeout = (CRM_CONNECT_TIMEOUT_SECONDS, CRM_TIMEOUT_SECONDS)
+    
+    def create_orders(self, orders: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Create several orders in one CRM call.
+
+        Each order carries its `idempotency_key`; the result maps every key to
+        either `{"order_id": ...}` or `{"error": ..., "retryable": bool}`.
+        Transport errors, open circuits, 5xx and other non-payload error
+        responses are raised so the whole batch is retried. A batch rejected
+        as invalid (400/422) is resent one order at a time, so only the
+        invalid orders fail.
+        """
+        if self.simulate:
+            return {
+                order["idempotency_key"]: {"order_id": f"ORD-{uuid.uuid4().hex[:8].upper()}"}
+                for order in orders
+            }
+        
+        response = self.http.post(
+            f"{self.api_url}/orders/batch",
+            headers=self.headers,
+            json={"orders": orders},
+            timeout=self.timeout
+        )
+        if response.status_code in CRM_PAYLOAD_REJECTED_STATUSES:
+            error = f"CRM rejected order with status {response.status_code}: {response.text[:200]}"
+            if len(orders) == 1:
+                # Retrying the same payload will not help
+                return {orders[0]["idempotency_key"]: {"error": error, "retryable": False}}
+            logger.warning(f"CRM rejected a batch of {len(orders)} orders; resending them one by one")
+            return self._create_orders_one_by_one(orders)
+        if response.status_code >= 400:
+            if response.status_code in (401, 403):
+                # Credentials or permissions are wrong; the orders are kept and retried once fixed
+                logger.error(f"CRM refused the API credentials with status {response.status_code}: "
+                             f"{response.text[:200]}")
+            response.raise_for_status()
+        
+        results = {}
+        for item in response.json().get("results", []):
+            key = item.get("idempotency_key")
+            if item.get("order_id"):
+                results[key] = {"order_id": item["order_id"]}
+            else:
+                results[key] = {"error": item.get("error", "unknown error"),
+                                "retryable": item.get("retryable", True)}
+        for order in orders:
+            results.setdefault(order["idempotency_key"],
+                               {"error": "missing from CRM batch response", "retryable": True})
+        return results
+
+    def _create_orders_one_by_one(self, orders: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        for order in orders:
+            try:
+                results.update(self.create_orders([order]))
+            except Exception as e:
+                results[order["idempotency_key"]] = {"error": str(e), "retryable": True}
+        return results
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(CRM_RETRY_BASE_SECONDS * (2 ** attempts), CRM_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+class CRMOutboxDispatcher:
+    """Background thread that delivers outbox entries to the CRM in batches."""
+    
+    def __init__(self, service: CRMService, batch_size: int = CRM_BATCH_SIZE):
+        self.service = service
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="crm-outbox", daemon=True)
+        self._thread.start()
+        logger.info("CRM outbox dispatcher started")
+    
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info("CRM outbox dispatcher stopped")
+    
+    def wake(self) -> None:
+        """Signal that new entries are waiting."""
+        self._wakeup.set()
+    
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                delivered = self.dispatch_once()
+            except Exception as e:
+                logger.error(f"CRM outbox dispatch error: {str(e)}")
+                delivered = 0
+            if not delivered:
+                self._wakeup.wait(CRM_POLL_INTERVAL_SECONDS)
+                self._wakeup.clear()
     
-    def create_order(self, order_data: Dict) -> str:
-        """Create an order in the CRM system."""
+    def drain(self, timeout: float) -> int:
+        """Deliver due entries in the calling thread until none are left or `timeout` seconds passed.
+
+        For hosts that cannot keep a background thread running (AWS Lambda).
+        Returns the number of entries handled.
+        """
+        deadline = time.monotonic() + timeout
+        handled = 0
+        while time.monotonic() < deadline:
+            count = self.dispatch_once()
+            if not count:
+                break
+            handled += count
+        return handled
+    
+    def dispatch_once(self) -> int:
+        """Deliver one batch of due entries. Returns the number of entries handled."""
+        entries = claim_due_orders(self.batch_size)
+        if not entries:
+            return 0
+        
+        orders = [dict(entry["payload"], idempotency_key=entry["idempotency_key"]) for entry in entries]
         try:
-            # In a real implementation, this would make an API call to a CRM system
-            # For demonstration, we'll simulate a successful response
-            
-            # Simulate API call
-            # response = requests.post(
-            #    f"{self.api_url}/orders",
-            #    headers=self.headers,
-            #    json=order_data
-            # )
-            # response.raise_for_status()
-            # order_id = response.json().get("order_id")
-            
-            # For demonstration, generate a mock order ID
-            order_id = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-            
-            logger.info(f"Created order {order_id} in CRM system")
-            return order_id
-            
+            results = self.service.create_orders(orders)
         except Exception as e:
-            logger.error(f"Error creating order in CRM: {str(e)}")
-            raise ValueError(f"Failed to create order in CRM: {str(e)}")
+            logger.warning(f"CRM batch delivery of {len(entries)} orders failed: {str(e)}")
+            results = {entry["idempotency_key"]: {"error": str(e), "retryable": True} for entry in entries}
+        
+        for entry in entries:
+            result = results[entry["idempotency_key"]]
+            if "order_id" in result:
+                mark_delivered(entry["id"], result["order_id"])
+                logger.info(f"Delivered order {entry['order_id']} to CRM as {result['order_id']}")
+                continue
+            
+            attempts = entry["attempts"] + 1
+            if result.get("retryable", True) and attempts < CRM_MAX_ATTEMPTS:
+                mark_attempt_failed(entry["id"], result["error"], time.time() + retry_delay(attempts))
+            else:
+                mark_attempt_failed(entry["id"], result["error"], None)
+                logger.error(f"Giving up on order {entry['order_id']} after {attempts} attempts: {result['error']}")
+        return len(entries)
 
-# Initialize CRM service
+# Initialize CRM service and its outbox dispatcher
 crm_service = CRMService()
+crm_dispatcher = CRMOutboxDispatcher(crm_service)
+
+def make_idempotency_key(order_data: Dict[str, Any]) -> str:
+    """Derive an idempotency key from the order content (excluding timestamps)."""
+    content = {key: value for key, value in order_data.items() if key != "metadata"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
 
 def create_order_inquiry(
     conversation_id: str,
     client_id: str,
     requirements: List[ClientRequirement],
-    price: float
-) -> str:
-    """Create an order inquiry in the CRM system."""
+    price: float,
+    idempotency_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """Queue an order inquiry for delivery to the CRM system.
+
+    The inquiry is written to the local outbox and acknowledged immediately;
+    the dispatcher delivers it in the background. Repeated calls with the same
+    idempotency key return the original inquiry; reusing the key for a
+    different inquiry raises `IdempotencyConflictError`.
+    """
     try:
         # Create OrderInquiry object
         order_inquiry = OrderInquiry(
@@ -88,17 +257,39 @@ def create_order_inquiry(
             }
         }
         
-        # Create order in CRM
-        order_id = crm_service.create_order(order_data)
-        
-        # Update order inquiry with real order ID
-        order_inquiry.order_id = order_id
-        
-        # In a real implementation, save the order inquiry to database
-        # save_order_inquiry(order_inquiry)
+        # Store in the outbox; the dispatcher delivers it to the CRM
+        entry = enqueue_order(
+            idempotency_key=idempotency_key or make_idempotency_key(order_data),
+            order_id=order_inquiry.order_id,
+            payload=order_data
+        )
+        crm_dispatcher.wake()
         
-        return order_id
+        return {
+            "order_id": entry["order_id"],
+            "status": entry["status"],
+            "crm_order_id": entry["crm_order_id"]
+        }
         
+    except IdempotencyConflictError:
+        raise
     except Exception as e:
         logger.error(f"Error creating order inquiry: {str(e)}")
-        raise ValueError(f"Failed to create order inquiry: {str(e)}") 
\ No newline at end of file
+        raise ValueError(f"Failed to create order inquiry: {str(e)}") 
+
+def get_order_status(order_id: str) -> Optional[Dict[str, Any]]:
+    """Get the CRM delivery state of an order inquiry."""
+    entry = get_outbox_entry(order_id)
+    if not entry:
+        return None
+    return {
+        "order_id": entry["order_id"],
+        "status": entry["status"],
+        "crm_order_id": entry["crm_order_id"],
+        "attempts": entry["attempts"],
+        "last_error": entry["last_error"],
+        "next_attempt_at": datetime.fromtimestamp(entry["next_attempt_at"]).isoformat()
+            if entry["status"] == "pending" else None,
+        "created_at": datetime.fromtimestamp(entry["created_at"]).isoformat(),
+        "updated_at": datetime.fromtimestamp(entry["updated_at"]).isoformat()
+    }
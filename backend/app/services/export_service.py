@@ -0,0 +1,90 @@
+import base64
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+
+from ..database.conversation_db import iter_conversations
+from ..models.models import ConversationState
+
+logger = logging.getLogger(__name__)
+
+# Token required in the X-Export-Token header; the export endpoint is disabled without it
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+# Approximate size of the chunks written to the response
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', '65536'))
+
+
+def encode_cursor(updated_at: str, conversation_id: str) -> str:
+    """Opaque cursor for the export position just after this conversation."""
+    raw = json.dumps([updated_at, conversation_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of `encode_cursor`; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    if not isinstance(updated_at, str) or not isinstance(conversation_id, str):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return updated_at, conversation_id
+
+
+def _local_naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps are naive local time
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def export_conversations(
+    client_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    state: Optional[ConversationState] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Iterator[bytes]:
+    """Stream matching conversations as NDJSON, one conversation with its messages per line.
+
+    Every line carries a `cursor`; passing the last one received resumes the
+    export after that conversation.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    conversations = iter_conversations(client_id=client_id, since=_local_naive(since),
+                                       until=_local_naive(until), state=state, after=after)
+    buffer = bytearray()
+    exported = 0
+    try:
+        for conversation in conversations:
+            if limit is not None and exported >= limit:
+                break
+            record = conversation.model_dump(mode="json")
+            record["cursor"] = encode_cursor(conversation.updated_at.isoformat(), conversation.id)
+            buffer += json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            exported += 1
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+    except Exception as e:
+        # The status line is already sent; clients resume from the last cursor they received
+        logger.error(f"Conversation export aborted after {exported} conversations: {str(e)}")
+        raise
+    if buffer:
+        yield bytes(buffer)
+    logger.info(f"Exported {exported} conversations")
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip-compress a byte stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Outbound HTTP settings shared by all integrations
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '20'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_MAX_PER_HOST = int(os.environ.get('HTTP_MAX_PER_HOST', '10'))
+HTTP_HOST_WAIT_SECONDS = float(os.environ.get('HTTP_HOST_WAIT_SECONDS', '5'))
+HTTP_BREAKER_FAILURES = int(os.environ.get('HTTP_BREAKER_FAILURES', '5'))
+HTTP_BREAKER_RESET_SECONDS = float(os.environ.get('HTTP_BREAKER_RESET_SECONDS', '30'))
+
+
+class OutboundError(Exception):
+    """Raised when an outbound request is refused before reaching the remote host."""
+
+
+class CircuitOpenError(OutboundError):
+    """The host has failed repeatedly and calls are short-circuited."""
+
+
+class HostBusyError(OutboundError):
+    """The per-host concurrency cap was reached and no slot freed up in time."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = HTTP_BREAKER_FAILURES,
+                 reset_timeout: float = HTTP_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                # Let a single probe through to test the host
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def cancel_probe(self) -> None:
+        """Release a half-open probe slot that was granted but never used."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class _HostState:
+    def __init__(self, max_concurrency: int):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker()
+        # Guards the counters below; the client is shared by all threads
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        # Requests sent while every pooled connection was in use; each opens a
+        # connection that is closed afterwards instead of being kept alive
+        self.over_pool = 0
+        self.total_seconds = 0.0
+
+
+class OutboundHTTPClient:
+    """Shared keep-alive HTTP client for outbound integrations.
+
+    Wraps a pooled `requests.Session` with default timeouts, a per-host
+    concurrency cap and a per-host circuit breaker. Responses with 5xx or
+    429 status count as failures for the breaker but are returned to the caller.
+    """
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS,
+                 pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 timeout: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                 max_per_host: int = HTTP_MAX_PER_HOST,
+                 host_wait_seconds: float = HTTP_HOST_WAIT_SECONDS):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.max_per_host = max_per_host
+        self.host_wait_seconds = host_wait_seconds
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> Tuple[str, _HostState]:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostState(self.max_per_host)
+            return host, self._hosts[host]
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request through the pool, honouring the host's breaker and cap."""
+        host, state = self._host(url)
+        if not state.breaker.allow():
+            with state.lock:
+                state.rejected += 1
+            raise CircuitOpenError(f"Circuit open for {host}")
+        if not state.semaphore.acquire(timeout=self.host_wait_seconds):
+            with state.lock:
+                state.rejected += 1
+            # Release the probe slot (if any) so the breaker can recover
+            state.breaker.cancel_probe()
+            raise HostBusyError(f"Too many concurrent requests to {host}")
+
+        kwargs.setdefault("timeout", self.timeout)
+        with state.lock:
+            state.in_flight += 1
+            state.requests += 1
+            state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+            if state.in_flight > self.pool_maxsize:
+                state.over_pool += 1
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            response = self.session.request(method, url, **kwargs)
+            succeeded = response.status_code < 500 and response.status_code != 429
+            return response
+        finally:
+            # Any outcome other than a healthy response, including unexpected exceptions,
+            # counts as a failure, so a half-open probe always gives its slot back
+            with state.lock:
+                state.in_flight -= 1
+                state.total_seconds += time.perf_counter() - start
+                if not succeeded:
+                    state.errors += 1
+            state.semaphore.release()
+            if succeeded:
+                state.breaker.record_success()
+            else:
+                state.breaker.record_failure()
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Per-host request, breaker and connection pool metrics."""
+        with self._lock:
+            states = list(self._hosts.items())
+        hosts = {}
+        for host, state in states:
+            with state.lock:
+                hosts[host] = {
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "rejected": state.rejected,
+                    "in_flight": state.in_flight,
+                    "peak_in_flight": state.peak_in_flight,
+                    "over_pool": state.over_pool,
+                    "pool_maxsize": self.pool_maxsize,
+                    "avg_latency_ms": round(1000 * state.total_seconds / state.requests, 2)
+                        if state.requests else 0.0,
+                    "circuit_state": state.breaker.state,
+                }
+        return {"hosts": hosts}
+
+
+# Shared client for all outbound integrations
+outbound_client = OutboundHTTPClient()
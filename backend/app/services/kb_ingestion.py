@@ -0,0 +1,382 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .bedrock_limiter import bedrock_priority, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Knowledge base ingestion settings
+KB_CHUNK_CHARS = int(os.environ.get('KB_CHUNK_CHARS', '2000'))
+KB_MANIFEST_PATH = os.environ.get('KB_MANIFEST_PATH', 'data/kb_manifest.json')
+KB_CACHE_DIR = os.environ.get('KB_CACHE_DIR', 'data/kb_cache')
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.md', '.markdown', '.txt')
+
+MANIFEST_VERSION = 1
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Spreadsheet exports are often Windows-1252 / Latin-1
+        return data.decode('latin-1')
+
+
+def _pack(prefix: str, pieces: Iterable[str], max_chars: int = KB_CHUNK_CHARS) -> List[str]:
+    """Group pieces into chunks of at most `max_chars`, each starting with `prefix`."""
+    chunks = []
+    current: List[str] = []
+    size = len(prefix)
+    for piece in pieces:
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and size + len(piece) + 1 > max_chars:
+            chunks.append(prefix + "\n".join(current))
+            current, size = [], len(prefix)
+        # A single oversized piece is cut rather than dropped
+        while len(prefix) + len(piece) > max_chars:
+            cut = max_chars - len(prefix)
+            chunks.append(prefix + piece[:cut])
+            piece = piece[cut:]
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append(prefix + "\n".join(current))
+    return chunks
+
+
+def _format_rows(rows: Iterable[Sequence]) -> Iterable[str]:
+    """Render table rows as "column: value" lines, using the first non-empty row as header."""
+    header: Optional[List[str]] = None
+    for row in rows:
+        values = ["" if value is None else str(value).strip() for value in row]
+        if not any(values):
+            continue
+        if header is None:
+            header = [name or f"column_{i + 1}" for i, name in enumerate(values)]
+            continue
+        yield "; ".join(
+            f"{header[i] if i < len(header) else f'column_{i + 1}'}: {value}"
+            for i, value in enumerate(values) if value
+        )
+
+
+def parse_csv(name: str, data: bytes) -> List[str]:
+    reader = csv.reader(io.StringIO(_decode(data), newline=''))
+    return _pack(f"Source: {name}\n", _format_rows(reader))
+
+
+def parse_xlsx(name: str, data: bytes) -> List[str]:
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("openpyxl is required to ingest .xlsx files (pip install openpyxl)")
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    chunks = []
+    try:
+        for sheet in workbook.worksheets:
+            chunks.extend(_pack(f"Source: {name} / {sheet.title}\n",
+                                _format_rows(sheet.iter_rows(values_only=True))))
+    finally:
+        workbook.close()
+    return chunks
+
+
+def parse_markdown(name: str, data: bytes) -> List[str]:
+    """Split Markdown into sections by heading; each chunk carries its heading path."""
+    chunks = []
+    headings: List[str] = []
+    paragraphs: List[str] = []
+
+    def flush():
+        if paragraphs:
+            title = " > ".join(headings)
+            prefix = f"Source: {name}" + (f" - {title}" if title else "") + "\n"
+            chunks.extend(_pack(prefix, paragraphs))
+            paragraphs.clear()
+
+    paragraph: List[str] = []
+    for line in _decode(data).splitlines():
+        stripped = line.strip()
+        if stripped.startswith('#'):
+            paragraphs.append("\n".join(paragraph))
+            paragraph = []
+            flush()
+            level = len(stripped) - len(stripped.lstrip('#'))
+            headings[level - 1:] = [stripped.lstrip('#').strip()]
+        elif not stripped:
+            paragraphs.append("\n".join(paragraph))
+            paragraph = []
+        else:
+            paragraph.append(line)
+    paragraphs.append("\n".join(paragraph))
+    flush()
+    return chunks
+
+
+def parse_text(name: str, data: bytes) -> List[str]:
+    return _pack(f"Source: {name}\n", _decode(data).split("\n\n"))
+
+
+_PARSERS: Dict[str, Callable[[str, bytes], List[str]]] = {
+    '.csv': parse_csv,
+    '.xlsx': parse_xlsx,
+    '.md': parse_markdown,
+    '.markdown': parse_markdown,
+    '.txt': parse_text,
+}
+
+
+def parse_document(name: str, data: bytes) -> List[str]:
+    """Split a knowledge base file into text chunks according to its extension."""
+    extension = os.path.splitext(name)[1].lower()
+    parser = _PARSERS.get(extension, parse_text)
+    return parser(name, data)
+
+
+def is_supported(name: str) -> bool:
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+class LocalSource:
+    """Knowledge base files below a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list_files(self) -> Dict[str, Tuple[float, int]]:
+        """Map of relative path -> (mtime, size) for every supported file."""
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for filename in names:
+                if not is_supported(filename):
+                    continue
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.root)] = (stat.st_mtime, stat.st_size)
+        return files
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+
+class S3Source:
+    """Knowledge base objects below an S3 prefix."""
+
+    def __init__(self, bucket: str, prefix: str = ''):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = None
+
+    def __getstate__(self):
+        # boto3 clients cannot be pickled; each pool process creates its own
+        return {"bucket": self.bucket, "prefix": self.prefix, "_client": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+    def list_files(self) -> Dict[str, Tuple[float, int]]:
+        files = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                if is_supported(obj['Key']):
+                    files[obj['Key']] = (obj['LastModified'].timestamp(), obj['Size'])
+        return files
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+
+def source_from_uri(uri: str):
+    """`s3://bucket/prefix` or a local directory."""
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3Source(bucket, prefix)
+    return LocalSource(uri)
+
+
+def _parse_file(source, key: str) -> Tuple[str, str, List[str]]:
+    # Runs in a pool process: read, hash and parse one file. The path is part of
+    # the hash because chunks are prefixed with it.
+    data = source.read(key)
+    digest = hashlib.sha256(key.encode('utf-8') + b'\0' + data).hexdigest()
+    return key, digest, parse_document(key, data)
+
+
+@dataclass
+class IngestReport:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    chunks_embedded: int = 0
+    total_chunks: int = 0
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+
+    @property
+    def modified(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class KnowledgeBaseIngestor:
+    """Incremental knowledge base ingestion.
+
+    A manifest records the mtime, size and hash (of path and content) of
+    every ingested file. Files whose mtime and size are unchanged are skipped without being
+    read; files that were touched but whose content hash is unchanged are not
+    re-embedded. Chunks and vectors of each file version are cached by
+    content hash, so the full index can be reassembled without re-embedding.
+    """
+
+    def __init__(self, source, embed: Callable[[str], List[float]], embedding_model: str,
+                 manifest_path: str = KB_MANIFEST_PATH, cache_dir: str = KB_CACHE_DIR,
+                 workers: Optional[int] = None, embed_workers: int = 8):
+        self.source = source
+        self.embed = embed
+        self.embedding_model = embedding_model
+        self.manifest_path = manifest_path
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.embed_workers = embed_workers
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if (manifest.get("version") != MANIFEST_VERSION
+                or manifest.get("embedding_model") != self.embedding_model
+                or manifest.get("chunk_chars") != KB_CHUNK_CHARS):
+            # Vectors from another embedding model or chunking cannot be mixed in
+            logger.info("Knowledge base manifest is outdated; re-ingesting everything")
+            return {}
+        return manifest.get("files", {})
+
+    def _save_manifest(self, files: Dict[str, Dict]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        staging = f"{self.manifest_path}.tmp"
+        with open(staging, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "embedding_model": self.embedding_model,
+                       "chunk_chars": KB_CHUNK_CHARS, "updated_at": time.time(), "files": files},
+                      f, indent=2, sort_keys=True)
+        os.replace(staging, self.manifest_path)
+
+    def _cache_paths(self, digest: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, digest)
+        return f"{base}.json", f"{base}.npy"
+
+    def _is_cached(self, digest: str) -> bool:
+        return all(os.path.exists(path) for path in self._cache_paths(digest))
+
+    def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        def embed(chunk: str) -> List[float]:
+            # Ingestion must not starve live chats of Bedrock capacity
+            with bedrock_priority(PRIORITY_BACKGROUND):
+                return self.embed(chunk)
+
+        with ThreadPoolExecutor(max_workers=self.embed_workers) as pool:
+            vectors = list(pool.map(embed, chunks))
+        return np.array(vectors, dtype='float32').reshape(len(chunks), -1)
+
+    def _store(self, digest: str, chunks: List[str], vectors: np.ndarray) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        documents_path, vectors_path = self._cache_paths(digest)
+        np.save(vectors_path, vectors)
+        with open(documents_path, "w") as f:
+            json.dump(chunks, f)
+
+    def ingest(self, force: bool = False, dry_run: bool = False) -> IngestReport:
+        """Bring the manifest and cache up to date with the source.
+
+        `force` re-reads and re-embeds every file; `dry_run` only reports the
+        files that would be read.
+        """
+        report = IngestReport()
+        previous = {} if force else self._load_manifest()
+        current = self.source.list_files()
+
+        to_parse = []
+        files = {}
+        for key, (mtime, size) in current.items():
+            entry = previous.get(key)
+            if entry and entry["mtime"] == mtime and entry["size"] == size and self._is_cached(entry["hash"]):
+                files[key] = entry
+                report.unchanged += 1
+            else:
+                to_parse.append(key)
+        report.removed = sorted(set(previous) - set(current))
+
+        if dry_run:
+            report.added = sorted(k for k in to_parse if k not in previous)
+            report.changed = sorted(k for k in to_parse if k in previous)
+            return report
+
+        start = time.perf_counter()
+        parsed = []
+        if to_parse:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                parsed = list(pool.map(_parse_file, [self.source] * len(to_parse), to_parse))
+        report.parse_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key, digest, chunks in parsed:
+            mtime, size = current[key]
+            entry = previous.get(key)
+            if entry is None:
+                report.added.append(key)
+            elif entry["hash"] != digest or not self._is_cached(digest):
+                report.changed.append(key)
+            else:
+                # Touched but identical content: keep the cached vectors
+                report.unchanged += 1
+            if force or not self._is_cached(digest):
+                self._store(digest, chunks, self._embed_chunks(chunks))
+                report.chunks_embedded += len(chunks)
+            files[key] = {"mtime": mtime, "size": size, "hash": digest, "chunks": len(chunks)}
+        report.embed_seconds = time.perf_counter() - start
+
+        report.total_chunks = sum(entry["chunks"] for entry in files.values())
+        self._save_manifest(files)
+        self._remove_stale_cache(files)
+        return report
+
+    def _remove_stale_cache(self, files: Dict[str, Dict]) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+        live = {entry["hash"] for entry in files.values()}
+        for filename in os.listdir(self.cache_dir):
+            if os.path.splitext(filename)[0] not in live:
+                os.remove(os.path.join(self.cache_dir, filename))
+
+    def assemble(self) -> Tuple[np.ndarray, List[str]]:
+        """Vectors and chunks of every file in the manifest, in a stable order."""
+        files = self._load_manifest()
+        vectors, documents = [], []
+        for key in sorted(files):
+            documents_path, vectors_path = self._cache_paths(files[key]["hash"])
+            with open(documents_path) as f:
+                documents.extend(json.load(f))
+            vectors.append(np.load(vectors_path))
+        if not vectors:
+            return np.zeros((0, 0), dtype='float32'), []
+        return np.concatenate(vectors).astype('float32', copy=False), documents
@@ -1,73 +1,333 @@
 import logging
-import boto3
 import os
-from langdetect import detect, LangDetectException
+import re
+import threading
+import unicodedata
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from langdetect import DetectorFactory, detect_langs, LangDetectException
+from langdetect.detector_factory import init_factory
 from typing import Dict, List, Tuple, Optional
 
+from ..database.translation_memory_db import translation_memory
+from .telemetry import timed_stage, record_cache
+from .aws_clients import translate_client
+
 logger = logging.getLogger(__name__)
 
 # Check if we're in development mode
 DEV_MODE = os.environ.get('DEV_MODE', 'true').lower() == 'true'
 
+# Language detection settings
+MIN_DETECTION_LENGTH = 10
+DETECTION_CACHE_SIZE = int(os.environ.get('LANGUAGE_DETECTION_CACHE_SIZE', '4096'))
+# Minimum confidence needed to move a conversation away from its current language
+LANGUAGE_SWITCH_CONFIDENCE = float(os.environ.get('LANGUAGE_SWITCH_CONFIDENCE', '0.9'))
+
+# Writing system of languages not written in Latin script; a message in another script
+# than the conversation language's is re-detected
+_LANGUAGE_SCRIPTS = {
+    'ru': 'CYRILLIC', 'uk': 'CYRILLIC', 'bg': 'CYRILLIC', 'mk': 'CYRILLIC', 'sr': 'CYRILLIC',
+    'zh-cn': 'CJK', 'zh-tw': 'CJK', 'ja': 'CJK', 'ko': 'HANGUL',
+    'ar': 'ARABIC', 'fa': 'ARABIC', 'ur': 'ARABIC', 'he': 'HEBREW', 'el': 'GREEK',
+    'th': 'THAI', 'hi': 'DEVANAGARI', 'mr': 'DEVANAGARI', 'ne': 'DEVANAGARI',
+}
+# Unicode name prefixes of scripts that share a writing system in _LANGUAGE_SCRIPTS
+_SCRIPT_ALIASES = {'HIRAGANA': 'CJK', 'KATAKANA': 'CJK'}
+# Frequent function words of some Latin-script languages. Detection is skipped only for
+# a message in which the conversation language's function words clearly dominate; any
+# other Latin-script message (including languages not listed here) is re-detected
+_FUNCTION_WORDS = {
+    'en': {'the', 'and', 'is', 'are', 'you', 'we', 'what', 'how', 'with', 'for', 'this', 'can', 'do', 'of'},
+    'de': {'der', 'die', 'das', 'und', 'ist', 'sind', 'wir', 'sie', 'was', 'wie', 'mit', 'für', 'ich', 'nicht'},
+    'fr': {'le', 'la', 'les', 'et', 'est', 'sont', 'nous', 'vous', 'quel', 'avec', 'pour', 'je', 'pas', 'des'},
+    'es': {'el', 'los', 'las', 'y', 'es', 'son', 'nosotros', 'qué', 'cómo', 'con', 'para', 'yo', 'no', 'del'},
+    'it': {'il', 'gli', 'e', 'è', 'sono', 'noi', 'che', 'come', 'con', 'per', 'io', 'non', 'della', 'di'},
+    'pt': {'o', 'os', 'as', 'e', 'é', 'são', 'nós', 'que', 'como', 'com', 'para', 'eu', 'não', 'do'},
+    'nl': {'de', 'het', 'en', 'is', 'zijn', 'wij', 'wat', 'hoe', 'met', 'voor', 'ik', 'niet', 'van', 'een'},
+    'sv': {'och', 'är', 'vi', 'vad', 'hur', 'med', 'för', 'jag', 'inte', 'det', 'en', 'att', 'som', 'på'},
+}
+_WORD = re.compile(r"[^\W\d_]+")
+# Function words of the conversation language a message needs, and how many times more
+# than of any other listed language, to keep the language without detection
+_OWN_WORDS_MIN = 2
+_OWN_WORDS_RATIO = 2
+
+_profiles_lock = threading.Lock()
+_profiles_loaded = False
+
+def load_language_profiles() -> None:
+    """Load langdetect's language profiles (about 300 ms) once per process.
+
+    The app's startup hook calls this in the background, so neither importing
+    the app nor the first request waits for it.
+    """
+    global _profiles_loaded
+    if _profiles_loaded:
+        return
+    with _profiles_lock:
+        if not _profiles_loaded:
+            # Seed langdetect so results are deterministic
+            DetectorFactory.seed = 0
+            init_factory()
+            _profiles_loaded = True
+
+# AWS Translate accepts up to 10,000 bytes per request
+TRANSLATE_MAX_REQUEST_BYTES = 9000
+# Target request size; smaller batches translate in parallel so latency follows the largest one
+TRANSLATE_BATCH_BYTES = min(int(os.environ.get('TRANSLATE_BATCH_BYTES', '2000')), TRANSLATE_MAX_REQUEST_BYTES)
+TRANSLATE_MAX_WORKERS = int(os.environ.get('TRANSLATE_MAX_WORKERS', '8'))
+
+# Markdown line prefixes (headings, quotes, bullets, numbered items) kept out of translation
+_LINE_PREFIX = re.compile(r'^(\s*(?:#{1,6}\s+|>\s*|[-*+]\s+|\d+[.)]\s+)?)(.*?)(\s*)$', re.S)
+# Sentence boundary: terminal punctuation followed by whitespace
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?\u3002\uff01\uff1f])(\s+)')
+_HAS_LETTERS = re.compile(r'[^\W\d_]')
+
+def split_segments(text: str) -> List[Tuple[str, bool]]:
+    """Split text into (piece, translatable) pairs that concatenate back to the input.
+
+    Sentences are translatable; line breaks, markdown prefixes, whitespace and
+    pieces without letters (numbers, prices, separators) are kept verbatim.
+    """
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        body = line.rstrip('\r\n')
+        newline = line[len(body):]
+        prefix, content, trailing = _LINE_PREFIX.match(body).groups()
+        if prefix:
+            pieces.append((prefix, False))
+        for i, part in enumerate(_SENTENCE_BOUNDARY.split(content)):
+            if part:
+                # Odd indexes are the captured whitespace between sentences
+                pieces.append((part, i % 2 == 0 and bool(_HAS_LETTERS.search(part))))
+        if trailing:
+            pieces.append((trailing, False))
+        if newline:
+            pieces.append((newline, False))
+    return pieces
+
+def split_long_segment(text: str, max_bytes: int = TRANSLATE_MAX_REQUEST_BYTES) -> List[str]:
+    """Split an over-long segment at whitespace so every part fits in one request."""
+    parts, current = [], ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if current and len(candidate.encode('utf-8')) > max_bytes:
+            parts.append(current)
+            candidate = word
+        # A single word longer than the limit is cut by characters
+        while len(candidate.encode('utf-8')) > max_bytes:
+            cut = max_bytes // 4
+            parts.append(candidate[:cut])
+            candidate = candidate[cut:]
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
 class TranslationService:
     def __init__(self):
-        if not DEV_MODE:
-            # Try to get credentials from environment variables first
-            aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-            aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-            aws_region = os.environ.get('AWS_REGION', 'us-east-1')
-            
-            if aws_access_key and aws_secret_key:
-                logger.info(f"Using AWS credentials from environment variables for region {aws_region}")
-                self.translate_client = boto3.client(
-                    'translate',
-                    region_name=aws_region,
-                    aws_access_key_id=aws_access_key,
-                    aws_secret_access_key=aws_secret_key
-                )
-            else:
-                # Fall back to credentials file or instance profile
-                logger.info(f"Using AWS credentials from credentials file or instance profile")
-                self.translate_client = boto3.client('translate', region_name=aws_region)
-        else:
-            self.translate_client = None
+        if DEV_MODE:
             logger.info("Using mock translation service in development mode")
         
+        # Bounded pool used to translate the batches of long texts concurrently
+        self.executor = ThreadPoolExecutor(max_workers=TRANSLATE_MAX_WORKERS,
+                                           thread_name_prefix="translate")
+    
+    @property
+    def translate_client(self):
+        # One client shared by all pool workers, with enough connections for each of them
+        return None if DEV_MODE else translate_client(TRANSLATE_MAX_WORKERS)
+        
     def translate(self, text: str, source_language: str, target_language: str) -> str:
-        """Translate text from source language to target language using AWS Translate."""
+        """Translate text from source language to target language using AWS Translate.
+
+        Text is split into sentences which are looked up in the translation memory;
+        only the misses are sent to AWS Translate, in batches.
+        """
         try:
             if DEV_MODE:
                 # Return original text in development mode
                 logger.info(f"Mock translation: {source_language} -> {target_language}")
                 return f"[{target_language}] {text}"
             
-            response = self.translate_client.translate_text(
-                Text=text,
-                SourceLanguageCode=source_language,
-                TargetLanguageCode=target_language
+            pieces = split_segments(text)
+            segments = [piece for piece, translatable in pieces if translatable]
+            if not segments:
+                return text
+            
+            with timed_stage("translation_memory_lookup"):
+                translations = translation_memory.get_many(source_language, target_language, segments)
+            misses = list(dict.fromkeys(seg for seg in segments if seg not in translations))
+            record_cache("translation_memory", hits=len(segments) - len(misses), misses=len(misses))
+            logger.info(f"Translation memory: {len(segments) - len(misses)} hits, {len(misses)} misses")
+            
+            if misses:
+                with timed_stage("aws_translate"):
+                    new_translations = self._translate_segments(misses, source_language, target_language)
+                translation_memory.put_many(source_language, target_language, new_translations)
+                translations.update(new_translations)
+            
+            return "".join(
+                translations.get(piece, piece) if translatable else piece
+                for piece, translatable in pieces
             )
-            return response.get('TranslatedText', '')
         except Exception as e:
             logger.error(f"Translation error: {str(e)}")
             # Fallback to original text if translation fails
             return text
+    
+    def _translate_segments(self, segments: List[str], source_language: str,
+                            target_language: str) -> Dict[str, str]:
+        """Translate segments in size-bounded batches, concurrently when there are several.
+
+        Segments whose batch fails are left out of the result so callers keep the
+        original text for them.
+        """
+        batches = []
+        batch, batch_bytes = [], 0
+        for segment in segments:
+            size = len(segment.encode('utf-8')) + 1
+            if batch and batch_bytes + size > TRANSLATE_BATCH_BYTES:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(segment)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        
+        translate_batch = lambda b: self._translate_batch_safely(b, source_language, target_language)
+        if len(batches) == 1:
+            results = [translate_batch(batches[0])]
+        else:
+            logger.info(f"Translating {len(segments)} segments in {len(batches)} parallel requests")
+            # Carry the request context (trace ID) into the pool threads
+            context = contextvars.copy_context()
+            results = self.executor.map(lambda b: context.copy().run(translate_batch, b), batches)
+        
+        translations = {}
+        for result in results:
+            translations.update(result)
+        return translations
+    
+    def _translate_batch_safely(self, batch: List[str], source_language: str,
+                                target_language: str) -> Dict[str, str]:
+        try:
+            return self._translate_batch(batch, source_language, target_language)
+        except Exception as e:
+            logger.error(f"Translation error for batch of {len(batch)} segments: {str(e)}")
+            return {}
+    
+    def _translate_text(self, text: str, source_language: str, target_language: str) -> str:
+        """Translate a single piece of text, splitting it if it exceeds the request limit."""
+        if len(text.encode('utf-8')) > TRANSLATE_MAX_REQUEST_BYTES:
+            return " ".join(
+                self._translate_text(part, source_language, target_language)
+                for part in split_long_segment(text)
+            )
+        response = self.translate_client.translate_text(
+            Text=text,
+            SourceLanguageCode=source_language,
+            TargetLanguageCode=target_language
+        )
+        return response.get('TranslatedText', text)
+    
+    def _translate_batch(self, batch: List[str], source_language: str,
+                         target_language: str) -> Dict[str, str]:
+        """Translate a batch of segments joined by newlines in a single request."""
+        if len(batch) == 1:
+            return {batch[0]: self._translate_text(batch[0], source_language, target_language)}
+        
+        translated = self._translate_text("\n".join(batch), source_language, target_language).split("\n")
+        if len(translated) == len(batch):
+            return dict(zip(batch, translated))
+        
+        # Line structure was not preserved; translate the segments one by one
+        logger.warning("Batched translation changed line count, retrying per segment")
+        return {
+            segment: self._translate_text(segment, source_language, target_language)
+            for segment in batch
+        }
 
 # Initialize translation service
 translation_service = TranslationService()
 
-def detect_language(text: str) -> str:
-    """Detect the language of the given text."""
+def _dominant_script(text: str) -> Optional[str]:
+    counts: Dict[str, int] = {}
+    for char in text:
+        if char.isalpha():
+            script = unicodedata.name(char, '').split(' ', 1)[0]
+            script = _SCRIPT_ALIASES.get(script, script)
+            counts[script] = counts.get(script, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+def may_have_switched_language(text: str, current_language: str) -> bool:
+    """Cheap check whether a message might not be in the conversation's language.
+
+    Returns False only when the message is clearly in the conversation's
+    language: the same non-Latin script, or Latin script dominated by the
+    language's function words. Everything else goes to the detector, whose
+    confidence decides whether the conversation switches.
+    """
+    script = _dominant_script(text)
+    if script is None:
+        return False
+    if script != _LANGUAGE_SCRIPTS.get(current_language, 'LATIN'):
+        return True
+    if script != 'LATIN':
+        return False
+    words = [word.lower() for word in _WORD.findall(text)]
+    own = sum(word in _FUNCTION_WORDS.get(current_language, ()) for word in words)
+    others = max((sum(word in function_words for word in words)
+                  for language, function_words in _FUNCTION_WORDS.items() if language != current_language),
+                 default=0)
+    return own < _OWN_WORDS_MIN or own < _OWN_WORDS_RATIO * others
+
+@lru_cache(maxsize=DETECTION_CACHE_SIZE)
+def _detect_with_confidence(text: str) -> Tuple[str, float]:
+    """Return the most probable language and its probability (cached)."""
+    load_language_profiles()
+    best = detect_langs(text)[0]
+    return best.lang, best.prob
+
+def detect_language(text: str, current_language: Optional[str] = None) -> str:
+    """Detect the language of the given text.
+
+    If the conversation already has a language, it is kept without running the
+    detector unless the message looks like another language, and then only if
+    the detector is confident enough that the user really switched.
+    """
     try:
         # Clean the text for better detection - remove URLs, emails, special characters
         cleaned_text = text.strip()
         
         # Skip detection for very short texts (less than 10 characters)
-        if len(cleaned_text) < 10:
+        if len(cleaned_text) < MIN_DETECTION_LENGTH:
+            if current_language:
+                return current_language
             logger.warning("Text too short for reliable language detection, defaulting to English")
             return 'en'
+
+        if current_language and not may_have_switched_language(cleaned_text, current_language):
+            # Counted as a hit of the conversation's language, not of the detection cache
+            record_cache("conversation_language", hits=1)
+            return current_language
             
         # Get detected language
-        detected_lang = detect(cleaned_text)
+        hits_before = _detect_with_confidence.cache_info().hits
+        detected_lang, confidence = _detect_with_confidence(cleaned_text)
+        if _detect_with_confidence.cache_info().hits > hits_before:
+            record_cache("language_detection", hits=1)
+        else:
+            record_cache("language_detection", misses=1)
+        
+        if current_language and detected_lang != current_language:
+            if confidence < LANGUAGE_SWITCH_CONFIDENCE:
+                logger.info(f"Keeping conversation language {current_language} "
+                            f"(detected {detected_lang} with confidence {confidence:.2f})")
+                return current_language
+            logger.info(f"Conversation language switched from {current_language} to {detected_lang}")
         
         # Log the detected language for monitoring
         logger.info(f"Detected language: {detected_lang} for text starting with: {cleaned_text[:30]}...")
@@ -75,8 +335,8 @@ def detect_language(text: str) -> str:
         return detected_lang
     except LangDetectException as e:
         logger.error(f"Language detection error: {str(e)}")
-        # Default to English if detection fails
-        return 'en'
+        # Fall back to the conversation language, or English if there is none
+        return current_language or 'en'
 
 def translate_to_english(text: str, source_language: Optional[str] = None) -> str:
     """Translate text to English."""
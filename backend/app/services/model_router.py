@@ -0,0 +1,86 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ..models.models import ConversationState
+from .telemetry import ROUTE_CALLS, ROUTE_COST, ROUTE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Large model for substantive turns, small model for simple ones
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'eu.anthropic.claude-3-7-sonnet-20250219-v1:0')
+BEDROCK_FAST_MODEL_ID = os.environ.get('BEDROCK_FAST_MODEL_ID', 'eu.anthropic.claude-3-haiku-20240307-v1:0')
+BEDROCK_MAX_TOKENS = int(os.environ.get('BEDROCK_MAX_TOKENS', '1024'))
+BEDROCK_FAST_MAX_TOKENS = int(os.environ.get('BEDROCK_FAST_MAX_TOKENS', '300'))
+# Send every turn to the large model when disabled
+MODEL_ROUTING_ENABLED = os.environ.get('MODEL_ROUTING_ENABLED', 'true').lower() == 'true'
+# Messages longer than this (in words) are treated as complex and go to the large model
+ROUTER_COMPLEX_WORDS = int(os.environ.get('ROUTER_COMPLEX_WORDS', '40'))
+
+# USD per 1000 input / output tokens, used for the cost metric
+MODEL_PRICES = {
+    "anthropic.claude-3-7-sonnet": (0.003, 0.015),
+    "anthropic.claude-3-5-sonnet": (0.003, 0.015),
+    "anthropic.claude-3-5-haiku": (0.0008, 0.004),
+    "anthropic.claude-3-haiku": (0.00025, 0.00125),
+}
+
+# States whose turns are short and formulaic enough for the small model; product answers,
+# pricing and order confirmation stay on the large model
+FAST_MODEL_STATES = {
+    ConversationState.GREETING,
+    ConversationState.REQUIREMENTS,
+    ConversationState.HANDOFF,
+    ConversationState.COMPLETED,
+}
+
+_MULTI_PART = re.compile(r"\?.*\?|\b(compare|difference between|versus|vs\.?|explain why)\b", re.IGNORECASE | re.DOTALL)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    name: str
+    model_id: str
+    max_tokens: int
+    fallback: Optional[str] = None
+
+
+ROUTES = {
+    "large": ModelRoute("large", BEDROCK_MODEL_ID, BEDROCK_MAX_TOKENS),
+    "fast": ModelRoute("fast", BEDROCK_FAST_MODEL_ID, BEDROCK_FAST_MAX_TOKENS, fallback="large"),
+}
+
+
+def is_complex(message: str) -> bool:
+    """Long or multi-part questions need the large model whatever the state."""
+    return len(message.split()) > ROUTER_COMPLEX_WORDS or bool(_MULTI_PART.search(message))
+
+
+def choose_route(state: Optional[ConversationState], message: str,
+                 tools: Optional[List[Dict[str, Any]]] = None) -> ModelRoute:
+    """Pick the model for a turn from the dialogue state and the message."""
+    if MODEL_ROUTING_ENABLED and state in FAST_MODEL_STATES and not tools and not is_complex(message):
+        return ROUTES["fast"]
+    return ROUTES["large"]
+
+
+def estimate_cost(model_id: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> float:
+    for name, (input_price, output_price) in MODEL_PRICES.items():
+        if name in model_id:
+            return ((input_tokens or 0) * input_price + (output_tokens or 0) * output_price) / 1000.0
+    return 0.0
+
+
+def record_route_call(route: ModelRoute, latency: float,
+                      input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+    ROUTE_LATENCY.labels(route=route.name).observe(latency)
+    cost = estimate_cost(route.model_id, input_tokens, output_tokens)
+    if cost:
+        ROUTE_COST.labels(route=route.name, model=route.model_id).inc(cost)
+
+
+def record_route_outcome(route: ModelRoute, outcome: str) -> None:
+    """Count a routed generation as "ok", "fallback" (the route failed over) or "error"."""
+    ROUTE_CALLS.labels(route=route.name, outcome=outcome).inc()
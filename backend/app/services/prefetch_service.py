@@ -0,0 +1,118 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from ..models.models import ClientRequirement
+from .single_flight import fingerprint
+from .telemetry import CACHE_EVENTS, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Precompute the pricing turn while the client is still describing requirements
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', '2'))
+# Prefetched results older than this are not used
+PREFETCH_TTL_SECONDS = float(os.environ.get('PREFETCH_TTL_SECONDS', '600'))
+# Conversations with a prefetched result kept per worker
+PREFETCH_MAX_ENTRIES = int(os.environ.get('PREFETCH_MAX_ENTRIES', '1000'))
+# How long a turn waits for a prefetch that is still running before computing it itself
+PREFETCH_WAIT_SECONDS = float(os.environ.get('PREFETCH_WAIT_SECONDS', '2'))
+
+
+def requirements_key(client_id: Optional[str], requirements: List[ClientRequirement]) -> str:
+    """Fingerprint of the inputs a prefetched quote was computed from."""
+    return fingerprint(client_id, sorted((r.feature_id, r.quantity) for r in requirements))
+
+
+class _Prefetch:
+    __slots__ = ("key", "future", "created_at")
+
+    def __init__(self, key: str, future: Future):
+        self.key = key
+        self.future = future
+        self.created_at = time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.created_at > PREFETCH_TTL_SECONDS
+
+
+class SpeculativePrefetcher:
+    """Runs likely next-turn work in the background, one result per conversation.
+
+    A result is only handed out when it was computed from the same inputs
+    (`key`) the caller has now; anything else is discarded as stale.
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_entries: int = PREFETCH_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._entries: "OrderedDict[str, _Prefetch]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, conversation_id: str, key: str, fn: Callable[..., Any], *args) -> None:
+        """Start `fn(*args)` for the conversation unless a fresh result for `key` exists."""
+        if not PREFETCH_ENABLED:
+            return
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                if entry.key == key and not entry.expired():
+                    return
+                # The inputs changed since it was started
+                entry.future.cancel()
+                CACHE_EVENTS.labels(cache="prefetch", result="stale").inc()
+            # Keep the request's trace id on the prefetch logs
+            context = contextvars.copy_context()
+            future = self._executor.submit(context.run, self._run, conversation_id, fn, *args)
+            self._store(conversation_id, _Prefetch(key, future))
+
+    def put(self, conversation_id: str, key: str, result: Any) -> None:
+        """Keep a result computed in the foreground for the conversation's next turn."""
+        if not PREFETCH_ENABLED:
+            return
+        future = Future()
+        future.set_result(result)
+        with self._lock:
+            self._store(conversation_id, _Prefetch(key, future))
+
+    def _store(self, conversation_id: str, entry: _Prefetch) -> None:
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            evicted.future.cancel()
+
+    @staticmethod
+    def _run(conversation_id: str, fn: Callable[..., Any], *args) -> Any:
+        try:
+            return fn(*args)
+        except Exception as e:
+            logger.error(f"Prefetch for conversation {conversation_id} failed: {str(e)}")
+            raise
+
+    def take(self, conversation_id: str, key: str) -> Optional[Any]:
+        """The prefetched result for the conversation if it matches `key`, else None."""
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            record_cache("prefetch", misses=1)
+            return None
+        if entry.key != key or entry.expired():
+            entry.future.cancel()
+            CACHE_EVENTS.labels(cache="prefetch", result="stale").inc()
+            return None
+        try:
+            result = entry.future.result(timeout=PREFETCH_WAIT_SECONDS)
+        except Exception:
+            record_cache("prefetch", misses=1)
+            return None
+        record_cache("prefetch", hits=1)
+        return result
+
+
+speculative_prefetcher = SpeculativePrefetcher()
@@ -0,0 +1,149 @@
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .telemetry import get_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Profiling settings; the middleware is only installed when PROFILING_ENABLED is true
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'data/profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '50'))
+# Token protecting the profile endpoints; also the value expected in the debug header
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_HEADER = "X-Debug-Profile"
+
+# Leaf frames in these modules are idle threads waiting for work
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py")
+_PROFILE_NAME = re.compile(r'^[\w.-]+\.folded$')
+
+
+class StackSampler:
+    """Statistical profiler that periodically samples the stacks of all threads.
+
+    Samples are aggregated as folded stacks (`thread;outer;...;inner count`),
+    the input format of flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """Decides which requests to profile and stores their profiles on disk."""
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 max_files: int = PROFILE_MAX_FILES, token: str = PROFILE_TOKEN):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.token = token
+        # One profile at a time: the sampler sees the whole process
+        self._busy = threading.Lock()
+
+    def should_profile(self, debug_header: Optional[str]) -> bool:
+        # Constant-time comparison so the token cannot be guessed from response timing
+        if debug_header is not None and self.token and hmac.compare_digest(debug_header.encode("utf-8"),
+                                                                           self.token.encode("utf-8")):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self) -> Optional[StackSampler]:
+        """Start sampling, or return None if another profile is in progress."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        sampler = StackSampler()
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: StackSampler, method: str, path: str, duration: float) -> Optional[str]:
+        """Stop sampling and write the profile. Returns the profile name."""
+        try:
+            samples = sampler.stop()
+        finally:
+            self._busy.release()
+        if not samples:
+            return None
+
+        slug = re.sub(r'[^\w]+', '_', path).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{get_trace_id()}-{method.lower()}-{slug}-{int(duration * 1000)}ms.folded"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._rotate()
+            logger.info(f"Wrote profile {name} ({sum(samples.values())} samples)")
+            return name
+        except OSError as e:
+            logger.error(f"Error writing profile: {str(e)}")
+            return None
+
+    def _rotate(self) -> None:
+        profiles = self.list_profiles()
+        for profile in profiles[self.max_files:]:
+            os.remove(os.path.join(self.directory, profile["name"]))
+
+    def list_profiles(self) -> List[Dict]:
+        """Stored profiles, most recent first."""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if _PROFILE_NAME.match(name):
+                stat = os.stat(os.path.join(self.directory, name))
+                profiles.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+        profiles.sort(key=lambda p: p["created_at"], reverse=True)
+        return profiles
+
+    def read_profile(self, name: str) -> Optional[str]:
+        # Only plain profile names, never paths
+        if not _PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+
+# Shared request profiler
+request_profiler = RequestProfiler()
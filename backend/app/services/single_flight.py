@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .telemetry import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of JSON-serializable request parts, used as a single-flight key."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key while it is running wait for and share its
+    result or exception. Works from threads (`do`) and asyncio tasks
+    (`do_async`), and the two can share an in-flight call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                SINGLE_FLIGHT_CALLS.labels(name=self.name, role="shared").inc()
+                return future, False
+            future = Future()
+            self._calls[key] = future
+        SINGLE_FLIGHT_CALLS.labels(name=self.name, role="leader").inc()
+        return future, True
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run `fn` for `key`, or wait for the identical call already in flight."""
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._release(key)
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Async variant; `fn` may be a coroutine function or a blocking function
+        (run in the default executor)."""
+        future, leader = self._claim(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                result = await fn(*args, **kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._release(key)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
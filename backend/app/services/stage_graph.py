@@ -0,0 +1,74 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .telemetry import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# Threads running the stages of concurrent chat turns
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', '32'))
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="stage")
+
+
+class StageGraph:
+    """A small dependency graph of pipeline stages.
+
+    Each stage is called with the results of the stages it depends on and
+    starts as soon as they have finished, so independent stages overlap and
+    the graph takes about as long as its slowest path. Stages run with the
+    caller's context variables (trace ID, Bedrock priority) and are timed
+    under their own name.
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None):
+        self._executor = executor or _executor
+        self._stages: Dict[str, Tuple[Callable[..., Any], Sequence[str]]] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], *depends_on: str) -> "StageGraph":
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self._stages[name] = (fn, depends_on)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """Run every stage and return their results by name.
+
+        The first failing stage's exception is raised once the stages already
+        running have finished; stages not yet started are skipped.
+        """
+        results: Dict[str, Any] = {}
+        pending = dict(self._stages)
+        running: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+        while pending or running:
+            if error is None:
+                ready = [name for name, (_, deps) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    fn, deps = pending.pop(name)
+                    context = contextvars.copy_context()
+                    future = self._executor.submit(context.run, self._run_stage, name, fn,
+                                                   *[results[d] for d in deps])
+                    running[future] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+        if error is not None:
+            raise error
+        return results
+
+    @staticmethod
+    def _run_stage(name: str, fn: Callable[..., Any], *args) -> Any:
+        with timed_stage(name):
+            return fn(*args)
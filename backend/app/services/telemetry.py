@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+# Trace ID of the request being handled, carried into every log record
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
+REQUEST_LATENCY = Histogram(
+    "chatbot_request_latency_seconds",
+    "End-to-end latency of API requests",
+    ["method", "route", "status"],
+)
+STAGE_LATENCY = Histogram(
+    "chatbot_stage_latency_seconds",
+    "Latency of each chat pipeline stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+STAGE_ERRORS = Counter(
+    "chatbot_stage_errors_total",
+    "Exceptions raised by each chat pipeline stage",
+    ["stage"],
+)
+BEDROCK_TOKENS = Counter(
+    "chatbot_bedrock_tokens_total",
+    "Tokens consumed by Bedrock calls",
+    ["model", "direction"],
+)
+CACHE_EVENTS = Counter(
+    "chatbot_cache_events_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "chatbot_single_flight_calls_total",
+    "Coalesced calls by single-flight group; 'shared' calls reused an in-flight result",
+    ["name", "role"],
+)
+BEDROCK_CONCURRENCY_LIMIT = Gauge(
+    "chatbot_bedrock_concurrency_limit",
+    "Current adaptive concurrency limit for Bedrock calls",
+    multiprocess_mode="livesum",
+)
+BEDROCK_IN_FLIGHT = Gauge(
+    "chatbot_bedrock_in_flight",
+    "Bedrock calls currently holding a concurrency slot",
+    multiprocess_mode="livesum",
+)
+BEDROCK_QUEUE_DEPTH = Gauge(
+    "chatbot_bedrock_queue_depth",
+    "Bedrock calls waiting for a concurrency slot",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+BEDROCK_SHED = Counter(
+    "chatbot_bedrock_shed_total",
+    "Bedrock calls rejected by load shedding",
+    ["priority"],
+)
+BEDROCK_THROTTLES = Counter(
+    "chatbot_bedrock_throttles_total",
+    "Bedrock calls that failed with a throttling error",
+)
+ROUTE_LATENCY = Histogram(
+    "chatbot_model_route_latency_seconds",
+    "Latency of Bedrock generation calls per model route",
+    ["route"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+ROUTE_COST = Counter(
+    "chatbot_model_route_cost_usd_total",
+    "Estimated Bedrock generation cost per model route",
+    ["route", "model"],
+)
+ROUTE_CALLS = Counter(
+    "chatbot_model_route_calls_total",
+    "Routed generations by outcome (ok, fallback, error)",
+    ["route", "outcome"],
+)
+TOKEN_BUDGET_ACTIONS = Counter(
+    "chatbot_token_budget_actions_total",
+    "Chat turns of clients over their token budget, by action (degrade, queue)",
+    ["action"],
+)
+GROUP_COMMIT_BATCH = Histogram(
+    "chatbot_group_commit_batch_size",
+    "Writes committed together in one transaction",
+    ["writer"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+INDEX_SIZE = Gauge(
+    "chatbot_index_documents",
+    "Number of documents in the retrieval index",
+    multiprocess_mode="max",
+)
+
+
+# Caller-supplied request IDs end up in logs, response headers and profile file names
+_TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9-]{1,64}")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def trace_id_from_header(value: Optional[str]) -> str:
+    """The caller's request ID if it is a safe trace ID, otherwise a new one."""
+    if value and _TRACE_ID_PATTERN.fullmatch(value):
+        return value
+    return new_trace_id()
+
+
+def get_trace_id() -> str:
+    return trace_id_var.get()
+
+
+def install_log_trace_ids() -> None:
+    """Add a `trace_id` attribute to every log record so formats can use %(trace_id)s."""
+    previous_factory = logging.getLogRecordFactory()
+    if getattr(previous_factory, "_adds_trace_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = previous_factory(*args, **kwargs)
+        record.trace_id = trace_id_var.get()
+        return record
+
+    record_factory._adds_trace_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Record the latency (and failure) of a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+        logger.debug(f"Stage {stage} took {elapsed * 1000:.1f} ms")
+
+
+def record_tokens(model: str, input_tokens: Optional[int], output_tokens: Optional[int] = None) -> None:
+    if input_tokens:
+        BEDROCK_TOKENS.labels(model=model, direction="input").inc(input_tokens)
+    if output_tokens:
+        BEDROCK_TOKENS.labels(model=model, direction="output").inc(output_tokens)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        CACHE_EVENTS.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        CACHE_EVENTS.labels(cache=cache, result="miss").inc(misses)
+
+
+def render_metrics() -> tuple:
+    """Prometheus exposition payload and its content type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Multi-worker deployment: aggregate the metrics of all worker processes
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
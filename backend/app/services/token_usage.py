@@ -0,0 +1,235 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from .telemetry import TOKEN_BUDGET_ACTIONS
+
+logger = logging.getLogger(__name__)
+
+# Sliding window over which token usage is counted and budgets apply
+TOKEN_USAGE_WINDOW_SECONDS = int(os.environ.get('TOKEN_USAGE_WINDOW_SECONDS', '3600'))
+# Granularity of the window; usage older than the window is dropped one bucket at a time
+TOKEN_USAGE_BUCKET_SECONDS = int(os.environ.get('TOKEN_USAGE_BUCKET_SECONDS', '60'))
+# Tokens (input + output) per client and window before it is degraded; 0 disables budgets
+TOKEN_BUDGET_DEFAULT = int(os.environ.get('TOKEN_BUDGET_DEFAULT', '0'))
+# Per-client budgets overriding the default, e.g. "acme=2000000,globex=500000"
+TOKEN_BUDGETS = os.environ.get('TOKEN_BUDGETS', '')
+# Budget shared by all turns without an authenticated consumer
+TOKEN_BUDGET_ANONYMOUS = int(os.environ.get('TOKEN_BUDGET_ANONYMOUS', str(TOKEN_BUDGET_DEFAULT)))
+# Header carrying the consumer authenticated by the API gateway (Kong sets X-Consumer-Username).
+# Turns are charged to this consumer, never to the client_id in the request body
+TOKEN_BUDGET_CONSUMER_HEADER = os.environ.get('TOKEN_BUDGET_CONSUMER_HEADER', 'X-Consumer-Username')
+# Worker processes sharing the traffic; each enforces its share of every budget
+TOKEN_BUDGET_WORKERS = int(os.environ.get('TOKEN_BUDGET_WORKERS', os.environ.get('WEB_CONCURRENCY', '1')))
+# Beyond this multiple of its budget a client's calls also wait behind other traffic
+TOKEN_BUDGET_QUEUE_RATIO = float(os.environ.get('TOKEN_BUDGET_QUEUE_RATIO', '1.5'))
+
+# Token required in the X-Usage-Token header; the usage endpoint is disabled without it
+USAGE_TOKEN = os.environ.get('USAGE_TOKEN', '')
+
+# Owner of chat turns without an authenticated consumer, and of calls made outside any
+# turn (index builds, shared embeddings); no budget applies to the latter
+ANONYMOUS_CLIENT = "anonymous"
+SYSTEM_CLIENT = "system"
+
+# Budget actions, from least to most restrictive
+BUDGET_OK = "ok"
+BUDGET_DEGRADE = "degrade"
+BUDGET_QUEUE = "queue"
+
+
+class UsageOwner:
+    """Client and conversation that the current Bedrock calls are charged to.
+
+    Mutable so a turn that starts a new conversation can charge the rest of
+    its calls to the conversation once it has an ID.
+    """
+    __slots__ = ("client_id", "conversation_id")
+
+    def __init__(self, client_id: Optional[str] = None, conversation_id: Optional[str] = None):
+        self.client_id = client_id
+        self.conversation_id = conversation_id
+
+
+_owner_var: ContextVar[Optional[UsageOwner]] = ContextVar("token_usage_owner", default=None)
+
+
+@contextmanager
+def usage_scope(client_id: Optional[str], conversation_id: Optional[str] = None) -> Iterator[UsageOwner]:
+    """Charge the enclosed Bedrock calls to the given client and conversation."""
+    owner = UsageOwner(client_id, conversation_id)
+    token = _owner_var.set(owner)
+    try:
+        yield owner
+    finally:
+        _owner_var.reset(token)
+
+
+def current_owner() -> UsageOwner:
+    """Owner the current Bedrock calls are charged to; the system outside a usage scope."""
+    return _owner_var.get() or UsageOwner(SYSTEM_CLIENT)
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        client_id, _, tokens = item.strip().partition("=")
+        if not client_id or not tokens:
+            continue
+        try:
+            budgets[client_id.strip()] = int(tokens)
+        except ValueError:
+            logger.error(f"Ignoring invalid token budget {item!r}")
+    return budgets
+
+
+class _Bucket:
+    __slots__ = ("start", "input_tokens", "output_tokens", "calls", "conversations", "models")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self.conversations: Counter = Counter()
+        self.models: Counter = Counter()
+
+
+class TokenLedger:
+    """Sliding-window token usage per client, and the budget action it implies.
+
+    Usage is kept in fixed-size time buckets per client, so memory stays
+    bounded by the number of active clients and the cost of a lookup does
+    not grow with traffic. Counts are per worker process, like the Bedrock
+    concurrency limit, so each worker enforces `1 / workers` of every budget.
+    """
+
+    def __init__(self, window_seconds: int = TOKEN_USAGE_WINDOW_SECONDS,
+                 bucket_seconds: int = TOKEN_USAGE_BUCKET_SECONDS,
+                 default_budget: int = TOKEN_BUDGET_DEFAULT,
+                 budgets: Optional[Dict[str, int]] = None,
+                 queue_ratio: float = TOKEN_BUDGET_QUEUE_RATIO,
+                 anonymous_budget: int = TOKEN_BUDGET_ANONYMOUS,
+                 workers: int = TOKEN_BUDGET_WORKERS):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = max(1, min(bucket_seconds, window_seconds))
+        self.default_budget = default_budget
+        self.budgets = parse_budgets(TOKEN_BUDGETS) if budgets is None else dict(budgets)
+        self.queue_ratio = queue_ratio
+        self.anonymous_budget = anonymous_budget
+        self.workers = max(1, workers)
+        self._buckets: Dict[str, Deque[_Bucket]] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, client_id: str, now: float) -> Optional[Deque[_Bucket]]:
+        # Caller holds the lock
+        buckets = self._buckets.get(client_id)
+        if buckets is None:
+            return None
+        while buckets and buckets[0].start <= now - self.window_seconds:
+            buckets.popleft()
+        if not buckets:
+            del self._buckets[client_id]
+            return None
+        return buckets
+
+    def record(self, model: str, input_tokens: Optional[int], output_tokens: Optional[int] = None,
+               owner: Optional[UsageOwner] = None) -> None:
+        """Charge one Bedrock call to `owner`, by default the current usage scope."""
+        if not input_tokens and not output_tokens:
+            return
+        owner = owner or current_owner()
+        client_id = owner.client_id or ANONYMOUS_CLIENT
+        now = time.monotonic()
+        bucket_start = now - now % self.bucket_seconds
+        with self._lock:
+            buckets = self._expire(client_id, now)
+            if buckets is None:
+                buckets = self._buckets[client_id] = deque()
+            if not buckets or buckets[-1].start != bucket_start:
+                buckets.append(_Bucket(bucket_start))
+            bucket = buckets[-1]
+            bucket.input_tokens += input_tokens or 0
+            bucket.output_tokens += output_tokens or 0
+            bucket.calls += 1
+            total = (input_tokens or 0) + (output_tokens or 0)
+            if owner.conversation_id:
+                bucket.conversations[owner.conversation_id] += total
+            bucket.models[model] += total
+
+    def used(self, client_id: Optional[str]) -> int:
+        """Tokens the client has used within the window."""
+        with self._lock:
+            buckets = self._expire(client_id or ANONYMOUS_CLIENT, time.monotonic())
+            if buckets is None:
+                return 0
+            return sum(b.input_tokens + b.output_tokens for b in buckets)
+
+    def budget_for(self, client_id: Optional[str]) -> int:
+        """This worker's share of the client's budget; 0 if none applies."""
+        if client_id == SYSTEM_CLIENT:
+            return 0
+        if not client_id or client_id == ANONYMOUS_CLIENT:
+            budget = self.anonymous_budget
+        else:
+            budget = self.budgets.get(client_id, self.default_budget)
+        return math.ceil(budget / self.workers) if budget > 0 else 0
+
+    def _status(self, used: int, budget: int) -> str:
+        if budget <= 0 or used < budget:
+            return BUDGET_OK
+        return BUDGET_QUEUE if used >= budget * self.queue_ratio else BUDGET_DEGRADE
+
+    def budget_action(self, client_id: Optional[str]) -> str:
+        """How the client's next turn is served: normally, on the cheaper model, or queued."""
+        budget = self.budget_for(client_id)
+        if budget <= 0:
+            return BUDGET_OK
+        used = self.used(client_id)
+        action = self._status(used, budget)
+        if action == BUDGET_OK:
+            return action
+        TOKEN_BUDGET_ACTIONS.labels(action=action).inc()
+        logger.info(f"Client {client_id} used {used} of {budget} tokens, turn served with action {action}")
+        return action
+
+    def get_usage(self, client_id: Optional[str] = None, top_conversations: int = 10) -> Dict[str, Any]:
+        """Usage within the window, for all clients or one, with each client's budget status."""
+        now = time.monotonic()
+        clients = {}
+        with self._lock:
+            client_ids = [client_id] if client_id else list(self._buckets)
+            for cid in client_ids:
+                buckets = self._expire(cid, now)
+                if buckets is None:
+                    continue
+                conversations: Counter = Counter()
+                models: Counter = Counter()
+                for bucket in buckets:
+                    conversations.update(bucket.conversations)
+                    models.update(bucket.models)
+                input_tokens = sum(b.input_tokens for b in buckets)
+                output_tokens = sum(b.output_tokens for b in buckets)
+                clients[cid] = {
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "total_tokens": input_tokens + output_tokens,
+                    "calls": sum(b.calls for b in buckets),
+                    "models": dict(models),
+                    "top_conversations": dict(conversations.most_common(top_conversations)),
+                }
+        for cid, usage in clients.items():
+            budget = self.budget_for(cid)
+            usage["budget"] = budget or None
+            usage["status"] = self._status(usage["total_tokens"], budget)
+        return {"window_seconds": self.window_seconds, "clients": clients}
+
+
+# Shared ledger for every Bedrock call made by this process
+token_ledger = TokenLedger()
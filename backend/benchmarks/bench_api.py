@@ -0,0 +1,258 @@
+"""Offline benchmark for the chat API.
+
+Runs the FastAPI app in-process against stub Bedrock, Translate and S3
+backends and measures throughput and latency percentiles of `/chat`,
+`/pricing` and `/create-order` across concurrency levels and corpus sizes.
+No network access or AWS credentials are needed.
+
+    python -m benchmarks.bench_api --concurrency 1,8,32 --corpus-sizes 100,1000 \
+        --output bench-results.json
+    python -m benchmarks.bench_api --compare bench-baseline.json --output bench-results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+CHAT_MESSAGES = [
+    "Hello, I'm looking for a platform for our sales team",
+    "What features are included in the Advanced Analytics package?",
+    "We need Basic Integration, Multi-user Access and Custom Reporting",
+    "How much does it cost for a company of 500 people?",
+    "Können Sie mir bitte mehr über die Sicherheitsfunktionen erzählen?",
+    "Nous avons besoin d'un accès mobile et de notifications en temps réel",
+    "That sounds good, let's proceed with the order",
+    "Can I speak to a representative?",
+]
+
+REQUIREMENTS = [
+    {"feature_id": "feat-001", "feature_name": "Basic Integration", "quantity": 1},
+    {"feature_id": "feat-003", "feature_name": "Multi-user Access", "quantity": 3},
+    {"feature_id": "feat-005", "feature_name": "Custom Reporting", "quantity": 1},
+]
+
+
+def configure_environment(data_dir: str) -> None:
+    """Point the app at stub services and throwaway local storage."""
+    os.environ["DEV_MODE"] = "false"
+    os.environ.pop("AWS_ACCESS_KEY_ID", None)
+    os.environ.pop("AWS_SECRET_ACCESS_KEY", None)
+    os.environ["TRANSLATION_MEMORY_DB"] = os.path.join(data_dir, "translation_memory.db")
+    os.environ["CRM_OUTBOX_DB"] = os.path.join(data_dir, "crm_outbox.db")
+    os.environ.setdefault("PROFILING_ENABLED", "false")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_load(client, make_request: Callable[[int], tuple], total: int,
+                   concurrency: int) -> Dict[str, Any]:
+    """Send `total` requests with `concurrency` workers and summarize the latencies."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, path, body = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def endpoint_requests(endpoint: str) -> Callable[[int], tuple]:
+    if endpoint == "chat":
+        # Groups of four requests share a conversation
+        return lambda i: ("POST", "/chat", {
+            "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)],
+            "conversation_id": f"bench-conv-{i // 4}",
+            "client_id": f"bench-client-{i % 10}",
+        })
+    if endpoint == "pricing":
+        return lambda i: ("POST", "/pricing", {
+            "client_id": f"bench-client-{i % 10}",
+            "industry": "retail",
+            "company_size": "large",
+            "requirements": REQUIREMENTS,
+        })
+    if endpoint == "create-order":
+        return lambda i: ("POST", "/create-order", {
+            "conversation_id": f"bench-conv-{i}",
+            "client_id": f"bench-client-{i % 10}",
+            "requirements": REQUIREMENTS,
+            "price": 25000.0 + i,
+        })
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    import httpx
+    from .stubs import StubAWSConfig, StubLatency, install_stub_aws, synthetic_corpus
+
+    stub_config = StubAWSConfig(
+        bedrock_generation=StubLatency(args.bedrock_latency_ms, args.bedrock_latency_ms / 4),
+        bedrock_embedding=StubLatency(args.embedding_latency_ms, args.embedding_latency_ms / 4),
+        translate=StubLatency(args.translate_latency_ms, args.translate_latency_ms / 4),
+    )
+    stubs = install_stub_aws(stub_config)
+
+    from tools.stub_crm import start_stub_crm
+    crm = start_stub_crm(latency_ms=args.crm_latency_ms)
+    os.environ["CRM_API_URL"] = crm.url
+
+    from app.main import app
+    from app.services import ai_service
+    from app.services.crm_service import crm_dispatcher
+
+    crm_dispatcher.start()
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        for corpus_size in args.corpus_sizes:
+            stub_config.corpus = synthetic_corpus(corpus_size)
+            if ai_service.faiss_index is not None:
+                ai_service.faiss_index.reset()
+            ai_service.document_store.clear()
+            index_start = time.perf_counter()
+            ai_service.index_documents_to_faiss(stub_config.corpus)
+            index_seconds = time.perf_counter() - index_start
+
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    # Warm up caches and code paths before measuring
+                    await run_load(client, endpoint_requests(endpoint), min(concurrency, 4), concurrency)
+                    summary = await run_load(client, endpoint_requests(endpoint), args.requests, concurrency)
+                    summary.update(endpoint=endpoint, concurrency=concurrency, corpus_size=corpus_size,
+                                   index_build_seconds=round(index_seconds, 3))
+                    results.append(summary)
+                    print(f"{endpoint:>13} corpus={corpus_size:<6} c={concurrency:<4} "
+                          f"rps={summary['throughput_rps']:<8} p50={summary['p50_ms']:<8} "
+                          f"p95={summary['p95_ms']:<8} p99={summary['p99_ms']:<8} errors={summary['errors']}")
+
+    crm_dispatcher.stop()
+    crm.shutdown()
+    stubs.uninstall()
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "bedrock_latency_ms": args.bedrock_latency_ms,
+            "embedding_latency_ms": args.embedding_latency_ms,
+            "translate_latency_ms": args.translate_latency_ms,
+            "crm_latency_ms": args.crm_latency_ms,
+        },
+        "stub_calls": {"bedrock": stubs.bedrock.calls, "translate": stubs.translate.calls},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """List regressions where p95 latency grew by more than `threshold` (fraction)."""
+    key = lambda r: (r["endpoint"], r["concurrency"], r["corpus_size"])
+    previous = {key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        if change > threshold:
+            regressions.append(
+                f"{result['endpoint']} c={result['concurrency']} corpus={result['corpus_size']}: "
+                f"p95 {before['p95_ms']} -> {result['p95_ms']} ms (+{change:.0%})"
+            )
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the chat API with stubbed AWS services")
+    parser.add_argument("--endpoints", default="chat,pricing,create-order",
+                        type=lambda v: [e for e in v.split(",") if e])
+    parser.add_argument("--concurrency", default="1,8,32", type=parse_int_list)
+    parser.add_argument("--corpus-sizes", default="100,1000", type=parse_int_list)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per measurement")
+    parser.add_argument("--bedrock-latency-ms", type=float, default=800.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=40.0)
+    parser.add_argument("--translate-latency-ms", type=float, default=60.0)
+    parser.add_argument("--crm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.2,
+                        help="Allowed p95 increase over the baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as data_dir:
+        configure_environment(data_dir)
+        report = asyncio.run(run_benchmarks(args))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.regression_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
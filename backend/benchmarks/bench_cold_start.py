@@ -0,0 +1,197 @@
+"""Cold-start benchmark for the Lambda handler.
+
+Starts a fresh interpreter per run, as Lambda does for a new execution
+environment, and measures how long it takes to import the entry point and to
+serve the first requests through Mangum with stub AWS services. Two modes
+are compared:
+
+- `lambda`: `handler.py` with a prebuilt index snapshot bundled on disk
+- `startup-index`: `app.main` with the index built from S3 when it starts
+
+    python -m benchmarks.bench_cold_start --runs 5 --corpus-size 500 --output cold-start.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .bench_api import git_revision, percentile
+
+MODES = ("lambda", "startup-index")
+
+
+def api_gateway_event(method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Minimal API Gateway (REST, proxy integration) event."""
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": method,
+        "headers": {"content-type": "application/json", "host": "bench.execute-api.local"},
+        "multiValueHeaders": {},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "pathParameters": {"proxy": path.lstrip("/")},
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": "/{proxy+}", "httpMethod": method, "path": path, "stage": "Prod",
+            "requestId": "bench", "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+def build_snapshot(directory: str, corpus_size: int) -> None:
+    """Write the snapshot the deployment artifact would bundle, with stub embeddings."""
+    import numpy as np
+    from app.database.vector_store import save_snapshot
+    from .stubs import _stub_embedding, synthetic_corpus
+
+    documents = [content for _, content in synthetic_corpus(corpus_size)]
+    vectors = np.array([_stub_embedding(content) for content in documents], dtype="float32")
+    save_snapshot(directory, vectors, documents)
+
+
+def child(mode: str, corpus_size: int, embedding_latency_ms: float) -> Dict[str, Any]:
+    """Runs inside the fresh interpreter; returns the timings of one cold start."""
+    start = time.perf_counter()
+    from .stubs import StubAWSConfig, StubLatency, install_stub_aws, synthetic_corpus
+
+    install_stub_aws(StubAWSConfig(
+        bedrock_generation=StubLatency(0, 0),
+        bedrock_embedding=StubLatency(embedding_latency_ms, 0),
+        translate=StubLatency(0, 0),
+        s3=StubLatency(0, 0),
+        corpus=synthetic_corpus(corpus_size),
+    ))
+    stub_seconds = time.perf_counter() - start
+
+    import_start = time.perf_counter()
+    if mode == "lambda":
+        import handler
+        invoke = handler.lambda_handler
+    else:
+        from mangum import Mangum
+        from app.main import app
+        from app.services.ai_service import initialize_index
+        from app.services.crm_service import crm_dispatcher
+        initialize_index()
+        crm_dispatcher.start()
+        invoke = Mangum(app, lifespan="off")
+    init_seconds = time.perf_counter() - import_start
+
+    timings = {}
+    for name, event in (
+        ("first_request", api_gateway_event("GET", "/")),
+        ("first_chat", api_gateway_event("POST", "/chat", {"message": "What features are included?"})),
+        ("warm_chat", api_gateway_event("POST", "/chat", {"message": "Do you offer mobile access?"})),
+    ):
+        request_start = time.perf_counter()
+        response = invoke(event, None)
+        timings[f"{name}_ms"] = round((time.perf_counter() - request_start) * 1000, 1)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"{name} returned {response['statusCode']}: {response.get('body')}")
+
+    from app.services import ai_service
+    return {
+        "mode": mode,
+        "init_ms": round(init_seconds * 1000, 1),
+        "stub_setup_ms": round(stub_seconds * 1000, 1),
+        **timings,
+        "indexed_documents": len(ai_service.document_store),
+        "faiss_loaded": "faiss" in sys.modules,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_cold_start(mode: str, corpus_size: int, embedding_latency_ms: float,
+                   data_dir: str, snapshot_dir: str) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update({
+        "DEV_MODE": "false",
+        "PROFILING_ENABLED": "false",
+        "TRANSLATION_MEMORY_DB": os.path.join(data_dir, f"{mode}-translation_memory.db"),
+        "CRM_OUTBOX_DB": os.path.join(data_dir, f"{mode}-crm_outbox.db"),
+    })
+    env.pop("AWS_ACCESS_KEY_ID", None)
+    env.pop("AWS_SECRET_ACCESS_KEY", None)
+    if mode == "lambda":
+        env.update(VECTOR_SNAPSHOT_DIR=snapshot_dir, VECTOR_SNAPSHOT_READ_ONLY="true")
+    else:
+        env.update(VECTOR_SNAPSHOT_DIR="", VECTOR_SNAPSHOT_READ_ONLY="false", INDEX_ON_STARTUP="true")
+
+    process_start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", mode,
+         "--corpus-size", str(corpus_size), "--embedding-latency-ms", str(embedding_latency_ms)],
+        env=env, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} cold start failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = round((time.perf_counter() - process_start) * 1000, 1)
+    return result
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {"mode": runs[0]["mode"], "runs": len(runs)}
+    for key in ("init_ms", "first_request_ms", "first_chat_ms", "warm_chat_ms", "process_ms", "max_rss_mb"):
+        values = [run[key] for run in runs]
+        summary[f"{key}_p50"] = round(percentile(values, 50), 1)
+        summary[f"{key}_max"] = round(max(values), 1)
+    summary["indexed_documents"] = runs[0]["indexed_documents"]
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure Lambda cold starts with stubbed AWS services")
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: [m for m in v.split(",") if m])
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per mode")
+    parser.add_argument("--corpus-size", type=int, default=500)
+    parser.add_argument("--embedding-latency-ms", type=float, default=5.0)
+    parser.add_argument("--output", default="cold-start-results.json")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, args.corpus_size, args.embedding_latency_ms)))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cold-start-") as data_dir:
+        snapshot_dir = os.path.join(data_dir, "vector_index")
+        build_snapshot(snapshot_dir, args.corpus_size)
+        for mode in args.modes:
+            runs = [run_cold_start(mode, args.corpus_size, args.embedding_latency_ms, data_dir, snapshot_dir)
+                    for _ in range(args.runs)]
+            summary = summarize(runs)
+            results.append({**summary, "samples": runs})
+            print(f"{mode:>14} init={summary['init_ms_p50']:<8} first_request={summary['first_request_ms_p50']:<8} "
+                  f"first_chat={summary['first_chat_ms_p50']:<8} warm_chat={summary['warm_chat_ms_p50']:<8} "
+                  f"process={summary['process_ms_p50']:<8} rss={summary['max_rss_mb_p50']}MB")
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"runs": args.runs, "corpus_size": args.corpus_size,
+                   "embedding_latency_ms": args.embedding_latency_ms},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
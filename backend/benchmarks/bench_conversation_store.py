@@ -0,0 +1,133 @@
+"""Conversation store write benchmark.
+
+Concurrent writers each grow their own conversation turn by turn against a
+fresh SQLite store, persisting every turn either by appending its two
+messages to the log (`append_messages`) or by rewriting the whole
+conversation (`save_conversation`). Reports messages per second and the
+per-turn write latency, whose growth with conversation length shows whether
+a turn's cost depends on the history.
+
+    python -m benchmarks.bench_conversation_store --writers 16 --turns 500 --output store.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .bench_api import git_revision, percentile
+
+MODES = ("append", "rewrite")
+
+
+def child(mode: str, writers: int, turns: int, message_words: int) -> Dict[str, Any]:
+    """Runs in a fresh interpreter so the store module reads its own CONVERSATION_DB_PATH."""
+    import logging
+    logging.disable(logging.INFO)
+    from app.database import conversation_db
+    from app.models.models import ChatMessage, Conversation, MessageRole
+
+    latencies: List[List[float]] = [[] for _ in range(writers)]
+
+    def write_turns(index: int) -> None:
+        conversation = Conversation(id=f"bench-{index}", client_id="bench")
+        for turn in range(turns):
+            messages = [ChatMessage(role=MessageRole.USER, content=f"question {turn} " * message_words),
+                        ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {turn} " * message_words)]
+            conversation.messages.extend(messages)
+            conversation.updated_at = datetime.now()
+            start = time.perf_counter()
+            if mode == "append":
+                conversation_db.append_messages(conversation, messages)
+            else:
+                conversation_db.save_conversation(conversation)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=write_turns, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Latency of the first and last tenth of each conversation's turns
+    tenth = max(1, turns // 10)
+    early = [lat for per_writer in latencies for lat in per_writer[:tenth]]
+    late = [lat for per_writer in latencies for lat in per_writer[-tenth:]]
+    everything = [lat for per_writer in latencies for lat in per_writer]
+    stored = conversation_db.get_conversation("bench-0")
+    if stored is None or len(stored.messages) != 2 * turns:
+        raise RuntimeError("Stored conversation does not match what was written")
+    return {
+        "mode": mode,
+        "messages_per_second": round(2 * writers * turns / elapsed, 1),
+        "turn_p50_ms": round(percentile(everything, 50) * 1000, 3),
+        "turn_p99_ms": round(percentile(everything, 99) * 1000, 3),
+        "early_turn_p50_ms": round(percentile(early, 50) * 1000, 3),
+        "late_turn_p50_ms": round(percentile(late, 50) * 1000, 3),
+        "db_bytes": sum(os.path.getsize(os.environ["CONVERSATION_DB_PATH"] + suffix)
+                        for suffix in ("", "-wal") if os.path.exists(os.environ["CONVERSATION_DB_PATH"] + suffix)),
+    }
+
+
+def run_mode(mode: str, writers: int, turns: int, message_words: int, directory: str) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env["CONVERSATION_DB_PATH"] = os.path.join(directory, f"{mode}.db")
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_conversation_store", "--child", mode,
+         "--writers", str(writers), "--turns", str(turns), "--message-words", str(message_words)],
+        env=env, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure conversation store write throughput")
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: [m for m in v.split(",") if m])
+    parser.add_argument("--writers", type=int, default=16, help="Concurrent conversations")
+    parser.add_argument("--turns", type=int, default=200, help="Turns per conversation")
+    parser.add_argument("--message-words", type=int, default=20)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, args.writers, args.turns, args.message_words)))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="conversation-store-") as directory:
+        for mode in args.modes:
+            result = run_mode(mode, args.writers, args.turns, args.message_words, directory)
+            results.append(result)
+            print(f"{mode:>8} msgs/s={result['messages_per_second']:<10} p50={result['turn_p50_ms']:<8} "
+                  f"p99={result['turn_p99_ms']:<8} early_p50={result['early_turn_p50_ms']:<8} "
+                  f"late_p50={result['late_turn_p50_ms']}")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {"writers": args.writers, "turns": args.turns, "message_words": args.message_words},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Startup budget check.
+
+Imports each module in a fresh interpreter and measures the import time and
+the resident memory it adds, then fails if importing the app exceeds the
+budget. Worker start-up (autoscaling, `reload=True`) pays this cost before
+the first request.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget-ms 800 --budget-rss-mb 100 --output startup.json
+    python -m benchmarks.bench_startup --slowest 15
+
+Budgets default to `STARTUP_BUDGET_MS` and `STARTUP_BUDGET_RSS_MB`.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .bench_api import git_revision, percentile
+
+MODULES = [
+    "app.models.models",
+    "app.services.telemetry",
+    "app.database.conversation_db",
+    "app.services.language_service",
+    "app.services.analytics_service",
+    "app.services.ai_service",
+    "app.services.crm_service",
+    "app.main",
+]
+
+BUDGET_MODULE = "app.main"
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", "1000"))
+STARTUP_BUDGET_RSS_MB = float(os.environ.get("STARTUP_BUDGET_RSS_MB", "120"))
+
+# Runs in the fresh interpreter; RSS comes from /proc so it reflects current, not peak, memory
+_CHILD = """
+import importlib, json, os, sys, time
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+before = rss_mb()
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+after = rss_mb()
+print(json.dumps({"import_ms": elapsed * 1000, "rss_mb": after, "rss_added_mb": after - before,
+                  "heavy_modules": sorted(m for m in ("boto3", "botocore", "faiss", "openpyxl") if m in sys.modules)}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # Measure the production configuration without touching AWS
+    env.setdefault("DEV_MODE", "false")
+    env.setdefault("PROFILING_ENABLED", "false")
+    return env
+
+
+def backend_dir() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> Dict[str, Any]:
+    completed = subprocess.run([sys.executable, "-c", _CHILD, module], env=child_env(), cwd=backend_dir(),
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, count: int) -> List[Dict[str, Any]]:
+    """The slowest top-level imports under `module`, by cumulative time (python -X importtime)."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               env=child_env(), cwd=backend_dir(), capture_output=True, text=True)
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        # Depth 1 entries are the modules imported directly or first pulled in by the app
+        if match and len(match.group(3)) <= 3:
+            entries.append({"module": match.group(4), "cumulative_ms": int(match.group(2)) / 1000})
+    return sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)[:count]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import time and memory and check the startup budget")
+    parser.add_argument("--modules", default=",".join(MODULES), type=lambda v: [m for m in v.split(",") if m])
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per module")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--budget-rss-mb", type=float, default=STARTUP_BUDGET_RSS_MB)
+    parser.add_argument("--slowest", type=int, default=10, help="Slowest imports of the app to list")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in args.modules:
+        samples = [measure(module) for _ in range(args.runs)]
+        result = {
+            "module": module,
+            "import_ms_p50": round(percentile([s["import_ms"] for s in samples], 50), 1),
+            "import_ms_max": round(max(s["import_ms"] for s in samples), 1),
+            "rss_mb": round(percentile([s["rss_mb"] for s in samples], 50), 1),
+            "rss_added_mb": round(percentile([s["rss_added_mb"] for s in samples], 50), 1),
+            "heavy_modules": samples[0]["heavy_modules"],
+        }
+        results.append(result)
+        print(f"{module:<34} import={result['import_ms_p50']:>7} ms  rss={result['rss_mb']:>6} MB "
+              f"(+{result['rss_added_mb']} MB)" + (f"  loads {', '.join(result['heavy_modules'])}"
+                                                  if result["heavy_modules"] else ""))
+
+    slowest = slowest_imports(BUDGET_MODULE, args.slowest) if args.slowest else []
+    if slowest:
+        print(f"\nSlowest imports under {BUDGET_MODULE}:")
+        for entry in slowest:
+            print(f"  {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+
+    failures = []
+    app_result = next((r for r in results if r["module"] == BUDGET_MODULE), None)
+    if app_result is None:
+        app_result = measure(BUDGET_MODULE)
+        app_result = {"import_ms_p50": app_result["import_ms"], "rss_mb": app_result["rss_mb"]}
+    if app_result["import_ms_p50"] > args.budget_ms:
+        failures.append(f"{BUDGET_MODULE} imports in {app_result['import_ms_p50']} ms "
+                        f"(budget {args.budget_ms:g} ms)")
+    if app_result["rss_mb"] > args.budget_rss_mb:
+        failures.append(f"{BUDGET_MODULE} uses {app_result['rss_mb']} MB after import "
+                        f"(budget {args.budget_rss_mb:g} MB)")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "budget": {"module": BUDGET_MODULE, "import_ms": args.budget_ms, "rss_mb": args.budget_rss_mb},
+            "results": results,
+            "slowest_imports": slowest,
+            "failures": failures,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    for failure in failures:
+        print(f"BUDGET EXCEEDED {failure}")
+    if not failures:
+        print(f"\n{BUDGET_MODULE} is within budget ({args.budget_ms:g} ms, {args.budget_rss_mb:g} MB)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Conversation replay load generator.
+
+Replays multi-turn sales dialogues (greeting -> QA -> requirements -> pricing
+-> confirmation) against the chat API with N concurrent sessions. Each session
+keeps the `conversation_id` returned by its first turn. Reports latency and
+error rate per dialogue state.
+
+Against a live deployment:
+
+    python -m benchmarks.load_replay --url http://localhost:8000 --sessions 200 --concurrency 20
+
+In-process against the ASGI app with stub AWS services:
+
+    python -m benchmarks.load_replay --in-process --sessions 50 --concurrency 10 --think-time-ms 0
+
+Recorded conversations are read from a JSON or JSONL file (`--scenarios`).
+Each conversation is `{"name": ..., "turns": [{"state": ..., "message": ...,
+"think_time_ms": ...}]}`; `state` labels the turn in the report and
+`think_time_ms` is optional.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from .bench_api import configure_environment, summarize
+
+SYNTHETIC_TURNS = {
+    "greeting": [
+        "Hello, I'm looking for a solution for our operations team",
+        "Hi there, can you help me with your platform?",
+        "Good morning, I'd like some information about your products",
+    ],
+    "product_qa": [
+        "What features are included in Advanced Analytics?",
+        "Does the platform support role-based access control?",
+        "Can you tell me more about your data migration service?",
+        "Do you offer mobile applications for field staff?",
+    ],
+    "requirements": [
+        "We need Basic Integration with our ERP",
+        "Multi-user Access is a must for our 200 employees",
+        "We also require Custom Reporting and Advanced Security",
+        "Real-time Notifications would be nice but optional",
+    ],
+    "pricing": [
+        "How much would that cost?",
+        "Can you give me a quote for these features?",
+    ],
+    "confirmation": [
+        "That sounds good, let's proceed with the order",
+        "I'm interested, please prepare the order",
+    ],
+    "handoff": [
+        "Can I speak to a representative?",
+        "I'd rather talk to a human about the contract",
+    ],
+}
+
+# Synthetic dialogue shapes: list of (state, number of turns)
+SYNTHETIC_FLOWS = {
+    "full": [("greeting", 1), ("product_qa", 2), ("requirements", 3), ("pricing", 1), ("confirmation", 1)],
+    "qa_only": [("greeting", 1), ("product_qa", 3)],
+    "handoff": [("greeting", 1), ("product_qa", 1), ("requirements", 2), ("pricing", 1), ("handoff", 1)],
+}
+
+
+def synthetic_conversation(flow: str, rng: random.Random) -> Dict[str, Any]:
+    turns = []
+    for state, count in SYNTHETIC_FLOWS[flow]:
+        for message in rng.sample(SYNTHETIC_TURNS[state], min(count, len(SYNTHETIC_TURNS[state]))):
+            turns.append({"state": state, "message": message})
+    return {"name": flow, "turns": turns}
+
+
+def load_scenarios(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    return data if isinstance(data, list) else data["conversations"]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SYNTHETIC_FLOWS:
+            raise argparse.ArgumentTypeError(f"Unknown flow {name}; choose from {', '.join(SYNTHETIC_FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ReplayStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.observed_states: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        states = sorted(set(self.latencies) | set(self.errors))
+        per_state = {}
+        for state in states:
+            summary = summarize(self.latencies[state], self.errors[state], elapsed)
+            summary.pop("throughput_rps")
+            summary["observed_states"] = dict(self.observed_states[state])
+            per_state[state] = summary
+        all_latencies = [l for values in self.latencies.values() for l in values]
+        overall = summarize(all_latencies, sum(self.errors.values()), elapsed)
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "sessions_completed": self.sessions_completed,
+            "sessions_failed": self.sessions_failed,
+            "overall": overall,
+            "per_state": per_state,
+        }
+
+
+async def run_session(client, conversation: Dict[str, Any], client_id: str, think_time_ms: float,
+                      rng: random.Random, stats: ReplayStats) -> None:
+    conversation_id = None
+    failed = False
+    for turn in conversation["turns"]:
+        state = turn.get("state", "unknown")
+        body = {"message": turn["message"], "client_id": client_id}
+        if conversation_id:
+            body["conversation_id"] = conversation_id
+        start = time.perf_counter()
+        try:
+            response = await client.post("/chat", json=body)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        if ok:
+            data = response.json()
+            conversation_id = data.get("conversation_id", conversation_id)
+            stats.latencies[state].append(elapsed)
+            stats.observed_states[state][str(data.get("state"))] += 1
+        else:
+            stats.errors[state] += 1
+            failed = True
+
+        # Exponentially distributed think time around the mean, unless the turn sets it
+        pause_ms = turn.get("think_time_ms")
+        if pause_ms is None and think_time_ms > 0:
+            pause_ms = rng.expovariate(1.0 / think_time_ms)
+        if pause_ms:
+            await asyncio.sleep(pause_ms / 1000.0)
+
+    if failed:
+        stats.sessions_failed += 1
+    else:
+        stats.sessions_completed += 1
+
+
+async def replay(client, conversations: List[Dict[str, Any]], concurrency: int,
+                 think_time_ms: float, seed: int) -> Dict[str, Any]:
+    stats = ReplayStats()
+    queue = iter(enumerate(conversations))
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        for i, conversation in queue:
+            await run_session(client, conversation, f"load-client-{i % 50}", think_time_ms, rng, stats)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return stats.report(time.perf_counter() - start)
+
+
+def build_conversations(args) -> List[Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    if args.scenarios:
+        recorded = load_scenarios(args.scenarios)
+        return [recorded[i % len(recorded)] for i in range(args.sessions)]
+    flows, weights = zip(*args.mix.items())
+    return [synthetic_conversation(rng.choices(flows, weights)[0], rng) for _ in range(args.sessions)]
+
+
+async def main_async(args) -> Dict[str, Any]:
+    import httpx
+
+    conversations = build_conversations(args)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            return await replay(client, conversations, args.concurrency, args.think_time_ms, args.seed)
+
+    from .stubs import StubAWSConfig, StubLatency, install_stub_aws, synthetic_corpus
+    stub_config = StubAWSConfig(
+        bedrock_generation=StubLatency(args.bedrock_latency_ms, args.bedrock_latency_ms / 4),
+    )
+    stubs = install_stub_aws(stub_config)
+    try:
+        from app.main import app
+        from app.services import ai_service
+        stub_config.corpus = synthetic_corpus(args.corpus_size)
+        if ai_service.faiss_index is not None:
+            ai_service.faiss_index.reset()
+        ai_service.document_store.clear()
+        ai_service.index_documents_to_faiss(stub_config.corpus)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+            return await replay(client, conversations, args.concurrency, args.think_time_ms, args.seed)
+    finally:
+        stubs.uninstall()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay multi-turn sales conversations against the chat API")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running deployment")
+    target.add_argument("--in-process", action="store_true", help="Run the ASGI app in-process with stub AWS")
+    parser.add_argument("--scenarios", help="Recorded conversations (JSON or JSONL)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("full=0.6,qa_only=0.3,handoff=0.1"),
+                        help="Weights of the synthetic flows, e.g. full=0.6,qa_only=0.3,handoff=0.1")
+    parser.add_argument("--sessions", type=int, default=100, help="Conversations to replay")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent sessions")
+    parser.add_argument("--think-time-ms", type=float, default=2000.0, help="Mean pause between turns")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--corpus-size", type=int, default=500, help="In-process only")
+    parser.add_argument("--bedrock-latency-ms", type=float, default=800.0, help="In-process only")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.in_process:
+        with tempfile.TemporaryDirectory(prefix="replay-") as data_dir:
+            configure_environment(data_dir)
+            report = asyncio.run(main_async(args))
+    else:
+        report = asyncio.run(main_async(args))
+
+    for state, summary in report["per_state"].items():
+        print(f"{state:>13} n={summary['requests']:<6} errors={summary['error_rate']:<7.2%} "
+              f"p50={summary['p50_ms']:<8} p95={summary['p95_ms']:<8} p99={summary['p99_ms']}")
+    overall = report["overall"]
+    print(f"{'overall':>13} n={overall['requests']:<6} errors={overall['error_rate']:<7.2%} "
+          f"p50={overall['p50_ms']:<8} p95={overall['p95_ms']:<8} p99={overall['p99_ms']} "
+          f"turns/s={overall['throughput_rps']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["sessions_failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""In-process stand-ins for the AWS services used by the backend.
+
+`install_stub_aws()` patches `boto3.client` (and `Session.client`) so that Bedrock Runtime, Translate
+and S3 clients created afterwards are stubs with configurable latency. Install
+the stubs before importing `app.main`.
+"""
+import hashlib
+import io
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+import numpy as np
+
+EMBEDDING_DIMENSION = 1536
+
+WORDS = (
+    "integration analytics security reporting migration dashboard customer order invoice "
+    "pricing support mobile access notifications workflow warehouse shipment retail "
+    "enterprise contract renewal region discount quantity feature platform api data"
+).split()
+
+
+@dataclass
+class StubLatency:
+    """Simulated service latency in milliseconds (mean and uniform jitter)."""
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+
+    def sleep(self) -> None:
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+
+@dataclass
+class StubAWSConfig:
+    bedrock_generation: StubLatency = field(default_factory=lambda: StubLatency(800, 200))
+    bedrock_embedding: StubLatency = field(default_factory=lambda: StubLatency(40, 10))
+    translate: StubLatency = field(default_factory=lambda: StubLatency(60, 20))
+    s3: StubLatency = field(default_factory=lambda: StubLatency(5, 2))
+    corpus: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def synthetic_corpus(size: int, words_per_doc: int = 120, seed: int = 42) -> List[Tuple[str, str]]:
+    """Deterministic (doc_id, content) pairs resembling product and order documents."""
+    rng = random.Random(seed)
+    return [
+        (f"docs/doc-{i:06d}.txt", " ".join(rng.choice(WORDS) for _ in range(words_per_doc)))
+        for i in range(size)
+    ]
+
+
+def _stub_embedding(text: str) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).astype("float32")
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+class StubBedrockRuntime:
+    def __init__(self, config: StubAWSConfig):
+        self.config = config
+        self.calls: Dict[str, int] = {}
+
+    def invoke_model(self, modelId: str, body: str, contentType: Optional[str] = None, **kwargs):
+        self.calls[modelId] = self.calls.get(modelId, 0) + 1
+        request = json.loads(body)
+        if "embed" in modelId:
+            self.config.bedrock_embedding.sleep()
+            payload = {
+                "embedding": _stub_embedding(request["inputText"]),
+                "inputTextTokenCount": len(request["inputText"].split()),
+            }
+        else:
+            self.config.bedrock_generation.sleep()
+            prompt_words = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            text = ("Thank you for your question. Based on our product information, "
+                    "the requested features are available. Would you like a quote?")
+            payload = {
+                "content": [{"type": "text", "text": text}],
+                "usage": {"input_tokens": prompt_words + len(request.get("system", "").split()),
+                          "output_tokens": len(text.split())},
+            }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+class StubTranslate:
+    def __init__(self, config: StubAWSConfig):
+        self.config = config
+        self.calls = 0
+
+    def translate_text(self, Text: str, SourceLanguageCode: str, TargetLanguageCode: str, **kwargs):
+        self.calls += 1
+        self.config.translate.sleep()
+        return {"TranslatedText": Text, "SourceLanguageCode": SourceLanguageCode,
+                "TargetLanguageCode": TargetLanguageCode}
+
+
+class StubS3:
+    def __init__(self, config: StubAWSConfig):
+        self.config = config
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", MaxKeys: int = 1000, **kwargs):
+        self.config.s3.sleep()
+        keys = [doc_id for doc_id, _ in self.config.corpus if doc_id.startswith(Prefix)][:MaxKeys]
+        return {"KeyCount": len(keys), "Contents": [{"Key": key, "Size": 0} for key in keys]}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        self.config.s3.sleep()
+        content = dict(self.config.corpus)[Key]
+        return {"Body": io.BytesIO(content.encode("utf-8"))}
+
+
+class StubAWS:
+    """Holds the stub clients handed out by the patched `boto3.client`."""
+
+    def __init__(self, config: StubAWSConfig):
+        self.config = config
+        self.bedrock = StubBedrockRuntime(config)
+        self.translate = StubTranslate(config)
+        self.s3 = StubS3(config)
+        self._original_client = None
+        self._original_session_client = None
+
+    def client(self, service_name: str, *args, **kwargs):
+        if service_name == "bedrock-runtime":
+            return self.bedrock
+        if service_name == "translate":
+            return self.translate
+        if service_name == "s3":
+            return self.s3
+        raise ValueError(f"No stub for AWS service {service_name}")
+
+    def install(self) -> "StubAWS":
+        self._original_client = boto3.client
+        self._original_session_client = boto3.session.Session.client
+        boto3.client = self.client
+        # The app creates its clients from its own session
+        boto3.session.Session.client = lambda session, *args, **kwargs: self.client(*args, **kwargs)
+        return self
+
+    def uninstall(self) -> None:
+        if self._original_client is not None:
+            boto3.client = self._original_client
+            boto3.session.Session.client = self._original_session_client
+
+
+def install_stub_aws(config: Optional[StubAWSConfig] = None) -> StubAWS:
+    """Route all new boto3 clients to in-process stubs."""
+    return StubAWS(config or StubAWSConfig()).install()
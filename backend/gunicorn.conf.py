@@ -0,0 +1,37 @@
+"""Gunicorn configuration for multi-worker production deployments.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Workers share the memory-mapped index snapshot, the SQLite conversation store
+and aggregated Prometheus metrics (see `configure_shared_state` in run.py).
+"""
+import os
+import shutil
+
+# prometheus_client picks its per-process value store when it is first imported, so
+# the metrics directory must be set, and emptied of previous runs' files, before
+# anything imports it (run.py and the app do, through telemetry)
+_metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "data/prometheus")
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+from prometheus_client import multiprocess  # noqa: E402
+
+from run import configure_shared_state  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '80')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    configure_shared_state(rebuild_index=os.getenv("REBUILD_INDEX", "false").lower() == "true",
+                           workers=server.cfg.workers)
+
+
+def child_exit(server, worker):
+    # Drop the live-gauge files of workers that exited
+    multiprocess.mark_process_dead(worker.pid)
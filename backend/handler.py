@@ -0,0 +1,77 @@
+"""AWS Lambda entry point (`handler.lambda_handler`, see template.yaml).
+
+Wraps the FastAPI app with Mangum for API Gateway events. The app, the
+memory-mapped index snapshot bundled under `data/vector_index` and the boto3
+clients (created on first use) are kept for the life of the execution
+environment and reused by every warm invocation.
+
+CRM orders are delivered before the invocation that queued them returns:
+a frozen environment runs no background threads, and one that is reaped
+takes the /tmp outbox with it.
+
+Build the snapshot before packaging; the function never embeds the corpus:
+
+    python -m tools.ingest_kb knowledgebase --snapshot-dir data/vector_index
+"""
+import logging
+import os
+import time
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The artifact is read-only; only /tmp is writable
+os.environ.setdefault("VECTOR_SNAPSHOT_DIR", os.path.join(_ROOT, "data", "vector_index"))
+os.environ.setdefault("VECTOR_SNAPSHOT_READ_ONLY", "true")
+os.environ.setdefault("ANALYTICS_DATA_DIR", os.path.join(_ROOT, "knowledgebase"))
+os.environ.setdefault("TRANSLATION_MEMORY_DB", "/tmp/translation_memory.db")
+os.environ.setdefault("CRM_OUTBOX_DB", "/tmp/crm_outbox.db")
+os.environ.setdefault("PROFILE_DIR", "/tmp/profiles")
+
+# Longest time an invocation spends delivering queued CRM orders before it returns
+CRM_DRAIN_SECONDS = float(os.environ.get("CRM_DRAIN_SECONDS", "5"))
+# Invocation time kept free after the drain
+_DRAIN_MARGIN_SECONDS = 1.0
+
+_init_start = time.perf_counter()
+
+from mangum import Mangum
+
+from app.main import app
+from app.services.ai_service import initialize_index
+from app.services.crm_service import crm_dispatcher
+from app.services.language_service import load_language_profiles
+
+logger = logging.getLogger(__name__)
+
+# Mangum would run the app's startup and shutdown hooks around every invocation, so
+# their work is done once here. The analytics tables are not preloaded: a loader
+# thread would be frozen between invocations, and they load on first use. For the
+# same reason the CRM outbox dispatcher thread is not started; see drain_outbox.
+initialize_index()
+load_language_profiles()
+_handler = Mangum(app, lifespan="off")
+
+INIT_SECONDS = time.perf_counter() - _init_start
+logger.info(f"Lambda execution environment initialised in {INIT_SECONDS * 1000:.0f} ms")
+
+
+def drain_outbox(context) -> None:
+    """Deliver the CRM orders that are due, within the invocation's remaining time."""
+    budget = CRM_DRAIN_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - _DRAIN_MARGIN_SECONDS)
+    if budget <= 0:
+        return
+    try:
+        delivered = crm_dispatcher.drain(budget)
+        if delivered:
+            logger.info(f"Delivered {delivered} CRM outbox entries before returning")
+    except Exception as e:
+        logger.error(f"CRM outbox drain failed: {str(e)}")
+
+
+def lambda_handler(event, context):
+    try:
+        return _handler(event, context)
+    finally:
+        drain_outbox(context)
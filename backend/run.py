@@ -1,30 +1,74 @@
 import uvicorn
+import argparse
 import logging
 import os
+import shutil
+from typing import Optional
 from dotenv import load_dotenv
 
+from app.services.telemetry import install_log_trace_ids
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
+# Configure logging (every record carries the trace ID of the current request)
+install_log_trace_ids()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     handlers=[
         logging.StreamHandler(),
         logging.FileHandler("app.log")
     ]
 )
 
+def configure_shared_state(rebuild_index: bool = False, workers: Optional[int] = None) -> None:
+    """Point all workers at the shared, file-backed state (set before workers start)."""
+    if workers:
+        # Per-worker limits (token budgets) are split across this many workers
+        os.environ["WEB_CONCURRENCY"] = str(workers)
+    os.environ.setdefault("VECTOR_SNAPSHOT_DIR", "data/vector_index")
+    os.environ.setdefault("CONVERSATION_DB_PATH", "data/conversations.db")
+    metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "data/prometheus")
+    
+    # Metric files of previous runs must not be aggregated into this one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    
+    if rebuild_index:
+        from app.database.vector_store import remove_snapshot
+        remove_snapshot(os.environ["VECTOR_SNAPSHOT_DIR"])
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the B2B Sales Support Chatbot API")
+    parser.add_argument("--production", action="store_true",
+                        default=os.getenv("APP_ENV", "development") == "production",
+                        help="Run multiple workers without auto-reload (default when APP_ENV=production)")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+                        help="Worker processes in production mode")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Discard the shared index snapshot so it is rebuilt on start")
+    args = parser.parse_args()
+    
     # Get port from environment or use default
     port = int(os.getenv("PORT", "80"))
     
-    # Start the FastAPI application
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+    if args.production:
+        configure_shared_state(rebuild_index=args.rebuild_index, workers=args.workers)
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=port,
+            workers=args.workers,
+            log_level="info"
+        )
+    else:
+        # Start the FastAPI application
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=port,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Keep the local state the app opens (translation memory, CRM outbox, profiles) out of the
+# working tree, and never contact AWS; set before any app module is imported
+_STATE_DIR = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ.setdefault("DEV_MODE", "true")
+os.environ.setdefault("INDEX_ON_STARTUP", "false")
+os.environ.setdefault("TRANSLATION_MEMORY_DB", os.path.join(_STATE_DIR, "translation_memory.db"))
+os.environ.setdefault("CRM_OUTBOX_DB", os.path.join(_STATE_DIR, "crm_outbox.db"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(_STATE_DIR, "profiles"))
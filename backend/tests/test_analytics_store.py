@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from app.database.analytics_store import AnalyticsStore, QueryError
+from app.services import analytics_service
+
+
+@pytest.fixture
+def store(tmp_path):
+    lines = ["Province,OrderSource,OrderTotal"] + [f"{p},{s},{i}" for i, (p, s) in
+                                                  enumerate([("WA", "web"), ("WA", "phone"), ("OR", "web")] * 5)]
+    (tmp_path / "orders.csv").write_text("\n".join(lines) + "\n")
+    return AnalyticsStore(data_dir=str(tmp_path), tables={"orders": ("orders.csv", "Orders")})
+
+
+def test_limit_is_clamped(store):
+    assert len(store.query({"table": "orders", "limit": 4})["rows"]) == 4
+    for limit in (-5, 0):
+        result = store.query({"table": "orders", "limit": limit})
+        assert len(result["rows"]) == 1 and result["truncated"]
+    assert len(store.query({"table": "orders", "limit": 10 ** 9})["rows"]) == 15
+
+
+@pytest.mark.parametrize("query", [
+    {"table": "orders", "limit": "10"},
+    {"table": "orders", "limit": 2.5},
+    {"table": "orders", "limit": True},
+    {"table": "orders", "aggregates": ["sum"]},
+    {"table": "orders", "aggregates": {"function": "count"}},
+    {"table": "orders", "filters": ["Province = WA"]},
+    {"table": "orders", "filters": [None]},
+    {"table": "orders", "group_by": [{"column": "Province"}], "aggregates": [{"function": "count"}]},
+    ["orders"],
+    # A string is not a list of values, for numeric or text columns
+    {"table": "orders", "filters": [{"column": "OrderTotal", "op": "in", "value": "123"}]},
+    {"table": "orders", "filters": [{"column": "Province", "op": "in", "value": "WA"}]},
+])
+def test_malformed_queries_raise_query_error(store, query):
+    with pytest.raises(QueryError):
+        store.query(query)
+
+
+def test_malformed_tool_input_is_reported_to_the_model(store, monkeypatch):
+    monkeypatch.setattr(analytics_service, "analytics_store", store)
+    result = analytics_service.run_tool({"id": "t1", "name": analytics_service.TOOL_NAME,
+                                         "input": {"table": "orders", "aggregates": ["count"]}})
+    assert result["is_error"] and result["tool_use_id"] == "t1"
+
+    result = analytics_service.run_tool({"id": "t2", "name": analytics_service.TOOL_NAME,
+                                         "input": {"table": "orders", "group_by": ["Province"],
+                                                   "aggregates": [{"function": "count"}], "limit": 5}})
+    assert "is_error" not in result
+    assert sorted(json.loads(result["content"])["rows"]) == [["OR", 5], ["WA", 10]]
+
+
+def test_numeric_in_filter_matches_the_listed_values(store):
+    result = store.query({"table": "orders", "filters": [{"column": "OrderTotal", "op": "in", "value": [1, "3"]}]})
+    assert len(result["rows"]) == 2
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import boto3.session
+
+from app.services import aws_clients
+
+
+def test_clients_are_created_once_and_one_at_a_time(monkeypatch):
+    monkeypatch.setattr(aws_clients, "_session", None)
+    monkeypatch.setattr(aws_clients, "_clients", {})
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    sessions = []
+    created = []
+    active = []
+    overlapping = []
+    original_init = boto3.session.Session.__init__
+
+    def init(session, *args, **kwargs):
+        sessions.append(session)
+        original_init(session, *args, **kwargs)
+
+    def client(session, service_name, **kwargs):
+        active.append(service_name)
+        overlapping.append(len(active) > 1)
+        time.sleep(0.02)
+        created.append((session, service_name))
+        active.remove(service_name)
+        return object()
+
+    monkeypatch.setattr(boto3.session.Session, "__init__", init)
+    monkeypatch.setattr(boto3.session.Session, "client", client)
+
+    results = []
+    start = threading.Barrier(12)
+
+    def first_use(factory):
+        start.wait()
+        results.append((factory.__name__, factory()))
+
+    factories = [aws_clients.bedrock_runtime_client, aws_clients.translate_client, aws_clients.s3_client] * 4
+    threads = [threading.Thread(target=first_use, args=(factory,)) for factory in factories]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sessions) == 1
+    assert sorted(name for _, name in created) == ["bedrock-runtime", "s3", "translate"]
+    assert all(session is sessions[0] for session, _ in created)
+    assert not any(overlapping)
+    # Every thread got the same shared client for its service
+    assert all(len({id(c) for name, c in results if name == factory.__name__}) == 1 for factory in factories)
@@ -0,0 +1,41 @@
+from app.services.bedrock_limiter import AdaptiveLimiter
+
+
+def make_limiter():
+    return AdaptiveLimiter(initial_limit=8, max_limit=8, decrease_cooldown=0)
+
+
+def settle(limiter, operation, latency, output_tokens=None, calls=20):
+    for _ in range(calls):
+        limiter.acquire()
+        limiter.release(operation, latency, output_tokens=output_tokens)
+
+
+def test_long_generation_is_not_congestion():
+    limiter = make_limiter()
+    settle(limiter, "generation_fast", 0.5, output_tokens=50)
+    # Ten times the tokens at the same speed per token
+    settle(limiter, "generation_fast", 5.0, output_tokens=500, calls=1)
+    assert limiter.limit == 8
+
+
+def test_slower_generation_per_token_backs_off():
+    limiter = make_limiter()
+    settle(limiter, "generation_fast", 0.5, output_tokens=50)
+    settle(limiter, "generation_fast", 2.0, output_tokens=50, calls=1)
+    assert limiter.limit < 8
+
+
+def test_short_replies_are_not_a_latency_signal():
+    limiter = make_limiter()
+    settle(limiter, "generation_fast", 1.0, output_tokens=100)
+    settle(limiter, "generation_fast", 0.4, output_tokens=2, calls=5)
+    assert limiter.limit == 8
+    assert limiter.get_metrics()["baseline_latency_ms"]["generation_fast"] == 10.0
+
+
+def test_embedding_latency_is_compared_per_call():
+    limiter = make_limiter()
+    settle(limiter, "embedding", 0.05)
+    settle(limiter, "embedding", 0.5, calls=1)
+    assert limiter.limit < 8
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+
+REPLY = " ".join(f"Sentence number {i} of a long reply." for i in range(40))
+
+
+@pytest.fixture
+def turns(monkeypatch):
+    """Replace the chat pipeline with a canned reply; records the arguments of each turn."""
+    calls = []
+
+    async def run_chat_turn(message, conversation_id, client_id, conversation=None, consumer=None):
+        calls.append({"message": message, "client_id": client_id, "consumer": consumer})
+        if message == "slow":
+            await asyncio.sleep(0.3)
+        return {"conversation_id": conversation_id, "message": REPLY, "state": "greeting",
+                "detected_language": "en"}
+
+    monkeypatch.setattr(main, "run_chat_turn", run_chat_turn)
+    return calls
+
+
+def test_reply_is_streamed_as_deltas_then_done(turns):
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/chat?client_id=acme", headers={"X-Consumer-Username": "acme-gw"}) as ws:
+        session = ws.receive_json()
+        assert session["type"] == "session"
+        ws.send_json({"message": "Hello"})
+        assert ws.receive_json() == {"type": "start", "turn": 1}
+        deltas = []
+        frame = ws.receive_json()
+        while frame["type"] == "delta":
+            assert frame["turn"] == 1
+            deltas.append(frame["text"])
+            frame = ws.receive_json()
+    assert len(deltas) > 1
+    assert "".join(deltas) == REPLY
+    assert frame == {"type": "done", "turn": 1, "conversation_id": session["conversation_id"],
+                     "state": "greeting", "detected_language": "en"}
+    # Usage is charged to the consumer the gateway authenticated
+    assert turns == [{"message": "Hello", "client_id": "acme", "consumer": "acme-gw"}]
+
+
+@pytest.mark.parametrize("raw", ["not json", '["Hello"]', '{"message": "  "}', '{"message": 42}'])
+def test_invalid_message_gets_an_error_frame_and_the_session_continues(turns, raw):
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.receive_json()
+        ws.send_text(raw)
+        frame = ws.receive_json()
+        assert frame["type"] == "error"
+        assert "message" in frame["detail"]
+        ws.send_json({"message": "Hello"})
+        assert ws.receive_json()["type"] == "start"
+    assert [call["message"] for call in turns] == ["Hello"]
+
+
+def test_disconnect_mid_stream_ends_the_session(turns, caplog):
+    client = TestClient(main.app)
+    with caplog.at_level(logging.INFO, logger="app.main"):
+        with client.websocket_connect("/ws/chat") as ws:
+            session = ws.receive_json()
+            ws.send_json({"message": "slow"})
+            assert ws.receive_json()["type"] == "start"
+            ws.close()
+            # Leaving the block cancels the app, so wait for it to handle the disconnect first
+            ended = f"Chat session {session['conversation_id']} ended after 1 turns"
+            deadline = time.monotonic() + 2
+            while ended not in caplog.messages and time.monotonic() < deadline:
+                time.sleep(0.01)
+    # The turn in progress was dropped, and the disconnect is not a failure
+    assert ended in caplog.messages
+    assert not any("failed" in message for message in caplog.messages)
@@ -0,0 +1,205 @@
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from app.database import conversation_db
+from app.database.group_commit import GroupCommitWriter
+from app.models.models import ChatMessage, Conversation, MessageRole
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Point the conversation store at a fresh SQLite file."""
+    path = str(tmp_path / "conversations.db")
+    monkeypatch.setattr(conversation_db, "CONVERSATION_DB_PATH", path)
+    monkeypatch.setattr(conversation_db, "_schema_ready", False)
+    monkeypatch.setattr(conversation_db, "_local", threading.local())
+    monkeypatch.setattr(conversation_db, "_writer", GroupCommitWriter("test", conversation_db._connect_writer))
+    yield path
+
+
+def turn_messages(turn):
+    return [ChatMessage(role=MessageRole.USER, content=f"question {turn}"),
+            ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {turn}")]
+
+
+def assert_whole_turns(conversation, turns):
+    assert [m.content for m in conversation.messages] == \
+        [text for turn in range(turns) for text in (f"question {turn}", f"answer {turn}")]
+
+
+def log_records(conversation_id):
+    conn = conversation_db._get_connection()
+    return conn.execute("SELECT COUNT(*) FROM conversation_log WHERE conversation_id = ?",
+                        (conversation_id,)).fetchone()[0]
+
+
+def test_log_replay_and_compaction(store):
+    conversation = Conversation(id="c1", client_id="acme")
+    for turn in range(3):
+        messages = turn_messages(turn)
+        conversation.messages.extend(messages)
+        conversation_db.append_messages(conversation, messages)
+    assert log_records("c1") == 6
+    assert_whole_turns(conversation_db.get_conversation("c1"), 3)
+
+    conversation_db._writer.submit(lambda conn: conversation_db._compact(conn, "c1"))
+    assert log_records("c1") == 0
+    assert_whole_turns(conversation_db.get_conversation("c1"), 3)
+
+    # Turns after a compaction are replayed onto the new snapshot
+    messages = turn_messages(3)
+    conversation.messages.extend(messages)
+    conversation_db.append_messages(conversation, messages)
+    assert log_records("c1") == 2
+    assert_whole_turns(conversation_db.get_conversation("c1"), 4)
+    assert conversation_db.list_conversations("acme")[0].id == "c1"
+
+
+# Writes turns to several conversations from concurrent threads, compacting often, and
+# kills the process inside a transaction once the given function has been called `crash_at` times
+_CHILD = """
+import os, sys, threading
+from app.database import conversation_db as db
+from app.models.models import ChatMessage, Conversation, MessageRole
+
+target, crash_at = sys.argv[1], int(sys.argv[2])
+original = getattr(db, target)
+calls = 0
+lock = threading.Lock()
+
+def crashing(*args):
+    global calls
+    result = original(*args)
+    with lock:
+        calls += 1
+        if calls == crash_at:
+            # Mid-batch: this transaction has written but not committed
+            os._exit(17)
+    return result
+
+setattr(db, target, crashing)
+
+def write(index):
+    conversation = Conversation(id=f"conv-{index}", client_id="acme")
+    for turn in range(200):
+        messages = [ChatMessage(role=MessageRole.USER, content=f"question {turn}"),
+                    ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {turn}")]
+        conversation.messages.extend(messages)
+        db.append_messages(conversation, messages)
+        with lock:
+            print(f"conv-{index} {turn + 1}", flush=True)
+
+threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+"""
+
+
+def crash_child(path, target, crash_at):
+    env = dict(os.environ, CONVERSATION_DB_PATH=path, CONVERSATION_LOG_COMPACT_RECORDS="6",
+               CONVERSATION_LOG_COMPACT_INTERVAL_SECONDS="0.005")
+    completed = subprocess.run([sys.executable, "-c", _CHILD, target, str(crash_at)], cwd=BACKEND_DIR,
+                               env=env, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 17, completed.stderr[-2000:]
+    acknowledged = {}
+    for line in completed.stdout.splitlines():
+        conversation_id, turns = line.split()
+        acknowledged[conversation_id] = max(acknowledged.get(conversation_id, 0), int(turns))
+    return acknowledged
+
+
+@pytest.mark.parametrize("target,crash_at", [("_append", 150), ("_write_snapshot", 5)])
+def test_crash_recovery_keeps_every_acknowledged_turn(store, target, crash_at):
+    acknowledged = crash_child(store, target, crash_at)
+    assert acknowledged
+
+    recovered = {c.id: c for c in conversation_db.list_conversations("acme")}
+    for conversation_id, conversation in recovered.items():
+        turns = len(conversation.messages) // 2
+        # Whole turns in order, nothing from the interrupted transaction, nothing acknowledged lost
+        assert_whole_turns(conversation, turns)
+        assert acknowledged.get(conversation_id, 0) <= turns <= acknowledged.get(conversation_id, 0) + 1
+    assert set(acknowledged) <= set(recovered)
+
+    # The recovered store takes new writes, which the next compaction folds in
+    conversation = recovered["conv-0"]
+    turns = len(conversation.messages) // 2
+    messages = turn_messages(turns)
+    conversation.messages.extend(messages)
+    conversation_db.append_messages(conversation, messages)
+    conversation_db._writer.submit(conversation_db._compact_due)
+    assert_whole_turns(conversation_db.get_conversation("conv-0"), turns + 1)
+
+
+def test_writer_failure_fails_pending_writes_and_restarts(tmp_path):
+    path = str(tmp_path / "writer.db")
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("disk unavailable")
+        return conversation_db.sqlite3.connect(path, check_same_thread=False)
+
+    writer = GroupCommitWriter("test", connect, timeout=5)
+    with pytest.raises(OSError):
+        writer.submit(lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"))
+    # The next write starts a new writer thread
+    writer.submit(lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"))
+    assert writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)").rowcount) == 1
+    assert len(attempts) == 2
+
+
+def test_writer_crash_mid_batch_fails_the_batch(tmp_path):
+    path = str(tmp_path / "writer.db")
+    writer = GroupCommitWriter("test", lambda: conversation_db.sqlite3.connect(path, check_same_thread=False),
+                               timeout=5)
+    writer.submit(lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"))
+
+    def fatal(conn):
+        conn.execute("INSERT INTO t VALUES (1)")
+        raise SystemExit("writer killed")
+
+    with pytest.raises(SystemExit):
+        writer.submit(fatal)
+    # Nothing of the interrupted transaction was committed, and the writer recovered
+    assert writer.submit(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 0
+
+
+def test_write_timeout(tmp_path):
+    path = str(tmp_path / "writer.db")
+    writer = GroupCommitWriter("test", lambda: conversation_db.sqlite3.connect(path, check_same_thread=False),
+                               timeout=0.2)
+    writer.submit(lambda conn: conn.execute("CREATE TABLE t (x INTEGER)"))
+    running = threading.Event()
+    release = threading.Event()
+    outcomes = []
+
+    def hold_writer():
+        try:
+            writer.submit(lambda conn: running.set() or release.wait(5))
+        except TimeoutError:
+            outcomes.append("timed out")
+
+    blocked = threading.Thread(target=hold_writer)
+    blocked.start()
+    assert running.wait(5)
+    try:
+        with pytest.raises(TimeoutError):
+            writer.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    finally:
+        release.set()
+        blocked.join()
+    # The write that was running when its caller gave up is still committed
+    assert outcomes == ["timed out"]
+    # The write that timed out before it started was dropped
+    assert writer.submit(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 0
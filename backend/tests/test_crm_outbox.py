@@ -0,0 +1,182 @@
+import time
+
+import pytest
+
+from app.database import crm_outbox_db
+from app.models.models import ClientRequirement
+from app.services import crm_service
+from app.services.crm_service import CRMOutboxDispatcher, CRMService, create_order_inquiry, get_order_status
+from app.services.http_client import OutboundHTTPClient
+from tools.stub_crm import start_stub_crm
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    """A fresh outbox database for each test."""
+    monkeypatch.setattr(crm_outbox_db, "CRM_OUTBOX_DB", str(tmp_path / "crm_outbox.db"))
+    monkeypatch.setattr(crm_outbox_db, "_conn", None)
+    yield crm_outbox_db
+    if crm_outbox_db._conn is not None:
+        crm_outbox_db._conn.close()
+
+
+@pytest.fixture
+def stub_crm():
+    server = start_stub_crm()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(stub, batch_size=20):
+    service = CRMService(api_url=stub.url, http_client=OutboundHTTPClient())
+    return CRMOutboxDispatcher(service, batch_size=batch_size)
+
+
+def place_order(conversation_id="conv-1", price=1000.0, idempotency_key=None):
+    requirements = [ClientRequirement(feature_id="F1", feature_name="SSO", quantity=50)]
+    return create_order_inquiry(conversation_id, "acme", requirements, price, idempotency_key=idempotency_key)
+
+
+def make_due(order_id):
+    conn = crm_outbox_db._get_connection()
+    conn.execute("UPDATE crm_outbox SET next_attempt_at = 0 WHERE order_id = ?", (order_id,))
+    conn.commit()
+
+
+def test_enqueue_is_idempotent(outbox, stub_crm):
+    first = place_order(idempotency_key="key-1")
+    again = place_order(idempotency_key="key-1")
+    assert again["order_id"] == first["order_id"]
+    # Without an explicit key, the same order content maps to the same entry
+    assert place_order(conversation_id="conv-2")["order_id"] == place_order(conversation_id="conv-2")["order_id"]
+    assert outbox.count_by_status() == {"pending": 2}
+
+    assert make_dispatcher(stub_crm).dispatch_once() == 2
+    assert len(stub_crm.orders) == 2
+    assert get_order_status(first["order_id"])["status"] == "delivered"
+
+
+def test_failed_batch_is_retried_with_backoff(outbox, stub_crm, monkeypatch):
+    monkeypatch.setattr(crm_service, "CRM_MAX_ATTEMPTS", 3)
+    order = place_order()
+    dispatcher = make_dispatcher(stub_crm)
+
+    stub_crm.failure_rate = 1.0
+    before = time.time()
+    assert dispatcher.dispatch_once() == 1
+    status = get_order_status(order["order_id"])
+    assert status["status"] == "pending"
+    assert status["attempts"] == 1
+    assert "503" in status["last_error"]
+    assert outbox.get_outbox_entry(order["order_id"])["next_attempt_at"] > before
+    # Not due again until the backoff has passed
+    assert dispatcher.dispatch_once() == 0
+
+    make_due(order["order_id"])
+    dispatcher.dispatch_once()
+    make_due(order["order_id"])
+    dispatcher.dispatch_once()
+    status = get_order_status(order["order_id"])
+    assert status["status"] == "failed"
+    assert status["attempts"] == 3
+
+
+def test_partial_batch_failure_only_retries_failed_orders(outbox, stub_crm):
+    ok = place_order(conversation_id="conv-ok", idempotency_key="ok")
+    bad = place_order(conversation_id="conv-bad", idempotency_key="bad")
+    stub_crm.rejected_keys.add("bad")
+    dispatcher = make_dispatcher(stub_crm)
+
+    assert dispatcher.dispatch_once() == 2
+    assert get_order_status(ok["order_id"])["status"] == "delivered"
+    assert get_order_status(bad["order_id"])["status"] == "pending"
+    assert set(stub_crm.orders) == {"ok"}
+
+    stub_crm.rejected_keys.clear()
+    make_due(bad["order_id"])
+    assert dispatcher.dispatch_once() == 1
+    assert get_order_status(bad["order_id"])["status"] == "delivered"
+    assert set(stub_crm.orders) == {"ok", "bad"}
+
+
+def test_expired_lease_is_reclaimed(outbox, monkeypatch):
+    order = place_order()
+    assert len(outbox.claim_due_orders(10)) == 1
+    # Claimed by a worker that died: not handed out again while its lease lasts
+    assert outbox.claim_due_orders(10) == []
+    monkeypatch.setattr(crm_outbox_db, "CRM_DELIVERY_LEASE_SECONDS", -1)
+    reclaimed = outbox.claim_due_orders(10)
+    assert [entry["order_id"] for entry in reclaimed] == [order["order_id"]]
+
+
+def test_failed_claim_rolls_back(outbox, monkeypatch):
+    place_order()
+    monkeypatch.setattr(crm_outbox_db, "CRM_DELIVERY_LEASE_SECONDS", None)
+    with pytest.raises(TypeError):
+        outbox.claim_due_orders(10)
+    assert not crm_outbox_db._get_connection().in_transaction
+    monkeypatch.setattr(crm_outbox_db, "CRM_DELIVERY_LEASE_SECONDS", 300)
+    assert len(outbox.claim_due_orders(10)) == 1
+
+
+def test_drain_delivers_in_the_calling_thread(outbox, stub_crm):
+    dispatcher = make_dispatcher(stub_crm, batch_size=2)
+    orders = [place_order(conversation_id=f"conv-{i}") for i in range(5)]
+    assert dispatcher.drain(timeout=5) == 5
+    assert dispatcher._thread is None
+    assert all(get_order_status(order["order_id"])["status"] == "delivered" for order in orders)
+    assert dispatcher.drain(timeout=5) == 0
+
+    # Failed deliveries are rescheduled, not retried in a loop until the timeout
+    stub_crm.failure_rate = 1.0
+    place_order(conversation_id="conv-failing")
+    start = time.monotonic()
+    assert dispatcher.drain(timeout=5) == 1
+    assert time.monotonic() - start < 1
+    assert outbox.count_by_status() == {"delivered": 5, "pending": 1}
+
+
+def test_reused_idempotency_key_for_another_order_conflicts(outbox):
+    first = place_order(idempotency_key="key-1")
+    with pytest.raises(crm_outbox_db.IdempotencyConflictError):
+        place_order(price=2000.0, idempotency_key="key-1")
+    requirements = [ClientRequirement(feature_id="F1", feature_name="SSO", quantity=50)]
+    with pytest.raises(crm_outbox_db.IdempotencyConflictError):
+        create_order_inquiry("conv-1", "globex", requirements, 1000.0, idempotency_key="key-1")
+    # The same order again is still a replay, whatever its metadata
+    assert place_order(idempotency_key="key-1")["order_id"] == first["order_id"]
+    assert outbox.count_by_status() == {"pending": 1}
+
+
+def test_invalid_batch_is_resent_one_order_at_a_time(outbox, stub_crm):
+    ok = place_order(conversation_id="conv-ok", idempotency_key="ok")
+    invalid = place_order(conversation_id="conv-invalid", idempotency_key="invalid")
+    stub_crm.invalid_keys.add("invalid")
+
+    assert make_dispatcher(stub_crm).dispatch_once() == 2
+    assert get_order_status(ok["order_id"])["status"] == "delivered"
+    status = get_order_status(invalid["order_id"])
+    assert status["status"] == "failed"
+    assert "400" in status["last_error"]
+    assert set(stub_crm.orders) == {"ok"}
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 408])
+def test_auth_and_timeout_errors_are_retried(outbox, stub_crm, status_code, caplog):
+    order = place_order()
+    dispatcher = make_dispatcher(stub_crm)
+    stub_crm.forced_status = status_code
+
+    with caplog.at_level("ERROR", logger="app.services.crm_service"):
+        assert dispatcher.dispatch_once() == 1
+    status = get_order_status(order["order_id"])
+    assert status["status"] == "pending"
+    assert str(status_code) in status["last_error"]
+    # Refused credentials alert, as no retry succeeds until they are fixed
+    assert any("credentials" in record.message for record in caplog.records) == (status_code != 408)
+
+    stub_crm.forced_status = None
+    make_due(order["order_id"])
+    assert dispatcher.dispatch_once() == 1
+    assert get_order_status(order["order_id"])["status"] == "delivered"
@@ -0,0 +1,92 @@
+import base64
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.database import conversation_db
+from app.database.group_commit import GroupCommitWriter
+from app.models.models import Conversation
+from app.services.export_service import decode_cursor, encode_cursor, export_conversations, gzip_stream
+
+CLIENT_ID = "export-client"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def conversations(request, tmp_path, monkeypatch):
+    """Seven conversations, five of them updated at the same instant."""
+    if request.param == "sqlite":
+        monkeypatch.setattr(conversation_db, "CONVERSATION_DB_PATH", str(tmp_path / "conversations.db"))
+        monkeypatch.setattr(conversation_db, "_schema_ready", False)
+        monkeypatch.setattr(conversation_db, "_local", threading.local())
+        monkeypatch.setattr(conversation_db, "_writer", GroupCommitWriter("test", conversation_db._connect_writer))
+    else:
+        monkeypatch.setattr(conversation_db, "conversations_db", {})
+    start = datetime(2026, 1, 5, 12, 0, 0)
+    times = [start, start + timedelta(seconds=1)] + [start + timedelta(seconds=2)] * 5
+    saved = []
+    for i, updated_at in enumerate(times):
+        conversation = Conversation(id=f"conv-{(i * 5) % 7}", client_id=CLIENT_ID, updated_at=updated_at)
+        conversation_db.save_conversation(conversation)
+        saved.append(conversation)
+    return [c.id for c in sorted(saved, key=lambda c: (c.updated_at, c.id))]
+
+
+def read_lines(chunks):
+    return [json.loads(line) for line in b"".join(chunks).splitlines()]
+
+
+def test_resuming_from_the_cursor_has_no_duplicates_or_gaps(conversations):
+    exported, cursor = [], None
+    while True:
+        page = read_lines(export_conversations(client_id=CLIENT_ID, cursor=cursor, limit=2))
+        if not page:
+            break
+        exported += [record["id"] for record in page]
+        cursor = page[-1]["cursor"]
+    assert exported == conversations
+
+    # Batch boundaries inside a run of equal timestamps neither skip nor repeat rows
+    scanned = conversation_db.iter_conversations(client_id=CLIENT_ID, batch_size=2)
+    assert [c.id for c in scanned] == conversations
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b'{"updated_at": "2026-01-05"}').decode(),
+    base64.urlsafe_b64encode(b'[1, 2]').decode(),
+])
+def test_bad_cursor_is_rejected(cursor, monkeypatch):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    monkeypatch.setattr(main, "EXPORT_TOKEN", "e-token")
+    response = TestClient(main.app).get("/conversations/export", params={"cursor": cursor},
+                                        headers={"X-Export-Token": "e-token"})
+    assert response.status_code == 400
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2026-01-05T12:00:02", "conv-1")) == ("2026-01-05T12:00:02", "conv-1")
+
+
+def test_gzip_ndjson_body_decodes(conversations, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_TOKEN", "e-token")
+    client = TestClient(main.app)
+    with client.stream("GET", "/conversations/export", params={"client_id": CLIENT_ID},
+                       headers={"X-Export-Token": "e-token", "Accept-Encoding": "gzip"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        body = b"".join(response.iter_raw())
+    records = read_lines([gzip.decompress(body)])
+    assert [record["id"] for record in records] == conversations
+    assert all(record["client_id"] == CLIENT_ID for record in records)
+
+
+def test_gzip_stream_compresses_chunk_by_chunk():
+    chunks = [f'{{"line": {i}}}\n'.encode() * 100 for i in range(5)]
+    assert gzip.decompress(b"".join(gzip_stream(iter(chunks)))) == b"".join(chunks)
@@ -0,0 +1,73 @@
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def gunicorn_server(tmp_path):
+    pytest.importorskip("gunicorn")
+    port = free_port()
+    # Run from an empty directory with the default metrics directory, as a deployment would
+    env = dict(os.environ,
+               PORT=str(port),
+               WEB_CONCURRENCY="2",
+               PYTHONPATH=BACKEND_DIR,
+               VECTOR_SNAPSHOT_DIR=str(tmp_path / "vector_index"),
+               CONVERSATION_DB_PATH=str(tmp_path / "conversations.db"))
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    metrics_dir = tmp_path / "data" / "prometheus"
+    # A stale metric file from an earlier run must not survive start-up
+    metrics_dir.mkdir(parents=True)
+    (metrics_dir / "counter_1.db").write_bytes(b"")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+                                "--bind", f"127.0.0.1:{port}", "app.main:app"],
+                               cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    try:
+        while True:
+            try:
+                requests.get(url, timeout=5)
+                break
+            except requests.RequestException:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail("gunicorn did not start")
+                time.sleep(0.2)
+        yield url, str(metrics_dir)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def root_requests_counted(url):
+    body = requests.get(f"{url}/metrics").text
+    match = re.search(r'chatbot_request_latency_seconds_count\{[^}]*route="/"[^}]*status="200"[^}]*\} (\S+)', body)
+    assert match, body[:2000]
+    return float(match.group(1))
+
+
+def test_metrics_are_aggregated_across_workers(gunicorn_server):
+    url, metrics_dir = gunicorn_server
+    before = root_requests_counted(url)
+    # Fresh connections so the requests spread over both workers
+    for _ in range(40):
+        assert requests.get(url, headers={"Connection": "close"}).ok
+
+    pids = {name.rsplit("_", 1)[1].split(".")[0] for name in os.listdir(metrics_dir) if name.endswith(".db")}
+    assert len(pids) >= 2
+    assert "1" not in pids
+    assert root_requests_counted(url) == before + 40
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from app.services.http_client import (CircuitBreaker, CircuitOpenError, HostBusyError,
+                                      OutboundHTTPClient)
+from tools.stub_crm import start_stub_crm
+
+
+@pytest.fixture
+def stub_crm():
+    server = start_stub_crm()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(stub, failure_threshold=3, reset_timeout=0.2, **kwargs):
+    client = OutboundHTTPClient(**kwargs)
+    _, state = client._host(stub.url)
+    state.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+    return client
+
+
+def post_order(client, stub):
+    return client.post(f"{stub.url}/orders", json={"client_id": "acme"})
+
+
+def test_breaker_opens_after_failures_and_recovers(stub_crm):
+    client = make_client(stub_crm)
+    stub_crm.failure_rate = 1.0
+    for _ in range(3):
+        assert post_order(client, stub_crm).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        post_order(client, stub_crm)
+    requests_before = stub_crm.request_count
+
+    # After the reset timeout one probe goes through; a failed probe reopens the circuit
+    time.sleep(0.25)
+    assert post_order(client, stub_crm).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        post_order(client, stub_crm)
+    assert stub_crm.request_count == requests_before + 1
+
+    stub_crm.failure_rate = 0.0
+    time.sleep(0.25)
+    assert post_order(client, stub_crm).ok
+    assert post_order(client, stub_crm).ok
+    metrics = client.get_metrics()["hosts"][stub_crm.url.split("//")[1]]
+    assert metrics["circuit_state"] == CircuitBreaker.CLOSED
+    assert metrics["requests"] == 6
+    assert metrics["errors"] == 4
+    assert metrics["rejected"] == 2
+
+
+def test_unexpected_error_releases_the_probe(stub_crm, monkeypatch):
+    client = make_client(stub_crm, failure_threshold=1)
+    stub_crm.failure_rate = 1.0
+    post_order(client, stub_crm)
+    stub_crm.failure_rate = 0.0
+    time.sleep(0.25)
+
+    # The probe fails with an exception that is not a RequestException
+    original = client.session.request
+    monkeypatch.setattr(client.session, "request", lambda *a, **kw: (_ for _ in ()).throw(ValueError("bad body")))
+    with pytest.raises(ValueError):
+        post_order(client, stub_crm)
+    monkeypatch.setattr(client.session, "request", original)
+
+    # The breaker reopened instead of staying half-open with its probe slot taken
+    time.sleep(0.25)
+    assert post_order(client, stub_crm).ok
+    assert client.get_metrics()["hosts"][stub_crm.url.split("//")[1]]["in_flight"] == 0
+
+
+def test_per_host_cap(stub_crm):
+    stub_crm.latency_ms = 300
+    client = make_client(stub_crm, max_per_host=1, host_wait_seconds=0.05, pool_maxsize=1)
+    results = []
+    slow = threading.Thread(target=lambda: results.append(post_order(client, stub_crm).status_code))
+    slow.start()
+    time.sleep(0.1)
+    with pytest.raises(HostBusyError):
+        post_order(client, stub_crm)
+    slow.join()
+    assert results == [201]
+
+    # A rejected request is not a host failure and the freed slot is usable again
+    stub_crm.latency_ms = 0
+    assert post_order(client, stub_crm).ok
+    metrics = client.get_metrics()["hosts"][stub_crm.url.split("//")[1]]
+    assert metrics["rejected"] == 1
+    assert metrics["errors"] == 0
+    assert metrics["peak_in_flight"] == 1
+    assert metrics["over_pool"] == 0
+    assert metrics["circuit_state"] == CircuitBreaker.CLOSED
+
+
+def test_connection_errors_count_as_failures():
+    client = OutboundHTTPClient(timeout=(0.2, 0.2))
+    url = "http://127.0.0.1:9/orders"
+    _, state = client._host(url)
+    state.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(requests.RequestException):
+            client.post(url, json={})
+    with pytest.raises(CircuitOpenError):
+        client.post(url, json={})
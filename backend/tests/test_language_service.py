@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+from app.services import language_service
+from app.services.language_service import detect_language, may_have_switched_language
+
+
+def test_same_language_message_skips_detection(monkeypatch):
+    def fail(text):
+        raise AssertionError("detector should not run")
+    monkeypatch.setattr(language_service, "_detect_with_confidence", fail)
+    assert detect_language("What is the price of the premium plan?", "en") == "en"
+    assert detect_language("Wir brauchen 50 Lizenzen, was ist der Preis?", "de") == "de"
+
+
+def test_script_or_function_word_change_triggers_detection():
+    assert may_have_switched_language("Сколько стоит этот план для нас?", "en")
+    assert may_have_switched_language("Was kostet der Plan für uns und die Firma?", "en")
+    assert detect_language("Was kostet der Plan für uns und die Firma?", "en") == "de"
+
+
+def test_message_without_dominant_function_words_is_detected():
+    # Polish and Turkish have no function word list; their messages still reach the detector
+    assert may_have_switched_language("Ile kosztuje ten plan dla naszej firmy i zespołu?", "en")
+    assert detect_language("Ile kosztuje ten plan dla naszej firmy i zespołu?", "en") == "pl"
+    assert detect_language("Bu plan şirketimiz için ne kadar tutar?", "en") == "tr"
+    # Messages without function words are detected too, and only switch when the detector is confident
+    assert may_have_switched_language("SSO, API, reporting dashboards", "en")
+    assert detect_language("SSO, API, reporting dashboards", "en") == "en"
+
+
+def test_unconfident_detection_keeps_the_language(monkeypatch):
+    @lru_cache()
+    def unsure(text):
+        return "pl", 0.6
+    monkeypatch.setattr(language_service, "_detect_with_confidence", unsure)
+    assert detect_language("Ok, dobrze, SSO and API please", "en") == "en"
+
+
+def test_new_conversation_is_detected():
+    assert detect_language("Quel est le prix pour nous et notre équipe?") == "fr"
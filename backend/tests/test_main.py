@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+from app import main
+
+
+def test_token_protected_endpoints(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "USAGE_TOKEN", "")
+    assert client.get("/usage").status_code == 404
+    monkeypatch.setattr(main, "USAGE_TOKEN", "s3cret")
+    assert client.get("/usage").status_code == 403
+    assert client.get("/usage", headers={"X-Usage-Token": "wrong"}).status_code == 403
+    assert client.get("/usage", headers={"X-Usage-Token": "s3cret"}).status_code == 200
+
+    monkeypatch.setattr(main.request_profiler, "token", "p-token")
+    assert client.get("/debug/profiles", headers={"X-Usage-Token": "p-token"}).status_code == 403
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "p-token"}).status_code == 200
+
+
+def test_create_order_rejects_a_reused_idempotency_key():
+    client = TestClient(main.app)
+    order = {"conversation_id": "conv-409", "client_id": "acme", "price": 1000.0,
+             "requirements": [{"feature_id": "F1", "feature_name": "SSO", "quantity": 5}]}
+    first = client.post("/create-order", json=order, headers={"Idempotency-Key": "order-409"})
+    assert first.status_code == 202
+    again = client.post("/create-order", json=order, headers={"Idempotency-Key": "order-409"})
+    assert again.json()["order_id"] == first.json()["order_id"]
+    conflict = client.post("/create-order", json=dict(order, price=2000.0), headers={"Idempotency-Key": "order-409"})
+    assert conflict.status_code == 409
@@ -0,0 +1,56 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from app.services import ai_service
+from app.services.model_router import ROUTES
+from app.services.token_usage import BUDGET_DEGRADE
+
+
+def route_outcomes():
+    return {(route, outcome): REGISTRY.get_sample_value("chatbot_model_route_calls_total",
+                                                        {"route": route, "outcome": outcome}) or 0
+            for route in ROUTES for outcome in ("ok", "fallback", "error")}
+
+
+def outcome_changes(before):
+    return {key: count - before[key] for key, count in route_outcomes().items() if count != before[key]}
+
+
+def generate_failing(monkeypatch, failing_routes):
+    def generate(route, messages, system_prompt, tools):
+        if route.name in failing_routes:
+            raise RuntimeError(f"{route.name} failed")
+        return f"answer from {route.name}"
+    monkeypatch.setattr(ai_service, "_generate_with_route", generate)
+    before = route_outcomes()
+    return lambda route: (ai_service.generate_ai_response([], "prompt", route=route), outcome_changes(before))
+
+
+@pytest.mark.parametrize("failing, reply, outcomes", [
+    ((), "answer from fast", {("fast", "ok"): 1}),
+    (("fast",), "answer from large", {("fast", "fallback"): 1, ("large", "ok"): 1}),
+    (("fast", "large"), "technical difficulties", {("fast", "fallback"): 1, ("large", "error"): 1}),
+])
+def test_each_attempted_route_records_one_outcome(monkeypatch, failing, reply, outcomes):
+    text, changes = generate_failing(monkeypatch, failing)(ROUTES["fast"])
+    assert reply in text
+    assert changes == outcomes
+
+
+def test_route_without_fallback_records_an_error(monkeypatch):
+    text, changes = generate_failing(monkeypatch, ("large",))(ROUTES["large"])
+    assert "technical difficulties" in text
+    assert changes == {("large", "error"): 1}
+
+
+def test_over_budget_turns_do_not_fall_back_to_the_large_model(monkeypatch):
+    monkeypatch.setattr(ai_service.token_ledger, "budget_action", lambda client_id: BUDGET_DEGRADE)
+    monkeypatch.setattr(ai_service, "search_documents", lambda *args, **kwargs: [])
+    calls = []
+    monkeypatch.setattr(ai_service, "_generate_with_route",
+                        lambda route, *args: calls.append(route.name) or (_ for _ in ()).throw(RuntimeError("down")))
+
+    response = ai_service.process_query("Compare your plans and explain why one costs more", None,
+                                        client_id="acme", language="en")
+    assert calls == ["fast"]
+    assert "technical difficulties" in response["message"]
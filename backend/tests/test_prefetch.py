@@ -0,0 +1,61 @@
+from prometheus_client import REGISTRY
+
+from app.models.models import ConversationState
+from app.services import ai_service
+
+
+def prefetch_events(result):
+    return REGISTRY.get_sample_value("chatbot_cache_events_total", {"cache": "prefetch", "result": result}) or 0
+
+
+def test_pricing_switch_uses_the_prefetched_quote(monkeypatch):
+    # Every turn after the greeting is a requirements turn; the third requirement switches to pricing
+    monkeypatch.setattr(ai_service, "classify_intent", lambda *args: ConversationState.REQUIREMENTS)
+    monkeypatch.setattr(ai_service, "generate_ai_response", lambda *args, **kwargs: "Noted.")
+    monkeypatch.setattr(ai_service, "search_documents", lambda *args, **kwargs: [])
+    monkeypatch.setattr(ai_service, "retrieve_documents_faiss", lambda *args, **kwargs: [])
+    computed = []
+    generate_pricing = ai_service.generate_pricing
+    monkeypatch.setattr(ai_service, "generate_pricing",
+                        lambda request: computed.append(len(request.requirements)) or generate_pricing(request))
+
+    hits, misses = prefetch_events("hit"), prefetch_events("miss")
+    turns = ["Hello", "We need Basic Integration", "and Multi-user Access for the team",
+             "plus Custom Reporting", "What would that cost?"]
+    responses = []
+    conversation_id = None
+    for message in turns:
+        response = ai_service.process_query(message, conversation_id, client_id="acme", language="en")
+        conversation_id = response["conversation_id"]
+        responses.append(response)
+
+    assert [r["state"] for r in responses] == [ConversationState.GREETING] + [ConversationState.REQUIREMENTS] * 2 \
+        + [ConversationState.PRICING] * 2
+    # Both pricing turns were served from the prefetcher, the switch turn included
+    assert prefetch_events("hit") - hits == 2
+    assert prefetch_events("miss") - misses == 0
+    assert responses[3]["pricing"] == responses[4]["pricing"]
+    # The three-requirement quote was computed once, in the background
+    assert computed.count(3) == 1
+
+
+def test_prefetched_context_is_merged_with_the_message_retrieval(monkeypatch):
+    monkeypatch.setattr(ai_service, "classify_intent", lambda *args: ConversationState.REQUIREMENTS)
+    monkeypatch.setattr(ai_service, "search_documents",
+                        lambda *args, **kwargs: ["Discounts for annual plans", "Basic Integration pricing"])
+    monkeypatch.setattr(ai_service, "retrieve_documents_faiss",
+                        lambda query, *args, **kwargs: ["Basic Integration pricing", "Custom Reporting pricing"])
+    contexts = []
+    monkeypatch.setattr(ai_service, "generate_ai_response",
+                        lambda messages, system_prompt, kb_context, **kwargs: contexts.append(kb_context) or "Noted.")
+
+    hits = prefetch_events("hit")
+    conversation_id = None
+    for message in ["Hello", "We need Basic Integration", "and Multi-user Access for the team",
+                    "plus Custom Reporting, with an annual discount?"]:
+        conversation_id = ai_service.process_query(message, conversation_id, client_id="acme",
+                                                   language="en")["conversation_id"]
+
+    assert prefetch_events("hit") - hits == 1
+    # The message's own documents come first and are not lost to the quote's context
+    assert contexts[-1] == ["Discounts for annual plans", "Basic Integration pricing", "Custom Reporting pricing"]
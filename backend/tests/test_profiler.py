@@ -0,0 +1,10 @@
+from app.services.profiler import RequestProfiler
+
+
+def test_debug_header_must_match_the_token(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), sample_rate=0, token="p-token")
+    assert profiler.should_profile("p-token")
+    for header in (None, "", "wrong", "p-token ", "p-tokén"):
+        assert not profiler.should_profile(header)
+    # Without a configured token the header never enables profiling
+    assert not RequestProfiler(directory=str(tmp_path), sample_rate=0, token="").should_profile("")
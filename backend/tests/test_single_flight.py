@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.single_flight import SingleFlight, fingerprint
+
+
+def run_concurrently(count, target):
+    start = threading.Barrier(count)
+    results = []
+    errors = []
+
+    def call():
+        start.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return {"value": value}
+
+    results, errors = run_concurrently(8, lambda: flight.do("key", slow, 42))
+    assert errors == []
+    assert calls == [42]
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight("test")
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    results, errors = run_concurrently(5, lambda: flight.do("key", failing))
+    assert results == []
+    assert len(calls) == 1
+    assert len(errors) == 5
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight("test")
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.in_flight() == 0
+
+    # The next call runs again instead of reusing the finished one
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.05)
+        return value
+
+    threads = [threading.Thread(target=flight.do, args=(fingerprint("model", i), slow, i)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [0, 1, 2]
+
+
+def test_do_async_shares_with_tasks_and_threads():
+    flight = SingleFlight("test")
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "done"
+
+    async def main():
+        thread_result = []
+        thread = threading.Thread(target=lambda: thread_result.append(flight.do("key", slow)))
+        leader = asyncio.ensure_future(flight.do_async("key", slow))
+        await asyncio.sleep(0.02)
+        thread.start()
+        followers = [flight.do_async("key", slow) for _ in range(3)]
+        results = await asyncio.gather(leader, *followers)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        return results + thread_result
+
+    assert asyncio.run(main()) == ["done"] * 5
+    assert calls == [1]
+    assert flight.in_flight() == 0
+
+
+def test_do_async_runs_coroutines_and_propagates_errors():
+    flight = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert len(errors) == 3
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.in_flight() == 0
+
+
+def test_bedrock_calls_coalesce_only_within_priority_and_consumer(monkeypatch):
+    from app.services import ai_service
+    from app.services.bedrock_limiter import (BedrockOverloadedError, PRIORITY_BACKGROUND,
+                                              PRIORITY_INTERACTIVE, bedrock_priority)
+    from app.services.token_usage import usage_scope
+
+    monkeypatch.setattr(ai_service, "DEV_MODE", False)
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        time.sleep(0.1)
+        if ai_service.current_priority() == PRIORITY_BACKGROUND:
+            raise BedrockOverloadedError("shed")
+        return [0.0]
+
+    monkeypatch.setattr(ai_service, "_embed_with_bedrock", embed)
+    start = threading.Barrier(4)
+    outcomes = {}
+
+    def call(name, client_id, priority=PRIORITY_INTERACTIVE):
+        with usage_scope(client_id), bedrock_priority(priority):
+            start.wait()
+            try:
+                outcomes[name] = ai_service._compute_embedding("same text")
+            except BedrockOverloadedError as e:
+                outcomes[name] = e
+
+    threads = [
+        threading.Thread(target=call, args=("background", "acme", PRIORITY_BACKGROUND)),
+        threading.Thread(target=call, args=("interactive", "acme")),
+        threading.Thread(target=call, args=("interactive-same", "acme")),
+        threading.Thread(target=call, args=("other-consumer", "globex")),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The shed background call does not fail the interactive ones, and each
+    # consumer makes (and is charged for) its own call
+    assert isinstance(outcomes["background"], BedrockOverloadedError)
+    assert outcomes["interactive"] == outcomes["interactive-same"] == outcomes["other-consumer"] == [0.0]
+    assert len(calls) == 3
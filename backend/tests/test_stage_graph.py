@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.bedrock_limiter import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, bedrock_priority,
+                                            current_priority)
+from app.services.stage_graph import StageGraph
+from app.services.telemetry import trace_id_var
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown()
+
+
+def test_stages_get_their_dependencies_results(executor):
+    order = []
+
+    def stage(name, delay=0.0):
+        def run(*inputs):
+            time.sleep(delay)
+            order.append(name)
+            return (name,) + inputs
+        return run
+
+    results = (StageGraph(executor)
+               .add("a", stage("a", 0.05))
+               .add("b", stage("b"))
+               .add("c", stage("c"), "a", "b")
+               .add("d", stage("d"), "c")
+               .run())
+    assert results["c"] == ("c", ("a",), ("b",))
+    assert results["d"] == ("d", results["c"])
+    # Independent stages overlap; dependents wait for all their inputs
+    assert order.index("b") < order.index("a") < order.index("c") < order.index("d")
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        StageGraph().add("b", lambda a: a, "a")
+
+
+def test_stage_exception_propagates_after_running_stages_finish(executor):
+    finished = threading.Event()
+    skipped = []
+
+    def fail():
+        raise KeyError("missing feature")
+
+    def slow():
+        time.sleep(0.1)
+        finished.set()
+
+    graph = (StageGraph(executor)
+             .add("fail", fail)
+             .add("slow", slow)
+             .add("after", lambda _: skipped.append(1), "fail"))
+    with pytest.raises(KeyError, match="missing feature"):
+        graph.run()
+    assert finished.is_set()
+    assert skipped == []
+
+
+def test_stages_see_the_callers_context_variables(executor):
+    def context():
+        return trace_id_var.get(), current_priority()
+
+    token = trace_id_var.set("trace-123")
+    try:
+        with bedrock_priority(PRIORITY_BACKGROUND):
+            results = StageGraph(executor).add("first", context).add("second", lambda _: context(), "first").run()
+    finally:
+        trace_id_var.reset(token)
+    assert results == {"first": ("trace-123", PRIORITY_BACKGROUND), "second": ("trace-123", PRIORITY_BACKGROUND)}
+    # The pool threads keep no context of their own afterwards
+    assert executor.submit(context).result() == ("-", PRIORITY_INTERACTIVE)
@@ -0,0 +1,24 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.telemetry import trace_id_from_header
+
+
+def test_well_formed_request_ids_are_reused():
+    assert trace_id_from_header("kong-7f3a9c") == "kong-7f3a9c"
+    assert trace_id_from_header("a" * 64) == "a" * 64
+
+
+@pytest.mark.parametrize("value", [None, "", "a" * 65, "../../etc/passwd", "id\nforged log line", "id with spaces"])
+def test_other_request_ids_are_replaced(value):
+    trace_id = trace_id_from_header(value)
+    assert trace_id != value
+    assert trace_id_from_header(trace_id) == trace_id
+
+
+def test_response_carries_sanitized_trace_id():
+    client = TestClient(app)
+    assert client.get("/", headers={"X-Request-ID": "req-123"}).headers["X-Trace-ID"] == "req-123"
+    trace_id = client.get("/", headers={"X-Request-ID": "../profile"}).headers["X-Trace-ID"]
+    assert trace_id != "../profile" and "/" not in trace_id
@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services.token_usage import (ANONYMOUS_CLIENT, BUDGET_DEGRADE, BUDGET_OK, BUDGET_QUEUE,
+                                      SYSTEM_CLIENT, TokenLedger, UsageOwner)
+
+
+def test_budgets_are_split_across_workers():
+    ledger = TokenLedger(default_budget=1000, budgets={"acme": 3000}, anonymous_budget=500, workers=4)
+    assert ledger.budget_for("acme") == 750
+    assert ledger.budget_for("globex") == 250
+    assert ledger.budget_for(None) == ledger.budget_for(ANONYMOUS_CLIENT) == 125
+    assert ledger.budget_for(SYSTEM_CLIENT) == 0
+
+    ledger.record("model", 200, 60, owner=UsageOwner("globex"))
+    assert ledger.budget_action("globex") == BUDGET_DEGRADE
+    ledger.record("model", 200, owner=UsageOwner("globex"))
+    assert ledger.budget_action("globex") == BUDGET_QUEUE
+    assert ledger.budget_action("acme") == BUDGET_OK
+
+
+def test_anonymous_turns_share_one_budget():
+    ledger = TokenLedger(default_budget=1000, anonymous_budget=1000, workers=1)
+    for _ in range(3):
+        # Turns without a consumer all land in one account, whatever client_id they claim
+        ledger.record("model", 400, owner=UsageOwner(None))
+    assert ledger.used(ANONYMOUS_CLIENT) == 1200
+    assert ledger.budget_action(None) == BUDGET_DEGRADE
+
+
+def test_chat_is_charged_to_the_authenticated_consumer(monkeypatch):
+    calls = []
+
+    def process_query(message, **kwargs):
+        calls.append(kwargs)
+        return {"conversation_id": "c1", "message": "ok", "state": None}
+
+    monkeypatch.setattr(main, "process_query", process_query)
+    client = TestClient(main.app)
+    body = {"message": "hello", "client_id": "someone-else"}
+    assert client.post("/chat", json=body, headers={"X-Consumer-Username": "acme"}).status_code == 200
+    assert client.post("/chat", json=body).status_code == 200
+    assert [(c["client_id"], c["consumer"]) for c in calls] == [("someone-else", "acme"), ("someone-else", None)]
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from app.database.translation_memory_db import TranslationMemory
+from app.services import language_service
+from app.services.language_service import TranslationService
+
+
+class StubTranslateClient:
+    """Marks every line as translated, like AWS Translate keeping the line structure."""
+
+    def __init__(self):
+        self.requests = []
+        self.merge_lines = False
+        self._lock = threading.Lock()
+
+    def translate_text(self, Text, SourceLanguageCode, TargetLanguageCode, **kwargs):
+        assert len(Text.encode("utf-8")) <= language_service.TRANSLATE_MAX_REQUEST_BYTES
+        with self._lock:
+            self.requests.append(Text)
+        separator = " " if self.merge_lines else "\n"
+        return {"TranslatedText": separator.join(f"{TargetLanguageCode}({line})" for line in Text.split("\n"))}
+
+
+@pytest.fixture
+def stub_translate(tmp_path, monkeypatch):
+    client = StubTranslateClient()
+    monkeypatch.setattr(language_service, "DEV_MODE", False)
+    monkeypatch.setattr(language_service, "translate_client", lambda max_pool_connections: client)
+    monkeypatch.setattr(language_service, "translation_memory",
+                        TranslationMemory(db_path=str(tmp_path / "translation_memory.db")))
+    return client
+
+
+def test_markdown_numbers_and_newlines_are_preserved(stub_translate):
+    text = "# Pricing\n\n- Basic plan: 1,200 USD per month. Includes SSO.\n- **Premium** costs more!\n\n42\n"
+    translated = TranslationService().translate(text, "en", "de")
+    assert translated == ("# de(Pricing)\n\n- de(Basic plan: 1,200 USD per month.) de(Includes SSO.)\n"
+                          "- de(**Premium** costs more!)\n\n42\n")
+    # The sentences went out in one request, one per line
+    assert stub_translate.requests == [
+        "Pricing\nBasic plan: 1,200 USD per month.\nIncludes SSO.\n**Premium** costs more!"]
+
+
+def test_changed_line_count_falls_back_to_one_request_per_segment(stub_translate):
+    stub_translate.merge_lines = True
+    translated = TranslationService().translate("Hello there. How are you?", "en", "fr")
+    assert translated == "fr(Hello there.) fr(How are you?)"
+    assert stub_translate.requests == ["Hello there.\nHow are you?", "Hello there.", "How are you?"]
+
+
+def test_oversize_segment_is_split_under_the_request_limit(stub_translate):
+    sentence = " ".join(["word"] * 5000) + "."
+    translated = TranslationService().translate(sentence, "en", "de")
+    assert len(stub_translate.requests) == 3
+    assert " ".join(stub_translate.requests) == sentence
+    assert translated == " ".join(f"de({part})" for part in stub_translate.requests)
+
+
+def test_order_is_kept_across_concurrent_batches(stub_translate, monkeypatch):
+    monkeypatch.setattr(language_service, "TRANSLATE_BATCH_BYTES", 40)
+    sentences = [f"Sentence number {i} is here." for i in range(30)]
+    translated = TranslationService().translate(" ".join(sentences), "en", "de")
+    assert len(stub_translate.requests) > 1
+    assert translated == " ".join(f"de({sentence})" for sentence in sentences)
+
+
+def test_only_misses_reach_aws_and_partial_hits_keep_the_order(stub_translate):
+    service = TranslationService()
+    service.translate("Second sentence.", "en", "de")
+    stub_translate.requests.clear()
+
+    translated = service.translate("First sentence. Second sentence. Third sentence.", "en", "de")
+    assert translated == "de(First sentence.) de(Second sentence.) de(Third sentence.)"
+    assert stub_translate.requests == ["First sentence.\nThird sentence."]
+
+    # Repeated segments are requested once, and a full hit makes no request
+    stub_translate.requests.clear()
+    assert service.translate("Third sentence. Third sentence.", "en", "de") == \
+        "de(Third sentence.) de(Third sentence.)"
+    assert stub_translate.requests == []
+    # Translations are kept per language pair
+    service.translate("Third sentence.", "en", "fr")
+    assert stub_translate.requests == ["Third sentence."]
+
+
+def test_translation_memory_survives_a_restart(stub_translate, tmp_path, monkeypatch):
+    TranslationService().translate("Hello there. How are you?", "en", "de")
+    assert len(stub_translate.requests) == 1
+
+    # A new process opens the same database
+    monkeypatch.setattr(language_service, "translation_memory",
+                        TranslationMemory(db_path=str(tmp_path / "translation_memory.db")))
+    assert TranslationService().translate("How are you? Hello there.", "en", "de") == \
+        "de(How are you?) de(Hello there.)"
+    assert len(stub_translate.requests) == 1
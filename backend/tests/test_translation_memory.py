@@ -0,0 +1,29 @@
+import os
+
+from app.database.translation_memory_db import TranslationMemory
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    db_path = str(tmp_path / "tm" / "translation_memory.db")
+    memory = TranslationMemory(db_path=db_path)
+    assert not os.path.exists(db_path)
+    memory.put_many("en", "de", {"Hello.": "Hallo."})
+    assert os.path.exists(db_path)
+
+
+def test_reads_do_not_write_until_a_batch_is_due(tmp_path):
+    db_path = str(tmp_path / "translation_memory.db")
+    TranslationMemory(db_path=db_path).put_many("en", "de", {"Hello.": "Hallo.", "Thanks.": "Danke."})
+
+    memory = TranslationMemory(db_path=db_path, cache_size=1)
+    written = dict(memory._connection().execute("SELECT segment, last_used FROM translation_memory"))
+    changes_before = memory._connection().total_changes
+    for _ in range(10):
+        assert memory.get_many("en", "de", ["Hello.", "Thanks."]) == {"Hello.": "Hallo.", "Thanks.": "Danke."}
+    assert memory._connection().total_changes == changes_before
+
+    # The pending read times are written with the next write
+    memory.put_many("en", "de", {"Bye.": "Tschüss."})
+    last_used = dict(memory._connection().execute("SELECT segment, last_used FROM translation_memory"))
+    assert last_used["Hello."] > written["Hello."]
+    assert last_used["Thanks."] > written["Thanks."]
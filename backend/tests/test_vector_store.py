@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from app.database.vector_store import load_or_build_snapshot, load_snapshot, remove_snapshot, save_snapshot
+from app.services.ai_service import dimension, hashed_embedding
+
+DOCUMENTS = ["Basic Integration connects the CRM.", "Multi-user access for teams", "Préférences: ✓ 20 €", ""]
+
+
+def test_hashed_embedding_is_deterministic_across_processes():
+    code = "from app.services.ai_service import hashed_embedding; print(hashed_embedding('Pricing for SSO').tobytes().hex())"
+    env = dict(os.environ, PYTHONHASHSEED="12345")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env).stdout
+    assert bytes.fromhex(output.strip()) == hashed_embedding("Pricing for SSO").tobytes()
+
+
+def test_hashed_embedding_has_the_index_dimension_and_unit_norm():
+    embedding = hashed_embedding("Multi-user access for the sales team")
+    assert embedding.shape == (dimension,)
+    assert embedding.dtype == np.float32
+    assert np.isclose(np.linalg.norm(embedding), 1.0)
+    # Too short for a single n-gram
+    assert not hashed_embedding("").any()
+    # Texts sharing n-grams are closer than unrelated ones
+    query = hashed_embedding("multi-user access")
+    assert query @ embedding > query @ hashed_embedding("Invoice currency conversion")
+
+
+def test_snapshot_round_trip(tmp_path):
+    directory = str(tmp_path / "snapshot")
+    vectors = np.stack([hashed_embedding(document) for document in DOCUMENTS])
+    save_snapshot(directory, vectors, DOCUMENTS)
+
+    index, documents = load_snapshot(directory)
+    assert (index.ntotal, index.d) == (len(DOCUMENTS), dimension)
+    assert np.array_equal(index.vectors, vectors)
+    assert list(documents) == DOCUMENTS
+    assert documents[-2] == "Préférences: ✓ 20 €"
+    _, indices = index.search(hashed_embedding("multi-user access")[None, :], 2)
+    assert indices[0][0] == 1
+
+
+def test_snapshot_is_built_once_and_rebuilt_after_removal(tmp_path):
+    directory = str(tmp_path / "snapshot")
+    builds = []
+
+    def build():
+        builds.append(1)
+        return np.stack([hashed_embedding(document) for document in DOCUMENTS[:2]]), DOCUMENTS[:2]
+
+    for _ in range(2):
+        index, documents = load_or_build_snapshot(directory, build)
+        assert list(documents) == DOCUMENTS[:2]
+    assert len(builds) == 1
+
+    remove_snapshot(directory)
+    # Workers that mapped the removed files can still read them
+    assert list(documents) == DOCUMENTS[:2]
+    load_or_build_snapshot(directory, build)
+    assert len(builds) == 2
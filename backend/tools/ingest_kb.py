@@ -0,0 +1,81 @@
+"""Ingest the knowledge base into the shared index snapshot.
+
+Walks a local directory or S3 prefix, parses CSV, XLSX and Markdown files in
+a process pool, embeds the chunks and writes the memory-mapped snapshot that
+the API workers load (`VECTOR_SNAPSHOT_DIR`). A manifest of mtimes and
+content hashes makes repeated runs incremental: only new or changed files
+are parsed and embedded.
+
+    python -m tools.ingest_kb knowledgebase
+    python -m tools.ingest_kb s3://techrunners/kb/ --snapshot-dir data/vector_index
+    python -m tools.ingest_kb knowledgebase --dry-run
+
+Workers pick up a new snapshot when they are restarted.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+# The service must not build its own index when imported here
+os.environ["INDEX_ON_STARTUP"] = "false"
+
+from dotenv import load_dotenv
+
+from app.services.kb_ingestion import KB_CACHE_DIR, KB_MANIFEST_PATH, KnowledgeBaseIngestor, source_from_uri
+from app.database.vector_store import save_snapshot, snapshot_exists
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ingest knowledge base files into the index snapshot")
+    parser.add_argument("source", help="Local directory or s3://bucket/prefix")
+    parser.add_argument("--snapshot-dir", default=os.environ.get("VECTOR_SNAPSHOT_DIR") or "data/vector_index")
+    parser.add_argument("--manifest", default=KB_MANIFEST_PATH)
+    parser.add_argument("--cache-dir", default=KB_CACHE_DIR, help="Parsed chunks and vectors per file version")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parser processes")
+    parser.add_argument("--embed-workers", type=int, default=8, help="Concurrent embedding calls")
+    parser.add_argument("--force", action="store_true", help="Re-parse and re-embed every file")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the files that would be ingested")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from app.services import ai_service
+
+    ingestor = KnowledgeBaseIngestor(
+        source_from_uri(args.source),
+        embed=lambda text: ai_service.embed_text(text, cache=False),
+        embedding_model=ai_service.embedding_model_id(),
+        manifest_path=args.manifest,
+        cache_dir=args.cache_dir,
+        workers=args.workers,
+        embed_workers=args.embed_workers,
+    )
+
+    start = time.perf_counter()
+    report = ingestor.ingest(force=args.force, dry_run=args.dry_run)
+    for label, keys in (("added", report.added), ("changed", report.changed), ("removed", report.removed)):
+        for key in keys:
+            print(f"{label:>8} {key}")
+    print(f"{len(report.added)} added, {len(report.changed)} changed, {len(report.removed)} removed, "
+          f"{report.unchanged} unchanged")
+    if args.dry_run:
+        return 0
+
+    if report.modified or args.force or not snapshot_exists(args.snapshot_dir):
+        vectors, documents = ingestor.assemble()
+        save_snapshot(args.snapshot_dir, vectors, documents)
+    else:
+        print(f"Snapshot {args.snapshot_dir} is up to date")
+
+    print(f"{report.chunks_embedded} chunks embedded, {report.total_chunks} in index; "
+          f"parse {report.parse_seconds:.1f}s, embed {report.embed_seconds:.1f}s, "
+          f"total {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Local stand-in for the CRM API, used for tests and benchmarks.
+
+Implements `POST /orders` and `POST /orders/batch` with configurable latency
+and failure rate, and honours idempotency keys. Orders whose idempotency key
+is in `rejected_keys` fail individually within a batch; a batch containing a
+key from `invalid_keys` is rejected as a whole with 400. Setting
+`forced_status` answers every order request with that status.
+
+    python -m tools.stub_crm --port 9100 --latency-ms 50 --failure-rate 0.1
+    CRM_API_URL=http://127.0.0.1:9100 python run.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+
+
+class StubCRMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(address, StubCRMHandler)
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.orders: Dict[str, Dict] = {}
+        self.rejected_keys: Set[str] = set()
+        self.invalid_keys: Set[str] = set()
+        self.forced_status: Optional[int] = None
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def create(self, key: Optional[str], order: Dict) -> str:
+        """Store an order, returning the existing ID for a repeated idempotency key."""
+        with self.lock:
+            if key and key in self.orders:
+                return self.orders[key]["order_id"]
+            order_id = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            self.orders[key or order_id] = dict(order, order_id=order_id)
+            return order_id
+
+
+class StubCRMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "orders": len(self.server.orders),
+                             "requests": self.server.request_count})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.request_count += 1
+
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000.0)
+        if random.random() < self.server.failure_rate:
+            self._send(503, {"error": "simulated CRM outage"})
+            return
+        if self.server.forced_status:
+            self._send(self.server.forced_status, {"error": "simulated CRM error"})
+            return
+
+        if self.path.endswith("/orders/batch"):
+            if any(order.get("idempotency_key") in self.server.invalid_keys for order in body.get("orders", [])):
+                self._send(400, {"error": "invalid order"})
+                return
+            results = []
+            for order in body.get("orders", []):
+                key = order.get("idempotency_key")
+                if key in self.server.rejected_keys:
+                    results.append({"idempotency_key": key, "error": "simulated order failure",
+                                    "retryable": True})
+                else:
+                    results.append({"idempotency_key": key, "order_id": self.server.create(key, order)})
+            self._send(200, {"results": results})
+        elif self.path.endswith("/orders"):
+            order_id = self.server.create(self.headers.get("Idempotency-Key"), body)
+            self._send(201, {"order_id": order_id})
+        else:
+            self._send(404, {"error": "not found"})
+
+
+def start_stub_crm(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                   failure_rate: float = 0.0) -> StubCRMServer:
+    """Start the stub CRM in a background thread; port 0 picks a free port."""
+    server = StubCRMServer((host, port), latency_ms=latency_ms, failure_rate=failure_rate)
+    threading.Thread(target=server.serve_forever, name="stub-crm", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub CRM API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubCRMServer((args.host, args.port), args.latency_ms, args.failure_rate)
+    print(f"Stub CRM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()